@@ -4,6 +4,10 @@ from src.agents.closer_agent import CloserAgent
 from src.agents.eater_agent import HitterAgent
 from src.agents.expectimax_agent import ExpectimaxAgent
 from src.agents.heuristics.heuristic import HeuristicEvaluator
+from src.agents.learning.small_network import load_student
+from src.agents.mcts_agent import MCTSAgent
+from src.agents.opening_book import OpeningBook, OpeningBookAgent
+from src.agents.agent import Agent
 from src.agents.td_agent import TDAgent
 from src.game.backgammon_cli import BackgammonCLI
 from src.game.core.colors import PlayerColor
@@ -18,7 +22,8 @@ from src.game.backgammon_gui import BackgammonGUI
 
 
 displays = ['gui', 'cli', 'none']
-players = ['human', 'random-agent', 'expectimax-agent', 'learning-agent', 'hitter-agent', 'closer-agent']
+players = ['human', 'random-agent', 'expectimax-agent', 'learning-agent', 'hitter-agent', 'closer-agent',
+           'mcts-agent', 'student-agent']
 
 
 def create_player(player_type: str, color: PlayerColor) -> Player:
@@ -31,13 +36,19 @@ def create_player(player_type: str, color: PlayerColor) -> Player:
     elif player_type == 'closer-agent':
         return CloserAgent(color)
     elif player_type == 'expectimax-agent':
+        heuristic = HeuristicEvaluator(color)
         return ExpectimaxAgent(color,
-                               heuristic_function=HeuristicEvaluator(color).evaluate,
+                               heuristic_function=heuristic.evaluate,
                                max_depth=1,
                                dice_sample_size=10,
+                               batch_heuristic_function=heuristic.evaluate_batch,
                                )
+    elif player_type == 'mcts-agent':
+        return MCTSAgent(color, n_playouts=100)
     elif player_type == 'learning-agent':
         return TDAgent(color)
+    elif player_type == 'student-agent':
+        return TDAgent(color, network=load_student())
     else:
         raise Exception(f"Invalid player type {player_type}, see usage.")
 
@@ -48,6 +59,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('--white', help='The white player.', choices=players, default=players[0], type=str)
     parser.add_argument('--black', help='The black player.', choices=players, default=players[1], type=str)
     parser.add_argument('--num_of_games', help='The number of games to run.', default=1, type=int)
+    parser.add_argument('--opening_book', help='An opening book file (see opening_book.py) for the agents.',
+                        default=None, type=str)
     return parser.parse_args()
 
 
@@ -55,6 +68,10 @@ if __name__ == '__main__':
     args = parse_args()
     white_player = create_player(args.white, PlayerColor.WHITE)
     black_player = create_player(args.black, PlayerColor.BLACK)
+    if args.opening_book is not None:
+        book = OpeningBook.load(args.opening_book)
+        white_player, black_player = [OpeningBookAgent(player, book) if isinstance(player, Agent) else player
+                                      for player in (white_player, black_player)]
 
     if args.display == 'gui':
         assert args.num_of_games == 1, "The GUI runs a single game only."
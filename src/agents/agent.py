@@ -1,6 +1,6 @@
 
 from abc import ABC, abstractmethod
-from typing import Set
+from typing import Set, List, Sequence
 
 import numpy as np
 
@@ -31,6 +31,10 @@ class Agent(Player, ABC):
     def evaluation_function(self, state: GameState):
         pass
 
+    def batch_evaluation_function(self, states: List[GameState]) -> Sequence[float]:
+        """ Evaluate several states at once, agents with a vectorized evaluator should override it."""
+        return [self.evaluation_function(state) for state in states]
+
     def get_policy(self, agent_nickname) -> Policy:
         return Policy(self.choose_play, agent_nickname)
 
@@ -1,37 +1,146 @@
 import random
-from copy import deepcopy
-from typing import Set, Callable
+from copy import copy
+from typing import Set, Callable, List, Sequence, Tuple
 
 from src.agents.agent import Agent
+from src.agents.heuristics.phases import PhaseEvaluator
+from src.agents.search.chance_sampling import StratifiedRollSampler
+from src.agents.search.transposition_table import SharedTranspositionTable
 from src.game.core.board import Board
 from src.game.core.colors import PlayerColor
 from src.game.core.dice import Dice
 from src.game.core.game_state import GameState
+from src.game.core.position import Position
 
 
 class ExpectimaxAgent(Agent):
     def __init__(self, color: PlayerColor,
                  heuristic_function: Callable[[Board], float],
                  max_depth=1,
-                 dice_sample_size=36
+                 dice_sample_size=36,
+                 transposition_table: SharedTranspositionTable = None,
+                 sampling_depth=1,
+                 standard_error_threshold: float = None,
+                 seed=None,
+                 batch_heuristic_function: Callable[[List[Board]], Sequence[float]] = None,
+                 evaluator: PhaseEvaluator = None,
                  ):
+        """
+        :param dice_sample_size: the number of rolls searched in a sampled chance node, chance nodes search all the
+                                 21 distinct rolls when it is 21 or more (and no standard error threshold is given).
+        :param sampling_depth: chance nodes from this depth on are sampled, shallower ones search every roll.
+        :param standard_error_threshold: if given, sampled chance nodes keep drawing rolls until the standard error of
+                                         their value drops below it.
+        :param batch_heuristic_function: if given, the leaves below every chance node are collected and evaluated
+                                         with a single call to it (e.g. HeuristicEvaluator.evaluate_batch).
+        :param evaluator: if given, evaluates the leaves (with their side to move) from this agent's point of view
+                          instead of the heuristic functions, in batches as with batch_heuristic_function.
+        """
         super().__init__(color)
         self.max_depth = max_depth
         self.dice_sample_size = dice_sample_size
         self.heuristic_function = heuristic_function
+        self.batch_heuristic_function = batch_heuristic_function
+        self.evaluator = evaluator
+        self.transposition_table = transposition_table
+        self.sampling_depth = sampling_depth
+        self.roll_sampler = StratifiedRollSampler(dice_sample_size, standard_error_threshold, seed)
+        self.nodes_searched = 0
 
     def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        if self._evaluates_in_batches() and self.max_depth == 1:
+            states = list(reachable_states)
+            self.nodes_searched += len(states)
+            values = self.batch_evaluation_function(states)
+            return states[max(range(len(states)), key=lambda i: values[i])]
         return max((state for state in reachable_states), key=lambda state: self._expectimax_value(state, self.color, depth=1))
 
     def _expectimax_value(self, state: GameState, player: PlayerColor, depth) -> float:
+        self.nodes_searched += 1
+        if depth == self.max_depth or state.is_game_ended():
+            # every roll leads to the same leaf evaluation
+            return self.evaluation_function(state)
+
+        key, sampled = None, self._is_sampled_chance_node(depth)
+        if self.transposition_table is not None:
+            key, sign = self._table_key(state, player)
+            # a sampled node accepts an estimate, an exact node only exact values
+            stored_value = self.transposition_table.probe(key, self.max_depth - depth, exact=not sampled)
+            if stored_value is not None:
+                return sign * stored_value
+
+        if sampled:
+            expected_value, _, _ = self.roll_sampler.estimate(lambda dice: self._roll_value(state, dice, player, depth))
+        elif self._are_children_leaves(depth):
+            expected_value = self._batched_chance_value(state, Dice.get_possible_rolls_with_probabilities(), player, depth)
+        else:
+            expected_value = 0
+            for dice, probability in Dice.get_possible_rolls_with_probabilities():
+                expected_value += probability * self._roll_value(state, dice, player, depth)
+
+        if key is not None:
+            self.transposition_table.store(key, self.max_depth - depth, sign * expected_value, exact=not sampled)
+        return expected_value
+
+    def _table_key(self, state: GameState, player: PlayerColor) -> Tuple[int, float]:
+        """
+        The transposition table key of a chance node, and the sign between its value for [player] and the stored one.
+        The evaluator's values for the two colors are opposite, so the table holds black's values of the canonical
+        positions (black to move) and a position shares its entry with its mirrored twin. The heuristics' values are
+        not, so their entries are kept per perspective (and only shared with a search for the other color).
+        """
+        position = Position.from_board(state.board)
+        if self.evaluator is not None:
+            return Position.canonical_key(position, state.turn_color), \
+                player.win_factor() * state.turn_color.win_factor()
+        return Position.canonical_key(position, state.turn_color, perspective=player), 1.0
+
+    def _roll_value(self, state: GameState, dice: List[int], player: PlayerColor, depth) -> float:
+        if self._are_children_leaves(depth):
+            return self._batched_chance_value(state, [(dice, 1.0)], player, depth)
+        new_state = copy(state)
+        new_state.dice.roll(dice)
+        value = self._max_value(new_state, depth) if state.turn_color == player else self._min_value(new_state, depth)
+        return float(value)
+
+    def _are_children_leaves(self, depth) -> bool:
+        return self._evaluates_in_batches() and depth + 1 == self.max_depth
+
+    def _evaluates_in_batches(self) -> bool:
+        return self.batch_heuristic_function is not None or self.evaluator is not None
+
+    def _batched_chance_value(self, state: GameState, rolls, player: PlayerColor, depth) -> float:
+        """
+        The value of a chance node whose grandchildren are leaves: the leaves of every roll are collected into one
+        batch, evaluated together and folded back (max / min per roll, weighted sum over the rolls) in the same order
+        as the scalar search.
+        """
+        leaves, slices, is_max_node = [], [], state.turn_color == player
+        for dice, _ in rolls:
+            new_state = copy(state)
+            new_state.dice.roll(dice)
+            start = len(leaves)
+            if new_state.is_game_ended():
+                leaves.append(new_state)
+            else:
+                children = list(new_state.reachable_states)
+                self.nodes_searched += len(children)
+                leaves.extend(children)
+            slices.append((start, len(leaves)))
+
+        values = self.batch_evaluation_function(leaves)
         expected_value = 0
-        for dice, factor in [(Dice.get_possible_rolls_excluding_doubles(), 2), (Dice.get_possible_doubles(), 1)]:
-            new_state = deepcopy(state)
-            new_state.dice = Dice(dice)
-            value = self._max_value(new_state, depth) if state.turn_color == player else self._min_value(new_state, depth)
-            expected_value += factor * float(value)/Dice.TOTAL_COMBINATIONS
+        for (_, probability), (start, end) in zip(rolls, slices):
+            roll_values = values[start:end]
+            expected_value += probability * float(max(roll_values) if is_max_node else min(roll_values))
         return expected_value
 
+    def _is_sampled_chance_node(self, depth) -> bool:
+        if depth < self.sampling_depth:
+            return False
+        n_rolls = len(Dice.get_possible_rolls_with_probabilities())
+        return self.dice_sample_size < n_rolls or self.roll_sampler.standard_error_threshold is not None
+
     def _min_value(self, state: GameState, current_depth) -> float:
         if current_depth == self.max_depth or state.is_game_ended():
             return self.evaluation_function(state)
@@ -45,7 +154,16 @@ class ExpectimaxAgent(Agent):
             return max((self._expectimax_value(state, self.color, current_depth + 1) for state in state.reachable_states))
 
     def evaluation_function(self, state: GameState) -> float:
+        if self.evaluator is not None:
+            return self.evaluator.evaluate_state(state) * self.color.win_factor()
         return self.heuristic_function(state.board)
 
+    def batch_evaluation_function(self, states: List[GameState]) -> Sequence[float]:
+        if self.evaluator is not None:
+            return self.evaluator.evaluate_states(states) * self.color.win_factor()
+        if self.batch_heuristic_function is None:
+            return super().batch_evaluation_function(states)
+        return self.batch_heuristic_function([state.board for state in states])
+
     def nickname(self) -> str:
         return "ExpectimaxAgent"
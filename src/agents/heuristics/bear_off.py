@@ -0,0 +1,156 @@
+"""
+A one-sided bear-off database.
+
+For every distribution of up to 15 checkers on the six home points, the table stores the probability distribution of
+the number of rolls needed to bear them all off, when every roll is played to minimize the expected number of rolls.
+Two one-sided distributions give the exact winning chances of a bear-off race (without gammons).
+
+The table has 54264 positions and takes about half a minute to build, it is saved to BEAR_OFF_TABLE_FILE by running this
+module.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.game.core.colors import PlayerColor
+
+BEAR_OFF_TABLE_FILE = 'src/agents/heuristics/bear_off_table.npz'
+MAX_ROLLS = 32  # the distributions are truncated after this number of rolls (the worst case needs fewer)
+
+Home = Tuple[int, ...]  # the checkers count at distance 1..6 from the goal
+
+
+def _single_die_plays(home: Home, die: int) -> List[Home]:
+    """ The homes reachable by playing one die (there is always a legal move unless every checker is off)."""
+    if not any(home):
+        return [home]
+    highest = max(distance for distance in range(1, 7) if home[distance - 1])
+    plays = []
+    for distance in range(1, 7):
+        if not home[distance - 1]:
+            continue
+        if distance > die or distance == die or distance == highest:
+            new_home = list(home)
+            new_home[distance - 1] -= 1
+            if distance > die:
+                new_home[distance - die - 1] += 1
+            plays.append(tuple(new_home))
+    return plays
+
+
+class BearOffTable:
+    """ Lookups of the one-sided bear-off distributions of stacked positions."""
+
+    def __init__(self, keys: np.ndarray, distributions: np.ndarray) -> None:
+        """
+        :param keys: (P,) the sorted keys (see home_keys) of the positions in the table.
+        :param distributions: (P, MAX_ROLLS) the probability of bearing off in exactly n rolls.
+        """
+        self.keys = keys
+        self.distributions = distributions
+        self.max_checkers = int(np.sum(self.homes_of(keys[-1:])))
+        self.__survival = np.cumsum(distributions[:, ::-1], axis=1)[:, ::-1]  # P(n rolls or more)
+
+    @staticmethod
+    def homes_of(keys: np.ndarray) -> np.ndarray:
+        return (keys[:, None] >> (4 * np.arange(6))) & 15
+
+    @staticmethod
+    def home_keys(homes: np.ndarray) -> np.ndarray:
+        """ The key of (N, 6) homes (checkers count at distance 1..6)."""
+        return (np.asarray(homes, dtype=np.int64) << (4 * np.arange(6))).sum(axis=1)
+
+    @staticmethod
+    def homes(positions: np.ndarray, color: PlayerColor) -> np.ndarray:
+        """ The (N, 6) homes of [color] in compact positions, only meaningful if all its checkers are home or off."""
+        if color == PlayerColor.WHITE:
+            return np.maximum(-positions[:, 1:7], 0)
+        return np.maximum(positions[:, 24:18:-1], 0)
+
+    @staticmethod
+    def build(max_checkers=15) -> BearOffTable:
+        """ Solve every home of up to [max_checkers] checkers, in increasing pip count order."""
+        homes = sorted((home for home in itertools.product(range(max_checkers + 1), repeat=6)
+                        if sum(home) <= max_checkers), key=lambda home: sum(d * c for d, c in zip(range(1, 7), home)))
+        index: Dict[Home, int] = {home: i for i, home in enumerate(homes)}
+        expected = np.zeros(len(homes))
+        distributions = np.zeros((len(homes), MAX_ROLLS))
+        distributions[0, 0] = 1.0  # homes[0] has every checker off
+        # best[k][die][i]: the index of the best home reachable from home i with k moves of [die]
+        best = [[np.arange(len(homes))] + [np.zeros(len(homes), dtype=np.int64) for _ in range(4)] for _ in range(7)]
+        rolls = [((a, b), (1 if a == b else 2) / 36) for a in range(1, 7) for b in range(a, 7)]
+
+        def best_of(candidates: List[int]) -> int:
+            return min(candidates, key=lambda candidate: expected[candidate])
+
+        for i, home in enumerate(homes):
+            if i:
+                roll_distribution = np.zeros(MAX_ROLLS)
+                for (a, b), probability in rolls:
+                    if a == b:
+                        final = best_of([best[a][3][index[play]] for play in _single_die_plays(home, a)])
+                    else:
+                        final = best_of([best[b][1][index[play]] for play in _single_die_plays(home, a)] +
+                                        [best[a][1][index[play]] for play in _single_die_plays(home, b)])
+                    expected[i] += probability * expected[final]
+                    roll_distribution[1:] += probability * distributions[final, :-1]
+                expected[i] += 1
+                distributions[i] = roll_distribution
+            # every home reachable from this one has a lower pip count, so it is already solved
+            for die in range(1, 7):
+                plays = [index[play] for play in _single_die_plays(home, die)]
+                for moves in range(1, 5):
+                    best[die][moves][i] = best_of([best[die][moves - 1][play] for play in plays])
+
+        keys = BearOffTable.home_keys(np.array(homes))
+        order = np.argsort(keys)
+        return BearOffTable(keys[order], distributions[order].astype(np.float32))
+
+    def save(self, path=BEAR_OFF_TABLE_FILE) -> None:
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez_compressed(file, keys=self.keys, distributions=self.distributions)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path=BEAR_OFF_TABLE_FILE) -> BearOffTable:
+        with np.load(path) as data:
+            return BearOffTable(data["keys"], data["distributions"])
+
+    @staticmethod
+    def load_if_exists(path=BEAR_OFF_TABLE_FILE) -> BearOffTable | None:
+        return BearOffTable.load(path) if os.path.exists(path) else None
+
+    def contains(self, homes: np.ndarray) -> np.ndarray:
+        return np.asarray(homes).sum(axis=1) <= self.max_checkers
+
+    def expected_rolls(self, homes: np.ndarray) -> np.ndarray:
+        return self.distributions[self._indices(homes)] @ np.arange(MAX_ROLLS)
+
+    def win_probability(self, mover_homes: np.ndarray, opponent_homes: np.ndarray) -> np.ndarray:
+        """ The probability that the player on roll bears off first (it wins ties, as it finishes first)."""
+        mover = self.distributions[self._indices(mover_homes)]
+        opponent_survival = self.__survival[self._indices(opponent_homes)]
+        return np.clip((mover * opponent_survival).sum(axis=1), 0.0, 1.0)
+
+    def _indices(self, homes: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.keys, self.home_keys(homes))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the one-sided bear-off table.")
+    parser.add_argument('--max_checkers', default=15, type=int)
+    parser.add_argument('--output', default=BEAR_OFF_TABLE_FILE, type=str)
+    args = parser.parse_args()
+    start_time = time.time()
+    table = BearOffTable.build(args.max_checkers)
+    table.save(args.output)
+    print(f"{len(table.keys)} positions in {time.time() - start_time:.1f} seconds, saved to {args.output}")
+    initial = np.array([[0, 0, 0, 0, 0, 15]])
+    print(f"expected rolls to bear off 15 checkers from the 6 point: {table.expected_rolls(initial)[0]:.3f}")
@@ -1,7 +1,14 @@
 import sys
+from typing import List
 
+import numpy as np
+
+from src.agents.heuristics.shots import shots_on, shots_on_arrays
 from src.game.core.board import Board
 from src.game.core.colors import PlayerColor
+from src.game.core.dice import Dice
+from src.game.core.point import Point
+from src.game.core.position import Position
 
 
 class HeuristicEvaluator:
@@ -14,30 +21,76 @@ class HeuristicEvaluator:
     * Prime - Several consecutive blocks
     * Anchor - A block in the opponent's home board.
     """
+    # the weights of vulnerability, risk, hitting, blocking, running, bear in, bear off and terminal state scores
+    WEIGHTS = [0.4, 0.4, 0.4, 0.4, 0.2, 0.2, 0.2, 1]
 
     def __init__(self, color: PlayerColor):
         self.color = color
         self.opponent = color.opposite()
-        self.quadrants = None
+        # vectorized evaluation constants, indexed by the points 1..24
+        board_indices = np.arange(1, 25)
+        quadrant = (board_indices - 1) // 6 if color == PlayerColor.WHITE else 3 - (board_indices - 1) // 6
+        self._quadrant_weights = (4 - quadrant).astype(float)
+        self._home_board = quadrant == 0
+        self._distances_to_goal = board_indices if color == PlayerColor.WHITE else 25 - board_indices
 
     def evaluate(self, board: Board) -> float:
-        self._fill_quadrants(board)
-
-        return sum(feature * weight for feature, weight in [
-            (self._vulnerability_score(board), 0.4),
-            (self._hitting_score(board), 0.4),
-            (self._blocking_score(board), 0.4),
-            (self._running_score(board), 0.2),
-            (self._bear_in_score(board), 0.2),
-            (self._bear_off_score(board), 0.2),
-            (self._terminal_state_score(board), 1),
-        ])
-
-    def _vulnerability_score(self, board: Board) -> float:
+        quadrants = self._get_quadrants(board)
+
+        return sum(feature * weight for feature, weight in zip([
+            self._vulnerability_score(board, quadrants),
+            self._risk_score(board),
+            self._hitting_score(board),
+            self._blocking_score(board, quadrants),
+            self._running_score(board),
+            self._bear_in_score(board, quadrants),
+            self._bear_off_score(board),
+            self._terminal_state_score(board),
+        ], self.WEIGHTS))
+
+    def evaluate_batch(self, boards: List[Board]) -> np.ndarray:
+        """ Evaluate several boards with a single call, returns an array of their scores."""
+        positions = np.stack([Position.from_board(board) for board in boards])
+        return self.evaluate_arrays(positions[:, :Position.N_POINTS], positions[:, Position.N_POINTS:])
+
+    def evaluate_arrays(self, points: np.ndarray, bars: np.ndarray) -> np.ndarray:
+        """
+        A vectorized evaluate over stacked boards, with the same semantics as evaluate().
+        :param points: (N, 26) signed checkers count of the points 0..25, positive for black and negative for white.
+        :param bars: (N, 2) checkers count on the bar, white then black.
+        :return: (N,) scores.
+        """
+        own = np.maximum(np.asarray(points, dtype=np.int16) * self.color.value, 0)
+        opponent = np.maximum(np.asarray(points, dtype=np.int16) * self.opponent.value, 0)
+        bars = np.asarray(bars)
+        own_points, own_goal = own[:, 1:25], own[:, Board.goal_point_idx(self.color)]
+        opponent_goal = opponent[:, Board.goal_point_idx(self.opponent)]
+
+        vulnerability = 1 - self._normalize((own_points == 1) @ self._quadrant_weights, 0, 15)
+        risk = 1 - self._normalize(shots_on_arrays(points, bars, self.color), 0, Dice.TOTAL_COMBINATIONS)
+        hitting = self._normalize(bars[:, 0 if self.opponent == PlayerColor.WHITE else 1], 0, 15)
+        blocking = self._normalize((own_points > 1) @ self._quadrant_weights, 0, 27)
+        furthest_distance = np.where(own_points > 0, self._distances_to_goal, 0).max(axis=1)
+        running = np.where(furthest_distance > 0, 1 - self._normalize(furthest_distance, 0, 24), 1)
+        bear_in = self._normalize(((own_points > 0) & self._home_board).sum(axis=1) + (own_goal > 0), 0, 15)
+        bear_off = self._normalize(own_goal, 0, 15)
+        terminal_state = np.where(own_goal == 15, np.inf, np.where(opponent_goal == 15, -np.inf, 0))
+
+        scores = np.zeros(len(own))
+        for feature, weight in zip([vulnerability, risk, hitting, blocking, running, bear_in, bear_off, terminal_state],
+                                   self.WEIGHTS):
+            scores = scores + feature * weight
+        return scores
+
+    def _vulnerability_score(self, board: Board, quadrants: List[List[Point]]) -> float:
         """ Minimize the amount of blots, based on quadrants."""
-        score = sum([self._count_blots(self.quadrants[i]) * (4-i) for i in range(0, 4)])
+        score = sum([self._count_blots(quadrants[i]) * (4-i) for i in range(0, 4)])
         return 1 - self._normalize(score, 0, 15)
 
+    def _risk_score(self, board: Board) -> float:
+        """ Minimize the amount of rolls that hit one of our blots."""
+        return 1 - self._normalize(shots_on(board, self.color), 0, Dice.TOTAL_COMBINATIONS)
+
     def _terminal_state_score(self, board: Board) -> float:
         """ Evaluates a terminal state """
         if board.goal_point(self.color).count == 15:
@@ -61,14 +114,14 @@ class HeuristicEvaluator:
         score = board.bar.count(self.opponent)
         return self._normalize(score, 0, 15)
 
-    def _blocking_score(self, board: Board) -> float:
+    def _blocking_score(self, board: Board, quadrants: List[List[Point]]) -> float:
         """ Maximize the amount of blocks, based on quadrants (consider anchors). """
-        score = sum([self._count_blocks(self.quadrants[i]) * (4-i) for i in range(0, 4)])  # TODO: consider anchors
+        score = sum([self._count_blocks(quadrants[i]) * (4-i) for i in range(0, 4)])  # TODO: consider anchors
         return self._normalize(score, 0, 27)
 
-    def _bear_in_score(self, board: Board):
+    def _bear_in_score(self, board: Board, quadrants: List[List[Point]]):
         """ Maximize the amount of checkers inside home board"""
-        score = sum([1 for point in self.quadrants[0] + [board.goal_point(self.color)] if point.player_color == self.color])
+        score = sum([1 for point in quadrants[0] + [board.goal_point(self.color)] if point.player_color == self.color])
         return self._normalize(score, 0, 15)
 
     def _bear_off_score(self, board: Board):
@@ -76,15 +129,17 @@ class HeuristicEvaluator:
         score = board.goal_point(self.color).count
         return self._normalize(score, 0, 15)
 
-    def _fill_quadrants(self, board: Board):
-        self.quadrants = [
+    def _get_quadrants(self, board: Board) -> List[List[Point]]:
+        """ The board quadrants, ordered from the home board of the evaluated color."""
+        quadrants = [
             board.points[1:6+1],
             board.points[7:12+1],
             board.points[13:18+1],
             board.points[19:24+1],
         ]
         if self.color == PlayerColor.BLACK:
-            self.quadrants.reverse()
+            quadrants.reverse()
+        return quadrants
 
     def _count_blocks(self, points):
         return sum([1 for point in points if point.player_color == self.color and point.count > 1])
@@ -103,4 +158,3 @@ class HeuristicEvaluator:
         :return: A number between 0 and 1.
         """
         return (x - x_min) / (x_max - x_min)
-
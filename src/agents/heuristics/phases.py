@@ -0,0 +1,173 @@
+"""
+An evaluator dispatcher by game phase.
+
+Positions are classified with cheap board features:
+* contact - a checker can still hit or be hit (some checker is behind an opponent's checker, or on the bar).
+* race - the checkers have passed each other.
+* bear-off - a race where both players have all their checkers home (or off).
+* game over - one player has borne off all its checkers.
+Only contact positions go to the full evaluator (e.g. the network). Races are scored by a race evaluator or a pip count
+formula, bear-offs by the exact one-sided bear-off table when it is available, and finished games by their result.
+
+Every evaluator scores stacked compact positions (see Position) with the side to move, on the network's scale: the
+expected result of the game from black's point of view. Gammons are ignored outside of the contact phase.
+"""
+from __future__ import annotations
+
+import math
+import time
+from enum import Enum
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from src.agents.heuristics.bear_off import BearOffTable
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+from src.game.core.utils import GameUtils
+
+# (positions (N, 28), the PlayerColor value of the player to move (N,)) -> (N,) scores from black's point of view
+PositionsEvaluator = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+# the mean and variance of the pips of a roll
+ROLL_PIPS_MEAN = 49 / 6
+ROLL_PIPS_VARIANCE = 3066 / 36 - ROLL_PIPS_MEAN ** 2
+
+
+class Phase(Enum):
+    CONTACT = 0
+    RACE = 1
+    BEAR_OFF = 2
+    GAME_OVER = 3
+
+
+def classify(positions: np.ndarray) -> np.ndarray:
+    """ The Phase value of every compact position."""
+    points = np.asarray(positions[:, 1:25], dtype=np.int16)
+    board_indices = np.arange(1, 25)
+    # black moves up and white down, so they have passed each other when black's last checker is above white's first
+    lowest_black = np.where(points > 0, board_indices, 25).min(axis=1)
+    highest_white = np.where(points < 0, board_indices, 0).max(axis=1)
+    on_bar = (positions[:, Position.WHITE_BAR_INDEX] > 0) | (positions[:, Position.BLACK_BAR_INDEX] > 0)
+    contact = on_bar | (lowest_black < highest_white)
+    bear_off = ~contact & (lowest_black >= 19) & (highest_white <= 6)
+    game_over = (positions[:, 0] == -15) | (positions[:, 25] == 15)
+    phases = np.where(contact, Phase.CONTACT.value, np.where(bear_off, Phase.BEAR_OFF.value, Phase.RACE.value))
+    return np.where(game_over, Phase.GAME_OVER.value, phases)
+
+
+def pip_counts(positions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ The (black, white) pip counts: the pips every player must move to bear off all its checkers."""
+    points = np.asarray(positions[:, 1:25], dtype=np.int32)
+    board_indices = np.arange(1, 25)
+    black = np.maximum(points, 0) @ (25 - board_indices) + 25 * positions[:, Position.BLACK_BAR_INDEX].astype(np.int32)
+    white = np.maximum(-points, 0) @ board_indices + 25 * positions[:, Position.WHITE_BAR_INDEX].astype(np.int32)
+    return black, white
+
+
+def race_win_probability(mover_pips: np.ndarray, opponent_pips: np.ndarray) -> np.ndarray:
+    """
+    The normal approximation of the chances of the player on roll in a race: the number of rolls a player needs is
+    about pips / mean with a variance of pips * variance / mean^3, and the player on roll wins the ties.
+    """
+    mover_pips, opponent_pips = np.asarray(mover_pips, dtype=float), np.asarray(opponent_pips, dtype=float)
+    rolls_lead = (opponent_pips - mover_pips) / ROLL_PIPS_MEAN + 0.5
+    deviation = np.sqrt(np.maximum(mover_pips + opponent_pips, 1) * ROLL_PIPS_VARIANCE / ROLL_PIPS_MEAN ** 3)
+    return np.array([0.5 * (1 + math.erf(z / math.sqrt(2))) for z in rolls_lead / deviation])
+
+
+def pip_count_evaluator(positions: np.ndarray, turns: np.ndarray) -> np.ndarray:
+    """ A race evaluator: the expected result of race_win_probability (a single game is won or lost)."""
+    black, white = pip_counts(positions)
+    black_on_roll = turns == PlayerColor.BLACK.value
+    probability = race_win_probability(np.where(black_on_roll, black, white), np.where(black_on_roll, white, black))
+    black_probability = np.where(black_on_roll, probability, 1 - probability)
+    return 2 * black_probability - 1
+
+
+def network_evaluator(network) -> PositionsEvaluator:
+    """ A PositionsEvaluator of a QNetwork."""
+    def evaluate(positions: np.ndarray, turns: np.ndarray) -> np.ndarray:
+        return network.model(GameUtils.extract_features_batch(positions, turns)).numpy().reshape(-1)
+    return evaluate
+
+
+def game_over_evaluator(positions: np.ndarray, _) -> np.ndarray:
+    """ The result of finished games, a gammon when the loser has not borne off any checker."""
+    white_won = positions[:, 0] == -15
+    loser_borne_off = np.where(white_won, positions[:, 25], -positions[:, 0])
+    return np.where(white_won, -1, 1) * np.where(loser_borne_off == 0, 2, 1)
+
+
+class PhaseEvaluator:
+    """ Routes every position to the evaluator of its phase, and counts the positions and time of every phase."""
+
+    def __init__(self, contact_evaluator: PositionsEvaluator,
+                 race_evaluator: PositionsEvaluator = pip_count_evaluator,
+                 bear_off_table: BearOffTable = None,
+                 ):
+        """
+        :param contact_evaluator: the full evaluator, e.g. network_evaluator(q_network).
+        :param race_evaluator: scores races, and bear-offs out of the table (the pip count formula by default).
+        :param bear_off_table: exact bear-off chances (see BearOffTable.load_if_exists), races only if not given.
+        """
+        self.contact_evaluator = contact_evaluator
+        self.race_evaluator = race_evaluator
+        self.bear_off_table = bear_off_table
+        self.counts: Dict[Phase, int] = {phase: 0 for phase in Phase}
+        self.seconds: Dict[Phase, float] = {phase: 0.0 for phase in Phase}
+        self.calls: Dict[Phase, int] = {phase: 0 for phase in Phase}
+
+    def evaluate_positions(self, positions: np.ndarray, turns: np.ndarray) -> np.ndarray:
+        """
+        :param positions: (N, 28) compact positions.
+        :param turns: (N,) the PlayerColor value of the player to move in every position.
+        :return: (N,) the expected results from black's point of view.
+        """
+        positions, turns = np.asarray(positions), np.asarray(turns)
+        phases = classify(positions)
+        scores = np.zeros(len(positions))
+        if self.bear_off_table is not None:
+            in_table = self.bear_off_table.contains(BearOffTable.homes(positions, PlayerColor.WHITE)) & \
+                self.bear_off_table.contains(BearOffTable.homes(positions, PlayerColor.BLACK))
+            phases = np.where((phases == Phase.BEAR_OFF.value) & ~in_table, Phase.RACE.value, phases)
+        else:
+            phases = np.where(phases == Phase.BEAR_OFF.value, Phase.RACE.value, phases)
+        for phase, evaluator in ((Phase.CONTACT, self.contact_evaluator), (Phase.RACE, self.race_evaluator),
+                                 (Phase.BEAR_OFF, self._bear_off_evaluator), (Phase.GAME_OVER, game_over_evaluator)):
+            selected = phases == phase.value
+            if not selected.any():
+                continue
+            start_time = time.perf_counter()
+            scores[selected] = evaluator(positions[selected], turns[selected])
+            self.seconds[phase] += time.perf_counter() - start_time
+            self.counts[phase] += int(selected.sum())
+            self.calls[phase] += 1
+        return scores
+
+    def evaluate_states(self, states: List[GameState]) -> np.ndarray:
+        positions = np.stack([Position.from_board(state.board) for state in states])
+        return self.evaluate_positions(positions, np.array([state.turn_color.value for state in states]))
+
+    def evaluate_state(self, state: GameState) -> float:
+        return float(self.evaluate_states([state])[0])
+
+    def stats(self) -> Dict[str, dict]:
+        """ The positions, evaluator calls and microseconds per position of every phase."""
+        return {phase.name.lower(): {"positions": self.counts[phase], "calls": self.calls[phase],
+                                     "us_per_position": 1e6 * self.seconds[phase] / max(self.counts[phase], 1)}
+                for phase in Phase}
+
+    def reset_stats(self) -> None:
+        for phase in Phase:
+            self.counts[phase], self.seconds[phase], self.calls[phase] = 0, 0.0, 0
+
+    def _bear_off_evaluator(self, positions: np.ndarray, turns: np.ndarray) -> np.ndarray:
+        black_on_roll = turns == PlayerColor.BLACK.value
+        white_homes = BearOffTable.homes(positions, PlayerColor.WHITE)
+        black_homes = BearOffTable.homes(positions, PlayerColor.BLACK)
+        probability = self.bear_off_table.win_probability(np.where(black_on_roll[:, None], black_homes, white_homes),
+                                                          np.where(black_on_roll[:, None], white_homes, black_homes))
+        black_probability = np.where(black_on_roll, probability, 1 - probability)
+        return 2 * black_probability - 1
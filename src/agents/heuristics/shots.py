@@ -0,0 +1,212 @@
+"""
+Precomputed shot tables: how many of the 36 rolls hit a blot at a given distance from an opponent's checker.
+
+A combination shot (e.g. 6-5 hitting from 11 away) must touch down on an intermediate point, and it fails when that
+point is blocked by two or more of the blot owner's checkers. For every distance d the relevant intermediate points
+are listed in INTERMEDIATE_POINTS[d], and the rolls that hit for every blocking mask over them (bit j set when
+INTERMEDIATE_POINTS[d][j] is blocked) are stored as a 36-bit set of rolls, so several shooters and blots are combined
+with a bitwise or and counted once.
+
+While the opponent has checkers on the bar, they must enter before anything else moves, which uses up some of the
+dice. The tables are built for every budget of steps a shooter is left with (the entering checkers get one more step
+than the checkers on the board), and the rolls a board checker can still use are limited to those whose entering die
+finds an open point.
+"""
+import itertools
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.game.core.board import Board
+from src.game.core.colors import PlayerColor
+from src.game.core.dice import Dice
+
+MAX_DISTANCE = 24
+# the steps (of a non-double, of a double) a shooter can move, indexed by the opponent's checkers on the bar (capped at
+# 4). Every checker that enters uses up one die, the rest is left to the checkers on the board, and an entering checker
+# can go on with the steps left after all of them entered.
+_BOARD_BUDGETS = [(2, 4), (1, 3), (0, 2), (0, 1), (0, 0)]
+_BAR_BUDGETS = [(0, 0), (2, 4), (1, 3), (1, 2), (1, 1)]
+_BUDGETS = sorted(set(_BOARD_BUDGETS + _BAR_BUDGETS), reverse=True)
+_BOARD_TABLES = np.array([_BUDGETS.index(budget) for budget in _BOARD_BUDGETS])
+_BAR_TABLES = np.array([_BUDGETS.index(budget) for budget in _BAR_BUDGETS])
+
+
+def _roll_paths(budget: Tuple[int, int]) -> Dict[int, List[Tuple[int, List[Tuple[int, ...]]]]]:
+    """ distance -> [(roll index, alternative paths, each is the tuple of intermediate points it touches)]."""
+    max_steps, max_double_steps = budget
+    paths = defaultdict(list)
+    for roll_index, (die1, die2) in enumerate(itertools.product(range(1, 7), range(1, 7))):
+        if die1 != die2 and max_steps:
+            paths[die1].append((roll_index, [()]))
+            paths[die2].append((roll_index, [()]))
+            if max_steps == 2:
+                paths[die1 + die2].append((roll_index, [(die1,), (die2,)]))
+        elif die1 == die2:
+            for steps in range(1, max_double_steps + 1):
+                paths[die1 * steps].append((roll_index, [tuple(die1 * i for i in range(1, steps))]))
+    return paths
+
+
+def _build_tables() -> Tuple[Dict[int, List[int]], List[Dict[int, List[int]]]]:
+    full_paths = _roll_paths(_BUDGETS[0])
+    intermediate_points = {}
+    for distance in range(1, MAX_DISTANCE + 1):
+        intermediate_points[distance] = sorted({point for _, alternatives in full_paths[distance]
+                                                for path in alternatives for point in path})
+
+    # every budget shares the intermediate points of the full one, so a blocking mask indexes all of them
+    budget_hitting_rolls = []
+    for budget in _BUDGETS:
+        paths = _roll_paths(budget)
+        hitting_rolls = {}
+        for distance in range(1, MAX_DISTANCE + 1):
+            points = intermediate_points[distance]
+            hitting_rolls[distance] = []
+            for mask in range(2 ** len(points)):
+                blocked = {point for j, point in enumerate(points) if mask >> j & 1}
+                rolls = 0
+                for roll_index, alternatives in paths[distance]:
+                    if any(not blocked.intersection(path) for path in alternatives):
+                        rolls |= 1 << roll_index
+                hitting_rolls[distance].append(rolls)
+        budget_hitting_rolls.append(hitting_rolls)
+    return intermediate_points, budget_hitting_rolls
+
+
+def _build_entered_rolls() -> List[List[int]]:
+    """
+    [distance][entry mask] -> the rolls a checker on the board can still hit with from that distance after the
+    opponent entered, bit k - 1 of the entry mask is set when a checker can enter with a k: a non-double roll leaves the
+    die that did not enter, and a double needs its own entry point open.
+    """
+    entered_rolls = [[0] * 64 for _ in range(MAX_DISTANCE + 1)]
+    for distance in range(1, MAX_DISTANCE + 1):
+        for entry_mask in range(64):
+            for roll_index, (die1, die2) in enumerate(itertools.product(range(1, 7), range(1, 7))):
+                if die1 == die2:
+                    can_use = entry_mask >> (die1 - 1) & 1
+                else:
+                    can_use = (die1 == distance and entry_mask >> (die2 - 1) & 1) or \
+                              (die2 == distance and entry_mask >> (die1 - 1) & 1)
+                if can_use:
+                    entered_rolls[distance][entry_mask] |= 1 << roll_index
+    return entered_rolls
+
+
+INTERMEDIATE_POINTS, _BUDGET_HITTING_ROLLS = _build_tables()
+HITTING_ROLLS = _BUDGET_HITTING_ROLLS[0]
+_ENTERED_ROLLS = _build_entered_rolls()
+# the number of rolls (out of 36) that hit a blot at distance d when nothing blocks the way, index 0 is unused
+SHOTS_BY_DISTANCE = np.array([0] + [bin(HITTING_ROLLS[d][0]).count("1") for d in range(1, MAX_DISTANCE + 1)])
+HIT_PROBABILITY = SHOTS_BY_DISTANCE / Dice.TOTAL_COMBINATIONS
+
+# flat lookup arrays for the vectorized count, the tables of every budget are laid out one after the other
+_MAX_INTERMEDIATES = max(len(points) for points in INTERMEDIATE_POINTS.values())
+_PADDED_INTERMEDIATES = np.zeros((MAX_DISTANCE + 1, _MAX_INTERMEDIATES), dtype=np.intp)
+_TABLE_OFFSETS = np.zeros(MAX_DISTANCE + 1, dtype=np.intp)
+for _distance in range(1, MAX_DISTANCE + 1):
+    _PADDED_INTERMEDIATES[_distance, :len(INTERMEDIATE_POINTS[_distance])] = INTERMEDIATE_POINTS[_distance]
+    _TABLE_OFFSETS[_distance] = sum(len(HITTING_ROLLS[d]) for d in range(1, _distance))
+_TABLE_SIZE = sum(len(HITTING_ROLLS[d]) for d in range(1, MAX_DISTANCE + 1))
+_FLAT_HITTING_ROLLS = np.array([rolls for hitting_rolls in _BUDGET_HITTING_ROLLS
+                                for d in range(1, MAX_DISTANCE + 1) for rolls in hitting_rolls[d]], dtype=np.uint64)
+_FLAT_ENTERED_ROLLS = np.array(_ENTERED_ROLLS, dtype=np.uint64)
+_BIT_VALUES = 1 << np.arange(_MAX_INTERMEDIATES)
+_DIE_BITS = 1 << np.arange(6)
+
+
+def _blot_shooter_pairs(color: PlayerColor) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Every (blot point, shooter point, distance) an opponent's checker could hit from, the bar included."""
+    direction = Board.movement_direction(color.opposite())
+    bar_entry = Board.goal_point_idx(color)  # the opponent enters from the far end, where our checkers leave
+    blots, shooters, distances = [], [], []
+    for blot in range(1, 25):
+        for shooter in list(range(1, 25)) + [bar_entry]:
+            distance = (blot - shooter) * direction
+            if 1 <= distance <= MAX_DISTANCE:
+                blots.append(blot)
+                shooters.append(shooter)
+                distances.append(distance)
+    return np.array(blots), np.array(shooters), np.array(distances)
+
+
+_PAIRS = {color: _blot_shooter_pairs(color) for color in PlayerColor}
+
+
+def shots_on_arrays(points: np.ndarray, bars: np.ndarray, color: PlayerColor) -> np.ndarray:
+    """
+    A vectorized shots_on over stacked boards.
+    :param points: (N, 26) signed checkers count of the points, positive for black and negative for white.
+    :param bars: (N, 2) checkers count on the bar, white then black.
+    :param color: the color whose blots are counted.
+    :return: (N,) the number of rolls (out of 36) that hit at least one of the color's blots.
+    """
+    points = np.asarray(points, dtype=np.int16)
+    opponent = color.opposite()
+    own = np.maximum(points * color.value, 0)
+    opponent_checkers = np.maximum(points * opponent.value, 0)
+    opponent_bar = np.minimum(np.asarray(bars)[:, 0 if opponent == PlayerColor.WHITE else 1], 4)
+    bar_entry = Board.goal_point_idx(color)
+
+    blocked = own >= 2
+    blocked[:, [0, 25]] = False
+    shooters = opponent_checkers > 0
+    shooters[:, bar_entry] = opponent_bar > 0
+    entry_points = [Board.debar_landing_point(opponent, die) for die in range(1, 7)]
+    entry_masks = (~blocked[:, entry_points]) @ _DIE_BITS
+
+    pair_blots, pair_shooters, pair_distances = _PAIRS[color]
+    active = (own[:, pair_blots] == 1) & shooters[:, pair_shooters]
+    boards, pairs = np.nonzero(active)
+    shooter_points, distances = pair_shooters[pairs], pair_distances[pairs]
+    direction = Board.movement_direction(opponent)
+    # padded intermediates are 0, they map to the shooter's own point which is never blocked
+    touched_points = shooter_points[:, None] + direction * _PADDED_INTERMEDIATES[distances]
+    masks = (blocked[boards[:, None], touched_points] * _BIT_VALUES).sum(axis=1)
+    from_bar, board_bar = shooter_points == bar_entry, opponent_bar[boards]
+    tables = np.where(from_bar, _BAR_TABLES[board_bar], _BOARD_TABLES[board_bar])
+    rolls = _FLAT_HITTING_ROLLS[tables * _TABLE_SIZE + _TABLE_OFFSETS[distances] + masks]
+    # a checker on the board only moves with the dice the entering checkers left it
+    entered = ~from_bar & (board_bar > 0)
+    rolls[entered] &= _FLAT_ENTERED_ROLLS[distances[entered], entry_masks[boards[entered]]]
+
+    hitting_rolls = np.zeros(len(points), dtype=np.uint64)
+    np.bitwise_or.at(hitting_rolls, boards, rolls)
+    return np.unpackbits(hitting_rolls.view(np.uint8).reshape(len(points), 8), axis=1).sum(axis=1)
+
+
+def shots_on(board: Board, color: PlayerColor) -> int:
+    """ The number of rolls (out of 36) with which the opponent hits at least one of the color's blots."""
+    blots = [point.index for point in board.points[1:25] if point.player_color == color and point.count == 1]
+    if not blots:
+        return 0
+    opponent = color.opposite()
+    direction = Board.movement_direction(opponent)
+    blocked = [point.player_color == color and point.count > 1 for point in board.points]
+    blocked[0] = blocked[25] = False
+    opponent_bar = min(board.bar.count(opponent), 4)
+    bar_entry = Board.goal_point_idx(color)
+    shooters = list(board.points_locations[opponent]) + ([bar_entry] if opponent_bar else [])
+    entry_mask = sum(1 << (die - 1) for die in range(1, 7)
+                     if not blocked[Board.debar_landing_point(opponent, die)])
+
+    rolls = 0
+    for blot in blots:
+        for shooter in shooters:
+            distance = (blot - shooter) * direction
+            if 1 <= distance <= MAX_DISTANCE:
+                mask = 0
+                for j, point in enumerate(INTERMEDIATE_POINTS[distance]):
+                    if blocked[shooter + direction * point]:
+                        mask |= 1 << j
+                if shooter == bar_entry:
+                    rolls |= _BUDGET_HITTING_ROLLS[_BAR_TABLES[opponent_bar]][distance][mask]
+                elif opponent_bar:
+                    # a checker on the board only moves with the dice the entering checkers left it
+                    rolls |= _BUDGET_HITTING_ROLLS[_BOARD_TABLES[opponent_bar]][distance][mask] & \
+                        _ENTERED_ROLLS[distance][entry_mask]
+                else:
+                    rolls |= HITTING_ROLLS[distance][mask]
+    return bin(rolls).count("1")
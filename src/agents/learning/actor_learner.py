@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import argparse
+import math
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, List, Set, Union
+
+import numpy as np
+
+from src.agents.learning.checkpointing import AsyncCheckpointer
+from src.agents.learning.policy import Policy
+from src.agents.learning.q_network import QNetwork
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+from src.game.core.utils import GameUtils
+
+
+class Trajectory:
+    """ A self-play game as sent from an actor to the learner."""
+
+    def __init__(self, actor_id: int, weights_version: int, positions: np.ndarray, turns: np.ndarray,
+                 winner: PlayerColor, reward: float, play_time: float) -> None:
+        """
+        :param positions: (T, 28) int8 compact positions after every play.
+        :param turns: (T,) int8 the PlayerColor value of the player to move after every play.
+        :param reward: the game result from black's point of view.
+        """
+        self.actor_id = actor_id
+        self.weights_version = weights_version
+        self.positions = positions
+        self.turns = turns
+        self.winner = winner
+        self.reward = reward
+        self.play_time = play_time
+
+
+class SharedWeights:
+    """ A snapshot of the network weights in shared memory, published by the learner and read by the actors."""
+
+    def __init__(self, shapes: List[tuple], lock=None, version=None, name: str = None) -> None:
+        """
+        :param shapes: the shapes of the network's weights (model.get_weights()).
+        :param name: attach to the snapshot of this name, or create a new one if not given.
+        """
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.__sizes = [math.prod(shape) for shape in self.shapes]
+        self.__memory = SharedMemory(name=name, create=name is None, size=4 * max(1, sum(self.__sizes)))
+        self.__buffer = np.ndarray((sum(self.__sizes),), dtype=np.float32, buffer=self.__memory.buf)
+        self.lock = lock if lock is not None else mp.Lock()
+        self.version = version if version is not None else mp.Value('i', 0, lock=False)
+
+    def __reduce__(self):
+        return SharedWeights, (self.shapes, self.lock, self.version, self.__memory.name)
+
+    def publish(self, weights: List[np.ndarray]) -> int:
+        """ Copy new weights into the snapshot, returns the new version."""
+        with self.lock:
+            self.__buffer[:] = np.concatenate([np.asarray(w, dtype=np.float32).reshape(-1) for w in weights])
+            self.version.value += 1
+            return self.version.value
+
+    def read_if_newer(self, version: int) -> tuple[Union[List[np.ndarray], None], int]:
+        """ The weights and their version if they are newer than [version], otherwise (None, version)."""
+        with self.lock:
+            if self.version.value == version:
+                return None, version
+            flat, version = self.__buffer.copy(), self.version.value
+        parts = np.split(flat, np.cumsum(self.__sizes)[:-1])
+        return [part.reshape(shape) for part, shape in zip(parts, self.shapes)], version
+
+    def close(self, unlink=False) -> None:
+        self.__memory.close()
+        if unlink:
+            self.__memory.unlink()
+
+
+class _RecordingPolicy(Policy):
+    """ A policy that records the compact position after every play it chooses."""
+
+    def __init__(self, choose_action: Callable, agent_nickname: str, positions: list, turns: list) -> None:
+        super().__init__(choose_action, agent_nickname)
+        self.positions = positions
+        self.turns = turns
+
+    def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        new_state = super().choose_play(game_state, reachable_states)
+        self.positions.append(Position.from_board(new_state.board))
+        self.turns.append(new_state.turn_color.value)
+        return new_state
+
+
+def _run_actor(actor_id: int, shared_weights: SharedWeights, trajectories: mp.Queue, stop_event, seed) -> None:
+    """ An actor process: self-play games of TDAgents with the latest published weights."""
+    from src.agents.learning.game_manager import GameManager
+    from src.agents.learning.medium_network import q_network
+    from src.agents.td_agent import TDAgent
+
+    positions, turns = [], []
+    black_agent, white_agent = TDAgent(PlayerColor.BLACK), TDAgent(PlayerColor.WHITE)
+    env = GameManager(_RecordingPolicy(white_agent.choose_play, white_agent.nickname(), positions, turns),
+                      _RecordingPolicy(black_agent.choose_play, black_agent.nickname(), positions, turns),
+                      seed=None if seed is None else seed + actor_id)
+    version = 0
+    while not stop_event.is_set():
+        weights, version = shared_weights.read_if_newer(version)
+        if weights is not None:
+            q_network.model.set_weights(weights)
+        start_time = time.time()
+        env.play_episode()
+        winner, reward = env.get_reward()
+        trajectory = Trajectory(actor_id, version, np.stack(positions), np.array(turns, dtype=np.int8),
+                                winner, float(reward), time.time() - start_time)
+        positions.clear()
+        turns.clear()
+        while not stop_event.is_set():
+            try:
+                trajectories.put(trajectory, timeout=1)
+                break
+            except queue.Full:
+                pass
+    shared_weights.close()
+
+
+class ActorLearner:
+    """
+    Parallel self-play training: actor processes play games with a recent snapshot of the weights and stream their
+    compact trajectories through a queue, the learner (this process) trains the network on them and publishes new
+    weights every few games. A throughput dashboard is printed periodically.
+    """
+
+    def __init__(self, model: QNetwork,
+                 n_actors=2,
+                 publish_every=4,
+                 report_every=10.0,
+                 checkpointer: AsyncCheckpointer = None,
+                 queue_size=64,
+                 games_per_update=1,
+                 seed=None,
+                 ):
+        """
+        :param model: the network the learner trains (the actors play with copies of its weights).
+        :param publish_every: publish the weights (and save a checkpoint) every this number of trained games.
+        :param report_every: print the dashboard every this number of seconds.
+        :param checkpointer: saves the published weights in the background, None to not save them.
+        :param games_per_update: the number of games whose gradients are summed before they are applied, 1 for the
+                                 exact update of Trainer (more games take the gradients at fixed weights).
+        """
+        self.model = model
+        self.n_actors = n_actors
+        self.publish_every = publish_every
+        self.report_every = report_every
+        self.checkpointer = checkpointer
+        self.queue_size = queue_size
+        self.games_per_update = games_per_update
+        self.seed = seed
+        self.games_trained = 0
+        self.positions_trained = 0
+        self.weights_version = 0
+        self.__staleness: List[int] = []
+        self.__train_time = 0.0
+
+    def run(self, n_games: int) -> None:
+        """ Train on [n_games] self-play games."""
+        # TensorFlow is not fork safe, so the actors are spawned
+        context = mp.get_context('spawn')
+        trajectories, stop_event = context.Queue(self.queue_size), context.Event()
+        shared_weights = SharedWeights([w.shape for w in self.model.model.get_weights()],
+                                       lock=context.Lock(), version=context.Value('i', 0, lock=False))
+        self.weights_version = shared_weights.publish(self.model.model.get_weights())
+        actors = [context.Process(target=_run_actor, args=(actor_id, shared_weights, trajectories, stop_event,
+                                                            self.seed), daemon=True)
+                  for actor_id in range(self.n_actors)]
+        for actor in actors:
+            actor.start()
+
+        start_time = last_report = time.time()
+        try:
+            while self.games_trained < n_games:
+                try:
+                    trajectory = trajectories.get(timeout=1)
+                except queue.Empty:
+                    continue
+                self.train_on(trajectory)
+                if self.games_trained % self.publish_every == 0:
+                    self.weights_version = shared_weights.publish(self.model.model.get_weights())
+                    if self.checkpointer is not None:
+                        self.checkpointer.maybe_save(self.model, self.games_trained)
+                if time.time() - last_report >= self.report_every:
+                    self._print_dashboard(time.time() - start_time, trajectories)
+                    last_report = time.time()
+            self._print_dashboard(time.time() - start_time, trajectories)
+            if self.checkpointer is not None:
+                self.checkpointer.save(self.model, self.games_trained, block=True)
+                self.checkpointer.flush()
+        finally:
+            stop_event.set()
+            for actor in actors:
+                actor.join(timeout=5)
+                if actor.is_alive():
+                    actor.terminate()
+            shared_weights.close(unlink=True)
+
+    def train_on(self, trajectory: Trajectory) -> None:
+        """
+        The update of Trainer.train_an_episode (as QNetwork.train_vectorized), on the expanded trajectory. With more
+        than one game per update, the games' gradients are summed instead (QNetwork.accumulate_game, approximate).
+        """
+        train_start = time.time()
+        features = GameUtils.extract_features_batch(trajectory.positions, trajectory.turns)
+        # the same turn factors as ReplayBuffer.get_turns_factors
+        turn_factors = np.where(trajectory.turns == trajectory.winner.value, 1.0, 0.5)
+        step_weights = QNetwork.get_decayed_array(len(features), turn_factors)
+        if self.games_per_update == 1:
+            self.model.train_on_game(features, step_weights, trajectory.reward)
+        else:
+            self.model.accumulate_game(features, step_weights, trajectory.reward)
+            if self.model.accumulated_games >= self.games_per_update:
+                self.model.apply_accumulated_gradients()
+        self.__train_time += time.time() - train_start
+        self.games_trained += 1
+        self.positions_trained += len(features)
+        self.__staleness.append(self.weights_version - trajectory.weights_version)
+
+    def _print_dashboard(self, elapsed: float, trajectories: mp.Queue) -> None:
+        try:
+            queued = trajectories.qsize()
+        except NotImplementedError:  # not available on macOS
+            queued = -1
+        staleness = np.mean(self.__staleness[-100:]) if self.__staleness else 0.0
+        print(f"[{elapsed:7.0f}s] games: {self.games_trained} ({self.games_trained / elapsed:.2f}/s) | "
+              f"positions: {self.positions_trained} ({self.positions_trained / elapsed:.0f}/s) | "
+              f"learner busy: {self.__train_time / elapsed:.0%} | queued: {queued} | "
+              f"weights version: {self.weights_version} (actors {staleness:.1f} behind)")
+
+
+if __name__ == '__main__':
+    from src.agents.learning.medium_network import q_network
+
+    parser = argparse.ArgumentParser(description="Self-play training with parallel actors and one learner.")
+    parser.add_argument('--n_actors', help='The number of actor processes.', default=2, type=int)
+    parser.add_argument('--n_games', help='The number of games to train on.', default=500, type=int)
+    parser.add_argument('--publish_every', help='Publish the weights every this number of games.', default=4, type=int)
+    parser.add_argument('--games_per_update', help='The number of games per gradient update.', default=1, type=int)
+    args = parser.parse_args()
+    checkpointer = AsyncCheckpointer()
+    checkpointer.restore(q_network)
+    ActorLearner(q_network, args.n_actors, args.publish_every, checkpointer=checkpointer,
+                 games_per_update=args.games_per_update).run(args.n_games)
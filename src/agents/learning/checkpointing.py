@@ -0,0 +1,230 @@
+"""
+Checkpoints written off the training thread.
+
+The training thread only copies the weights to memory (model.get_weights()), a writer thread saves the copies as
+checkpoint-<step>.npz files. Every file is written to a temporary name and renamed, and the list of checkpoints is kept
+in a manifest.json that is replaced the same way, so a reader never sees a torn checkpoint. The last [keep_last]
+checkpoints are kept, plus a copy of the best one by evaluation score as best.npz. A checkpoint saved with await_score
+is kept, whatever its age, until its score is reported, so a slow evaluation can still make it the best one.
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import List, Union
+
+import numpy as np
+
+CHECKPOINT_DIRECTORY = 'src/agents/learning/checkpoints/snapshots'
+MANIFEST_FILE = "manifest.json"
+BEST_FILE = "best.npz"
+
+
+def save_weights_file(path: str, weights: List[np.ndarray], step: int) -> None:
+    """ Write the weights to [path] atomically."""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        np.savez(file, step=step, **{f"w{i}": w for i, w in enumerate(weights)})
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_weights_file(path: str) -> List[np.ndarray]:
+    with np.load(path) as data:
+        return [data[f"w{i}"] for i in range(len(data.files) - 1)]
+
+
+class AsyncCheckpointer:
+    """ Saves weight snapshots on a background thread, every [every_steps] steps and/or [every_seconds] seconds."""
+
+    def __init__(self, directory=CHECKPOINT_DIRECTORY, keep_last=5, every_steps: Union[int, None] = 1,
+                 every_seconds: Union[float, None] = None, max_pending=2) -> None:
+        """
+        :param keep_last: the number of recent checkpoints kept on disk (the best one is kept apart).
+        :param every_steps: save when this number of steps passed since the last save, None to ignore steps.
+        :param every_seconds: save when this number of seconds passed since the last save, None to ignore time.
+        :param max_pending: the number of snapshots waiting for the writer, a snapshot taken while the writer is that
+                            far behind is dropped (until the next one) rather than stalling training.
+        """
+        self.directory = directory
+        self.keep_last = keep_last
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.saved = 0
+        self.dropped = 0
+        # the steps saved with await_score whose score was not reported yet (on the training thread)
+        self.awaiting_score = set()
+        self.__last_step: Union[int, None] = None
+        self.__last_time = time.time()
+        self.__manifest = self.read_manifest(directory)
+        # the queue is unbounded so that reporting a score never waits, the snapshots are bounded by the semaphore
+        self.__queue: queue.Queue = queue.Queue()
+        self.__pending_snapshots = threading.Semaphore(max_pending)
+        self.__error: Union[BaseException, None] = None
+        os.makedirs(directory, exist_ok=True)
+        self.__writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self.__writer.start()
+
+    @staticmethod
+    def read_manifest(directory: str) -> dict:
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"checkpoints": [], "best": None}
+
+    def latest_step(self) -> Union[int, None]:
+        """ The step of the newest checkpoint written, None if there is none."""
+        checkpoints = self.__manifest["checkpoints"]
+        return checkpoints[-1]["step"] if checkpoints else None
+
+    def should_save(self, step: int) -> bool:
+        if self.__last_step is None:
+            return True
+        if self.every_steps is not None and step - self.__last_step >= self.every_steps:
+            return True
+        return self.every_seconds is not None and time.time() - self.__last_time >= self.every_seconds
+
+    def maybe_save(self, model, step: int, score: float = None, await_score=False) -> bool:
+        """ Snapshot the model's weights if the cadence is due, returns whether it did."""
+        if not self.should_save(step):
+            return False
+        return self.save(model, step, score, await_score=await_score)
+
+    def save(self, model, step: int, score: float = None, block=False, await_score=False) -> bool:
+        """
+        Snapshot the model's weights (a QNetwork, or anything with get_weights()) to be written as [step].
+        :param score: the evaluation score of these weights, if already known (higher is better).
+        :param block: wait for room in the writer's queue instead of dropping the snapshot.
+        :param await_score: keep the checkpoint until report_score gives its score (it is marked "awaiting_score" in
+                            the manifest meanwhile).
+        """
+        self._raise_writer_error()
+        weights = model.model.get_weights() if hasattr(model, "model") else model.get_weights()
+        self.__last_step, self.__last_time = step, time.time()
+        if not self.__pending_snapshots.acquire(blocking=block):
+            self.dropped += 1
+            return False
+        self.__queue.put(("save", step, weights, (score, await_score and score is None)))
+        if await_score and score is None:
+            self.awaiting_score.add(step)
+        return True
+
+    def report_score(self, step: int, score: float) -> None:
+        """
+        The evaluation score of the checkpoint of [step], it is copied to best.npz if it is the best so far. The score
+        of a checkpoint that was neither kept for it (await_score) nor is among the last ones is ignored.
+        Never waits for the writer: the score is queued behind the pending snapshots.
+        """
+        self.awaiting_score.discard(step)
+        self.__queue.put_nowait(("score", step, None, (score, False)))
+
+    def best_step(self) -> Union[int, None]:
+        """ The step of the best checkpoint written, None if no checkpoint was scored."""
+        best = self.__manifest["best"]
+        return best["step"] if best is not None else None
+
+    def flush(self) -> None:
+        """ Wait until every snapshot taken so far is written."""
+        self.__queue.join()
+        self._raise_writer_error()
+
+    def close(self) -> None:
+        self.flush()
+        self.__queue.put(None)
+        self.__writer.join()
+
+    def restore(self, model, best=False) -> Union[int, None]:
+        """ Load the latest (or the best) checkpoint into the model, returns its step or None if there is none."""
+        manifest = self.read_manifest(self.directory)
+        if best and manifest["best"] is not None:
+            entry, path = manifest["best"], os.path.join(self.directory, BEST_FILE)
+        elif manifest["checkpoints"]:
+            entry = manifest["checkpoints"][-1]
+            path = os.path.join(self.directory, entry["file"])
+        else:
+            return None
+        weights = load_weights_file(path)
+        (model.model if hasattr(model, "model") else model).set_weights(weights)
+        self.__last_step = entry["step"]
+        return entry["step"]
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                self.__queue.task_done()
+                return
+            kind, step, weights, (score, await_score) = item
+            try:
+                if kind == "save":
+                    self._write_checkpoint(step, weights, score, await_score)
+                else:
+                    self._set_score(step, score)
+            except BaseException as error:  # surfaced on the training thread by the next call
+                self.__error = error
+            finally:
+                if kind == "save":
+                    self.__pending_snapshots.release()
+                self.__queue.task_done()
+
+    def _write_checkpoint(self, step: int, weights: List[np.ndarray], score: Union[float, None],
+                          await_score: bool) -> None:
+        name = f"checkpoint-{step:08d}.npz"
+        save_weights_file(os.path.join(self.directory, name), weights, step)
+        # saving a step again keeps it awaiting its score
+        await_score = await_score or any(entry["step"] == step and entry.get("awaiting_score")
+                                         for entry in self.__manifest["checkpoints"])
+        checkpoints = [entry for entry in self.__manifest["checkpoints"] if entry["step"] != step]
+        checkpoints.append({"file": name, "step": step, "time": time.time(), "score": None,
+                            "awaiting_score": await_score})
+        self.__manifest["checkpoints"] = checkpoints
+        self.saved += 1
+        if score is not None:
+            self._set_score(step, score)
+        else:
+            self._expire()
+
+    def _set_score(self, step: int, score: float) -> None:
+        entry = next((entry for entry in self.__manifest["checkpoints"] if entry["step"] == step), None)
+        if entry is None:  # already expired
+            return
+        entry["score"], entry["awaiting_score"] = score, False
+        best = self.__manifest["best"]
+        if best is None or score > best["score"]:
+            temporary_path = os.path.join(self.directory, BEST_FILE + ".tmp")
+            shutil.copyfile(os.path.join(self.directory, entry["file"]), temporary_path)
+            os.replace(temporary_path, os.path.join(self.directory, BEST_FILE))
+            self.__manifest["best"] = {"step": step, "score": score}
+        self._expire()
+
+    def _expire(self) -> None:
+        """ Drop the checkpoints before the last [keep_last] but those awaiting their score, and write the manifest."""
+        checkpoints = self.__manifest["checkpoints"]
+        recent = checkpoints[-self.keep_last:]
+        expired = [entry for entry in checkpoints[:-self.keep_last] if not entry.get("awaiting_score")]
+        self.__manifest["checkpoints"] = [entry for entry in checkpoints
+                                          if entry.get("awaiting_score") or entry in recent]
+        self._write_manifest()
+        # the manifest no longer lists the expired files when they are removed
+        for entry in expired:
+            try:
+                os.remove(os.path.join(self.directory, entry["file"]))
+            except FileNotFoundError:
+                pass
+
+    def _write_manifest(self) -> None:
+        temporary_path = os.path.join(self.directory, MANIFEST_FILE + ".tmp")
+        with open(temporary_path, "w") as file:
+            json.dump(self.__manifest, file, indent=1)
+        os.replace(temporary_path, os.path.join(self.directory, MANIFEST_FILE))
+
+    def _raise_writer_error(self) -> None:
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise RuntimeError("The checkpoint writer failed") from error
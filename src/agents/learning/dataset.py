@@ -0,0 +1,145 @@
+"""
+A sharded on-disk self-play dataset.
+
+Every writer appends whole games to its own shard files, each a .npy array of RECORD_DTYPE records (a compact position,
+the side to move, the game result and the game's metadata). A finished shard is written to a temporary file and
+renamed, then listed as one JSON line in the dataset's index.jsonl, so writers on many processes can share a directory.
+The reader memory-maps the shards and streams shuffled mini-batches across them, expanding the positions to features
+one batch at a time.
+"""
+from __future__ import annotations
+
+import json
+import os
+import uuid
+import zlib
+from typing import Iterator, List
+
+import numpy as np
+
+from src.game.core.colors import PlayerColor
+from src.game.core.position import Position
+from src.game.core.utils import GameUtils
+
+INDEX_FILE = "index.jsonl"
+RECORD_DTYPE = np.dtype([
+    ("position", np.int8, (Position.SIZE,)),
+    ("turn", np.int8),  # the PlayerColor value of the player to move
+    ("result", np.float32),  # the game result from black's point of view
+    ("game_id", np.int64),  # a hash of the writer id in the high bits, the game number of the writer in the low 32
+    ("ply", np.int16),
+])
+
+
+class DatasetWriter:
+    """ Appends games to shards of [shard_size] positions."""
+
+    def __init__(self, directory: str, shard_size=100000, writer_id: str = None, canonical=False) -> None:
+        """
+        :param writer_id: names this writer's shards, unique by default.
+        :param canonical: store every position as its canonical twin with black to move (see Position.canonical),
+                          with the result from black's point of view of that twin.
+        """
+        self.directory = directory
+        self.shard_size = shard_size
+        self.canonical = canonical
+        self.writer_id = writer_id or uuid.uuid4().hex[:8]
+        # the game ids of writers sharing a directory do not collide
+        self.__game_id_prefix = (zlib.crc32(self.writer_id.encode()) & 0x7FFFFFFF) << 32
+        self.games_written = 0
+        self.positions_written = 0
+        self.__records: List[np.ndarray] = []
+        self.__pending = 0
+        self.__shard_index = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def add_game(self, positions: np.ndarray, turns: np.ndarray, result: float) -> None:
+        """
+        :param positions: (T, 28) compact positions after every play of a game.
+        :param turns: (T,) the PlayerColor value of the player to move in every position.
+        :param result: the game result from black's point of view.
+        """
+        records = np.zeros(len(positions), dtype=RECORD_DTYPE)
+        if self.canonical:
+            positions, signs = Position.canonical_batch(positions, turns)
+            turns, result = np.full(len(positions), PlayerColor.BLACK.value), result * signs
+        records["position"] = positions
+        records["turn"] = turns
+        records["result"] = result
+        records["game_id"] = self.__game_id_prefix | self.games_written
+        records["ply"] = np.arange(len(positions))
+        self.__records.append(records)
+        self.__pending += len(records)
+        self.games_written += 1
+        self.positions_written += len(records)
+        if self.__pending >= self.shard_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Write the pending games as a new shard (games are never split between shards)."""
+        if not self.__pending:
+            return
+        records = np.concatenate(self.__records)
+        name = f"shard-{self.writer_id}-{self.__shard_index:05d}.npy"
+        temporary_path = os.path.join(self.directory, name + ".tmp")
+        with open(temporary_path, "wb") as file:
+            np.save(file, records)
+        os.replace(temporary_path, os.path.join(self.directory, name))
+        entry = json.dumps({"file": name, "positions": len(records), "games": int(len(np.unique(records["game_id"]))),
+                            "writer": self.writer_id})
+        # a single small append is atomic, so concurrent writers do not interleave their lines
+        with open(os.path.join(self.directory, INDEX_FILE), "a") as index:
+            index.write(entry + "\n")
+        self.__records, self.__pending = [], 0
+        self.__shard_index += 1
+
+    def close(self) -> None:
+        self.flush()
+
+
+class DatasetReader:
+    """ Streams shuffled mini-batches from the memory-mapped shards of a dataset."""
+
+    def __init__(self, directory: str, shards_per_window=4, seed=None) -> None:
+        """
+        :param shards_per_window: the number of shards shuffled together, every batch mixes positions of that many
+                                  shards while only their pages that are read are loaded.
+        """
+        self.directory = directory
+        self.shards_per_window = shards_per_window
+        self.__rng = np.random.default_rng(seed)
+        with open(os.path.join(directory, INDEX_FILE)) as index:
+            self.shards = [json.loads(line) for line in index if line.strip()]
+        self.__arrays: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return sum(shard["positions"] for shard in self.shards)
+
+    def batches(self, batch_size: int, epochs=1, shuffle=True) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """ Yields (features (B, 198), turns (B,), results (B,)) mini-batches, a window's last one may be smaller."""
+        for _ in range(epochs):
+            order = self.__rng.permutation(len(self.shards)) if shuffle else np.arange(len(self.shards))
+            for start in range(0, len(order), self.shards_per_window):
+                window = [self._shard(self.shards[i]["file"]) for i in order[start:start + self.shards_per_window]]
+                # (shard, row) of every position in the window
+                shard_ids = np.repeat(np.arange(len(window)), [len(shard) for shard in window])
+                rows = np.concatenate([np.arange(len(shard)) for shard in window])
+                permutation = self.__rng.permutation(len(rows)) if shuffle else np.arange(len(rows))
+                for batch_start in range(0, len(permutation), batch_size):
+                    selected = permutation[batch_start:batch_start + batch_size]
+                    yield self._gather(window, shard_ids[selected], rows[selected])
+
+    def _gather(self, window: List[np.ndarray], shard_ids: np.ndarray, rows: np.ndarray) \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        records = np.empty(len(rows), dtype=RECORD_DTYPE)
+        for shard_id, shard in enumerate(window):
+            mask = shard_ids == shard_id
+            if mask.any():
+                records[mask] = shard[rows[mask]]
+        features = GameUtils.extract_features_batch(records["position"], records["turn"])
+        return features, records["turn"], records["result"]
+
+    def _shard(self, name: str) -> np.ndarray:
+        if name not in self.__arrays:
+            self.__arrays[name] = np.load(os.path.join(self.directory, name), mmap_mode="r")
+        return self.__arrays[name]
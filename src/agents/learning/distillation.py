@@ -0,0 +1,188 @@
+"""
+Distillation of the deep medium_network (the teacher) into the shallow small_network (the student).
+
+The teacher labels positions, either from a self-play dataset (see dataset.py) or from its own vectorized self-play,
+and the student is trained to regress the teacher's scores. The positions are kept compact and expanded to features one
+batch at a time. The report compares the two networks on held-out positions: the error of the student's scores, how
+often it picks the teacher's play, and the latency of both networks.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import List
+
+import numpy as np
+import tensorflow as tf
+
+from src.agents.learning.checkpointing import CHECKPOINT_DIRECTORY, AsyncCheckpointer, load_weights_file, \
+    save_weights_file
+from src.agents.learning.dataset import DatasetReader
+from src.agents.learning.q_network import QNetwork
+from src.agents.learning.vectorized_self_play import VectorizedSelfPlay
+from src.agents.rollouts.light_policy import LightBoard
+from src.game.core.colors import PlayerColor
+from src.game.core.utils import GameUtils
+
+
+def label(teacher: QNetwork, positions: np.ndarray, turns: np.ndarray, batch_size=4096) -> np.ndarray:
+    """ The teacher's scores of compact positions, one batch at a time."""
+    labels = np.empty(len(positions), dtype=np.float32)
+    for start in range(0, len(positions), batch_size):
+        selected = slice(start, start + batch_size)
+        features = GameUtils.extract_features_batch(positions[selected], turns[selected])
+        labels[selected] = teacher.model(features).numpy().reshape(-1)
+    return labels
+
+
+def positions_from_self_play(teacher: QNetwork, n_positions: int, n_games=256, exploration=0.1, seed=None) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """ The compact positions (and sides to move) of the teacher's self-play games, with some random plays."""
+    positions: List[np.ndarray] = []
+    turns: List[np.ndarray] = []
+
+    def on_game_end(game_positions: np.ndarray, game_turns: np.ndarray, _) -> None:
+        positions.append(game_positions)
+        turns.append(game_turns)
+
+    self_play = VectorizedSelfPlay(teacher, n_games, exploration, on_game_end, seed)
+    while sum(len(game) for game in positions) < n_positions:
+        self_play.step()
+    return np.concatenate(positions)[:n_positions], np.concatenate(turns)[:n_positions]
+
+
+def positions_from_dataset(directory: str, n_positions: int, seed=None) -> tuple[np.ndarray, np.ndarray]:
+    """ [n_positions] positions sampled from a dataset (all of them if it is smaller)."""
+    shards = DatasetReader(directory).shards
+    records = np.concatenate([np.load(os.path.join(directory, shard["file"]), mmap_mode="r") for shard in shards])
+    if n_positions < len(records):
+        records = records[np.random.default_rng(seed).choice(len(records), n_positions, replace=False)]
+    return records["position"], records["turn"]
+
+
+class Distiller:
+    """ Trains the student on the teacher's scores with mini-batch Adam on the MSE."""
+
+    def __init__(self, teacher: QNetwork, student: QNetwork, learning_rate=1e-3, batch_size=512, seed=None) -> None:
+        self.teacher = teacher
+        self.student = student
+        self.batch_size = batch_size
+        self.optimizer = tf.keras.optimizers.Adam(learning_rate)
+        self.__rng = np.random.default_rng(seed)
+
+    def fit(self, positions: np.ndarray, turns: np.ndarray, labels: np.ndarray, epochs=5) -> List[float]:
+        """ Returns the mean training loss of every epoch."""
+        losses = []
+        for epoch in range(epochs):
+            permutation, epoch_loss = self.__rng.permutation(len(positions)), 0.0
+            for start in range(0, len(permutation), self.batch_size):
+                selected = permutation[start:start + self.batch_size]
+                features = GameUtils.extract_features_batch(positions[selected], turns[selected])
+                loss = self._train_step(tf.convert_to_tensor(features), tf.convert_to_tensor(labels[selected]))
+                epoch_loss += float(loss) * len(selected)
+            losses.append(epoch_loss / len(positions))
+            print(f"epoch {epoch}: loss {losses[-1]:.5f}")
+        return losses
+
+    @tf.function(input_signature=[tf.TensorSpec([None, 198], tf.float32), tf.TensorSpec([None], tf.float32)])
+    def _train_step(self, features, labels):
+        variables = self.student.model.trainable_variables
+        with tf.GradientTape() as tape:
+            predictions = tf.reshape(self.student.model(features, training=True), [-1])
+            loss = tf.reduce_mean(tf.square(predictions - labels))
+        self.optimizer.apply_gradients(zip(tape.gradient(loss, variables), variables))
+        return loss
+
+
+def play_agreement(teacher: QNetwork, student: QNetwork, positions: np.ndarray, turns: np.ndarray, seed=None) -> float:
+    """ The fraction of positions (with a random roll and more than one play) where both networks choose one play."""
+    rng, agreements, decisions = np.random.default_rng(seed), 0, 0
+    for position, turn in zip(positions, turns):
+        board = LightBoard.from_position(position, PlayerColor(int(turn)))
+        if board.is_game_ended():
+            continue
+        plays = board.plays(rng.integers(1, 7, size=2).tolist())
+        if len(plays) < 2:
+            continue
+        movers = np.full(len(plays), turn, dtype=np.int8)
+        features = GameUtils.extract_features_batch(LightBoard.to_positions(np.array(plays), movers), -movers)
+        teacher_choice = np.argmax(teacher.model(features).numpy().reshape(-1) * turn)
+        student_choice = np.argmax(student.model(features).numpy().reshape(-1) * turn)
+        agreements += int(teacher_choice == student_choice)
+        decisions += 1
+    return agreements / max(decisions, 1)
+
+
+def latency(network: QNetwork, features: np.ndarray, repeats=200) -> float:
+    """ The seconds of a forward pass on [features], the median of [repeats] calls."""
+    network.model(features)  # warm up
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        network.model(features)
+        times.append(time.perf_counter() - start_time)
+    return float(np.median(times))
+
+
+def report(teacher: QNetwork, student: QNetwork, positions: np.ndarray, turns: np.ndarray, labels: np.ndarray,
+           n_agreement=500, seed=None) -> dict:
+    """ The accuracy and latency of the student against the teacher, on held-out labelled positions."""
+    errors = label(student, positions, turns) - labels
+    features = GameUtils.extract_features_batch(positions[:1024], turns[:1024])
+    results = {
+        "mse": float(np.mean(errors ** 2)),
+        "mae": float(np.mean(np.abs(errors))),
+        "play_agreement": play_agreement(teacher, student, positions[:n_agreement], turns[:n_agreement], seed),
+        "teacher_parameters": teacher.model.count_params(),
+        "student_parameters": student.model.count_params(),
+    }
+    for name, network in (("teacher", teacher), ("student", student)):
+        results[f"{name}_single_ms"] = 1000 * latency(network, features[:1])
+        results[f"{name}_batch_us_per_position"] = 1e6 * latency(network, features, repeats=20) / len(features)
+    return results
+
+
+def load_teacher(teacher: QNetwork, checkpoint_directory=CHECKPOINT_DIRECTORY) -> None:
+    """ Load the latest checkpoint of the training into the teacher, if there is one."""
+    checkpoints = AsyncCheckpointer.read_manifest(checkpoint_directory)["checkpoints"]
+    if checkpoints:
+        teacher.model.set_weights(load_weights_file(os.path.join(checkpoint_directory, checkpoints[-1]["file"])))
+    else:
+        print("No teacher checkpoint found, distilling the initial weights")
+
+
+if __name__ == '__main__':
+    from src.agents.learning.medium_network import q_network
+    from src.agents.learning.small_network import STUDENT_WEIGHTS_FILE, create_student
+
+    parser = argparse.ArgumentParser(description="Distill medium_network into the shallow small_network.")
+    parser.add_argument('--dataset', help='A dataset directory to take the positions from (self-play if not given).',
+                        default=None, type=str)
+    parser.add_argument('--n_positions', help='The number of positions to label.', default=1000000, type=int)
+    parser.add_argument('--validation_fraction', help='The part of the positions held out.', default=0.05, type=float)
+    parser.add_argument('--epochs', help='The number of passes over the positions.', default=5, type=int)
+    parser.add_argument('--learning_rate', default=1e-3, type=float)
+    parser.add_argument('--output', help='Where to save the student weights.', default=STUDENT_WEIGHTS_FILE, type=str)
+    parser.add_argument('--seed', default=None, type=int)
+    args = parser.parse_args()
+
+    load_teacher(q_network)
+    start = time.time()
+    if args.dataset is not None:
+        all_positions, all_turns = positions_from_dataset(args.dataset, args.n_positions, args.seed)
+    else:
+        all_positions, all_turns = positions_from_self_play(q_network, args.n_positions, seed=args.seed)
+    all_labels = label(q_network, all_positions, all_turns)
+    print(f"labelled {len(all_positions)} positions in {time.time() - start:.0f} seconds")
+
+    order = np.random.default_rng(args.seed).permutation(len(all_positions))
+    n_validation = int(len(order) * args.validation_fraction)
+    validation, training = order[:n_validation], order[n_validation:]
+    student_network = create_student()
+    Distiller(q_network, student_network, args.learning_rate, seed=args.seed).fit(
+        all_positions[training], all_turns[training], all_labels[training], args.epochs)
+    save_weights_file(args.output, student_network.model.get_weights(), args.epochs)
+    for key, value in report(q_network, student_network, all_positions[validation], all_turns[validation],
+                             all_labels[validation], seed=args.seed).items():
+        print(f"{key:32} {value:.6g}")
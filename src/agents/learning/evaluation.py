@@ -0,0 +1,202 @@
+"""
+Evaluation of the network's checkpoints in a separate process.
+
+The evaluator process watches the checkpoints written by an AsyncCheckpointer and runs a fixed benchmark on the newest
+one awaiting its score (kept on disk until the score is reported), or else (unless told to only score those) on the
+newest one: it scores the reference positions of GameManager and plays N games against each opponent (with the same
+dice every time, so the results of different checkpoints are comparable). The network's plays of all the games are
+scored together in one forward pass per ply. Every result is appended as a JSON line to a metrics file, which the
+learner reads without ever waiting for the evaluation.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from copy import copy
+from typing import Callable, Dict, List, Sequence, Union
+
+import numpy as np
+
+from src.agents.agent import Agent
+from src.agents.learning.checkpointing import CHECKPOINT_DIRECTORY, AsyncCheckpointer, load_weights_file
+from src.agents.learning.game_manager import reference_states
+from src.agents.learning.q_network import QNetwork
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+
+METRICS_FILE = 'src/agents/learning/checkpoints/metrics.jsonl'
+
+
+def _hitter(color: PlayerColor) -> Agent:
+    from src.agents.eater_agent import HitterAgent
+    return HitterAgent(color)
+
+
+def _expectimax(color: PlayerColor) -> Agent:
+    from src.agents.expectimax_agent import ExpectimaxAgent
+    from src.agents.heuristics.heuristic import HeuristicEvaluator
+    heuristic = HeuristicEvaluator(color)
+    return ExpectimaxAgent(color, heuristic_function=heuristic.evaluate, max_depth=1, dice_sample_size=10,
+                           batch_heuristic_function=heuristic.evaluate_batch)
+
+
+OPPONENTS: Dict[str, Callable[[PlayerColor], Agent]] = {
+    'hitter': _hitter,
+    'expectimax': _expectimax,
+}
+
+
+def play_against(network: QNetwork, opponent: Callable[[PlayerColor], Agent], n_games: int, seed=0) -> List[int]:
+    """
+    Play [n_games] games of the network against the opponent, the network is black in the even games. The games are
+    played in lockstep and the network's candidate plays of all of them are scored together.
+    :return: the result of every game from the network's point of view.
+    """
+    rng = np.random.default_rng(seed)
+    network_colors = [PlayerColor.BLACK if game % 2 == 0 else PlayerColor.WHITE for game in range(n_games)]
+    opponents = [opponent(color.opposite()) for color in network_colors]
+    states = [GameState(PlayerColor(int(rng.choice([-1, 1])))) for _ in range(n_games)]
+    results: List[Union[int, None]] = [None] * n_games
+    while any(result is None for result in results):
+        network_games, candidates = [], []
+        for game, state in enumerate(states):
+            if results[game] is not None:
+                continue
+            state.dice.roll(rng.integers(1, 7, size=2).tolist())
+            if not state.possible_moves:
+                state.switch_turns()
+            elif state.turn_color == network_colors[game]:
+                network_games.append(game)
+                candidates.append(list(state.reachable_states))
+            else:
+                state.apply_play(opponents[game].choose_play(copy(state), set(state.reachable_states)))
+        if candidates:
+            scores = network.get_scores([candidate for plays in candidates for candidate in plays])
+            first = 0
+            for game, plays in zip(network_games, candidates):
+                game_scores = scores[first:first + len(plays)] * network_colors[game].win_factor()
+                states[game].apply_play(plays[int(np.argmax(game_scores))])
+                first += len(plays)
+        for game, state in enumerate(states):
+            if results[game] is None and state.is_game_ended():
+                results[game] = state.get_winner_score() * network_colors[game].win_factor()
+    return results
+
+
+def evaluate(network: QNetwork, n_games=20, opponents: Sequence[str] = tuple(OPPONENTS), seed=0) -> dict:
+    """
+    The fixed benchmark: the scores of the reference positions and the points per game against every opponent.
+    The "score" of the result is the mean points per game, higher is better.
+    """
+    start_time = time.time()
+    references = reference_states()
+    scores = network.get_scores(list(references.values()))
+    metrics = {"reference": {name: float(score) for name, score in zip(references, scores)}, "opponents": {}}
+    for name in opponents:
+        results = np.array(play_against(network, OPPONENTS[name], n_games, seed))
+        metrics["opponents"][name] = {"games": len(results), "wins": int((results > 0).sum()),
+                                      "gammons": int((results > 1).sum()), "points_per_game": float(results.mean())}
+    points = [opponent["points_per_game"] for opponent in metrics["opponents"].values()]
+    metrics["score"] = float(np.mean(points)) if points else 0.0
+    metrics["seconds"] = time.time() - start_time
+    return metrics
+
+
+def run_evaluator(checkpoint_directory: str, metrics_file: str, n_games: int, opponents: Sequence[str],
+                  poll_every: float, stop_event=None, seed=0, awaiting_only=False) -> None:
+    """
+    The evaluator process: evaluate the newest checkpoint awaiting its score, or else the newest checkpoint, whenever
+    it was not evaluated yet, until [stop_event].
+    :param awaiting_only: only evaluate the checkpoints awaiting their score, the others may expire before it is used.
+    """
+    from src.agents.learning.medium_network import q_network
+
+    evaluated_steps = set()
+    while stop_event is None or not stop_event.is_set():
+        checkpoints = AsyncCheckpointer.read_manifest(checkpoint_directory)["checkpoints"]
+        awaiting = [entry for entry in checkpoints
+                    if entry.get("awaiting_score") and entry["step"] not in evaluated_steps]
+        candidates = awaiting
+        if not awaiting and not awaiting_only:
+            candidates = [entry for entry in checkpoints[-1:] if entry["step"] not in evaluated_steps]
+        if not candidates:
+            time.sleep(poll_every)
+            continue
+        entry = candidates[-1]
+        try:
+            q_network.model.set_weights(load_weights_file(os.path.join(checkpoint_directory, entry["file"])))
+        except FileNotFoundError:  # removed by the checkpointer in the meantime
+            continue
+        metrics = evaluate(q_network, n_games, opponents, seed)
+        metrics.update(step=entry["step"], time=time.time())
+        with open(metrics_file, "a") as file:
+            file.write(json.dumps(metrics) + "\n")
+        evaluated_steps.add(entry["step"])
+
+
+class BackgroundEvaluator:
+    """ Runs run_evaluator in a spawned process, and reads the results it writes."""
+
+    def __init__(self, checkpoint_directory=CHECKPOINT_DIRECTORY, metrics_file=METRICS_FILE, n_games=20,
+                 opponents: Sequence[str] = tuple(OPPONENTS), poll_every=5.0, seed=0, awaiting_only=False) -> None:
+        """
+        :param n_games: the number of games against each opponent.
+        :param poll_every: the number of seconds between checks for a new checkpoint.
+        :param awaiting_only: only evaluate the checkpoints saved with await_score (see run_evaluator).
+        """
+        self.checkpoint_directory = checkpoint_directory
+        self.metrics_file = metrics_file
+        self.n_games = n_games
+        self.opponents = tuple(opponents)
+        self.poll_every = poll_every
+        self.seed = seed
+        self.awaiting_only = awaiting_only
+        self.__process = None
+        self.__stop_event = None
+        self.__offset = os.path.getsize(metrics_file) if os.path.exists(metrics_file) else 0
+
+    def start(self) -> None:
+        # TensorFlow is not fork safe, so the evaluator is spawned
+        context = mp.get_context('spawn')
+        self.__stop_event = context.Event()
+        self.__process = context.Process(target=run_evaluator, daemon=True,
+                                         args=(self.checkpoint_directory, self.metrics_file, self.n_games,
+                                               self.opponents, self.poll_every, self.__stop_event, self.seed,
+                                               self.awaiting_only))
+        self.__process.start()
+
+    def stop(self, timeout=None) -> None:
+        """ Stop after the current evaluation, or kill the process after [timeout] seconds."""
+        if self.__process is None:
+            return
+        self.__stop_event.set()
+        self.__process.join(timeout)
+        if self.__process.is_alive():
+            self.__process.terminate()
+        self.__process = None
+
+    def new_results(self) -> List[dict]:
+        """ The results written since the last call (never blocks)."""
+        if not os.path.exists(self.metrics_file):
+            return []
+        with open(self.metrics_file) as file:
+            file.seek(self.__offset)
+            lines = file.readlines()
+        # a line that is still being written is read again next time
+        complete = [line for line in lines if line.endswith("\n")]
+        self.__offset += sum(len(line.encode()) for line in complete)
+        return [json.loads(line) for line in complete]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate the newest checkpoint whenever a new one is written.")
+    parser.add_argument('--checkpoint_directory', default=CHECKPOINT_DIRECTORY, type=str)
+    parser.add_argument('--metrics_file', default=METRICS_FILE, type=str)
+    parser.add_argument('--n_games', help='The number of games against each opponent.', default=20, type=int)
+    parser.add_argument('--opponents', nargs='+', choices=list(OPPONENTS), default=list(OPPONENTS))
+    parser.add_argument('--poll_every', help='Seconds between checks for a new checkpoint.', default=5.0, type=float)
+    args = parser.parse_args()
+    run_evaluator(args.checkpoint_directory, args.metrics_file, args.n_games, args.opponents, args.poll_every)
@@ -3,13 +3,48 @@ from collections import defaultdict
 from copy import copy
 from typing import Union
 
+import numpy as np
 import tensorflow as tf
 
+from src.agents.learning.dataset import DatasetWriter
 from src.agents.learning.policy import Policy
 from src.agents.learning.simple_display import SimpleDisplay
 from src.game.core.colors import PlayerColor
 from src.game.core.game_state import GameState
 from src.game.core.move import Move
+from src.game.core.position import Position
+from src.game.core.position_store import PositionStore
+
+
+def reference_states() -> dict[str, GameState]:
+    """ The positions the network is evaluated on, by name."""
+    states = dict()
+    states["white_init"] = GameState(PlayerColor.WHITE)
+    states["black_init"] = GameState(PlayerColor.BLACK)
+
+    # little advantage to white, prediction should be [-1,0]
+    board1 = {1: 1, 4: -3, 6: -3, 8: -2, 9: -2, 12: 2, 13: -1, 15: 3, 16: 1, 18: -2, 19: 3, 20: 1, 21: -2, 22: 2,
+              "bar": (2, 0)}
+    states["eval_board1"] = GameState(PlayerColor.WHITE, board1)
+
+    # little advantage to white, prediction should be [-1,0] closer to 0
+    board2 = {1: 2, 4: -2, 5: -2, 6: -2, 8: -2, 11: -1, 12: 1, 13: -4, 17: 6, 16: 1, 19: 5, 24: -2, "bar": (1, 0)}
+    states["eval_board2"] = GameState(PlayerColor.WHITE, board2)
+
+    # little advantage to black, prediction should be [0,1]
+    board3 = {1: -1, 4: -2, 5: -1, 6: -3, 8: -2, 9: 2, 10: -1, 12: -1, 13: -2, 17: 2, 18: 2, 19: 3, 20: 2, 21: 2,
+              22: 2, 24: -1, "bar": (0, 1)}
+    states["eval_board3"] = GameState(PlayerColor.BLACK, board3)
+
+    # black has an advantage, prediction should be 1.
+    board4 = {4: -2, 5: -1, 6: -3, 8: -3, 9: 2, 12: -1, 13: -3, 14: 2, 16: 3, 17: 3, 19: 5, 22: -1, 24: -1}
+    states["eval_board4"] = GameState(PlayerColor.BLACK, board4)
+
+    # should be huge advantage to white, so prediction should be close to -2
+    board5 = {1: -2, 2: -2, 3: -2, 4: -2, 5: -2, 6: -2, 8: -1, 12: 1, 13: -2, 15: 1, 17: 2, 19: 3, 20: 3, 21: 1,
+              22: 2, "bar": (2, 0)}
+    states["eval_board5"] = GameState(PlayerColor.WHITE, board5)
+    return states
 
 
 class GameManager:
@@ -17,11 +52,15 @@ class GameManager:
     A GameRunner runs the game.
     """
 
-    def __init__(self, white_policy: Policy, black_policy: Policy, seed=None) -> None:
+    def __init__(self, white_policy: Policy, black_policy: Policy, seed=None,
+                 dataset_writer: DatasetWriter = None, position_store: PositionStore = None) -> None:
         """
         :param display:
         :param white_player:
         :param black_player:
+        :param dataset_writer: if given, every game's positions and result are appended to this dataset.
+        :param position_store: if given, the reachable states of every turn are read from (or added to) this store,
+                               its new entries are flushed after every game (closing it is left to the caller).
         """
         self.__policies = {
             PlayerColor.WHITE: white_policy,
@@ -40,34 +79,13 @@ class GameManager:
         self._times_black_started = 0
         # debugging stats
         self.__eval_state = dict()
+        self.__dataset_writer = dataset_writer
+        self.__position_store = position_store
+        self.__game_positions, self.__game_turns = [], []
 
     def init_evaluation_state(self):
         # construct states for evaluation
-        self.__eval_state["white_init"] = GameState(PlayerColor.WHITE)
-        self.__eval_state["black_init"] = GameState(PlayerColor.BLACK)
-
-        # little advantage to white, prediction should be [-1,0]
-        board1 = {1: 1, 4: -3, 6: -3, 8: -2, 9: -2, 12: 2, 13: -1, 15: 3, 16: 1, 18: -2, 19: 3, 20: 1, 21: -2, 22: 2,
-                  "bar": (2, 0)}
-        self.__eval_state["eval_board1"] = GameState(PlayerColor.WHITE, board1)
-
-        # little advantage to white, prediction should be [-1,0] closer to 0
-        board2 = {1: 2, 4: -2, 5: -2, 6: -2, 8: -2, 11: -1, 12: 1, 13: -4, 17: 6, 16: 1, 19: 5, 24: -2, "bar": (1, 0)}
-        self.__eval_state["eval_board2"] = GameState(PlayerColor.WHITE, board2)
-
-        # little advantage to black, prediction should be [0,1]
-        board3 = {1: -1, 4: -2, 5: -1, 6: -3, 8: -2, 9: 2, 10: -1, 12: -1, 13: -2, 17: 2, 18: 2, 19: 3, 20: 2, 21: 2,
-                  22: 2, 24: -1, "bar": (0, 1)}
-        self.__eval_state["eval_board3"] = GameState(PlayerColor.BLACK, board3)
-
-        # black has an advantage, prediction should be 1.
-        board4 = {4: -2, 5: -1, 6: -3, 8: -3, 9: 2, 12: -1, 13: -3, 14: 2, 16: 3, 17: 3, 19: 5, 22: -1, 24: -1}
-        self.__eval_state["eval_board4"] = GameState(PlayerColor.BLACK, board4)
-
-        # should be huge advantage to white, so prediction should be close to -2
-        board5 = {1: -2, 2: -2, 3: -2, 4: -2, 5: -2, 6: -2, 8: -1, 12: 1, 13: -2, 15: 1, 17: 2, 19: 3, 20: 3, 21: 1,
-                  22: 2, "bar": (2, 0)}
-        self.__eval_state["eval_board5"] = GameState(PlayerColor.WHITE, board5)
+        self.__eval_state.update(reference_states())
 
     def get_eval_state_and_display(self, eval_code: str) -> GameState:
         state = self.__eval_state[eval_code]
@@ -120,6 +138,12 @@ class GameManager:
         # self.__display.show_winner(winner)
         self.__total_wins[winner] += 1
         self.__total_score[winner] += score
+        if self.__dataset_writer is not None and self.__game_positions:
+            self.__dataset_writer.add_game(np.stack(self.__game_positions), np.array(self.__game_turns, dtype=np.int8),
+                                           self.__game_state.get_winner_score())
+        self.__game_positions, self.__game_turns = [], []
+        if self.__position_store is not None:
+            self.__position_store.flush()
         # self.__starting_player_color = winner
 
     def _play_turn(self) -> None:
@@ -144,8 +168,14 @@ class GameManager:
 
     def _get_new_state(self) -> GameState:
         copy_state = copy(self.__game_state)
-        new_state = self.__policies[self.__game_state.turn_color].choose_play(copy_state,
-                                                                              set(self.__game_state.reachable_states))
+        if self.__position_store is not None:
+            reachable_states = self.__position_store.reachable_states(self.__game_state)
+        else:
+            reachable_states = self.__game_state.reachable_states
+        new_state = self.__policies[self.__game_state.turn_color].choose_play(copy_state, set(reachable_states))
+        if self.__dataset_writer is not None:
+            self.__game_positions.append(Position.from_board(new_state.board))
+            self.__game_turns.append(new_state.turn_color.value)
         return new_state
 
     def _choose_starting_player(self) -> PlayerColor:
@@ -1,10 +1,8 @@
 from typing import Callable, Set
 
-import numpy as np
-
 from src.agents.learning.replay_buffer import ReplayBuffer
 from src.game.core.game_state import GameState
-from src.game.core.utils import GameUtils
+from src.game.core.position import Position
 
 
 class Policy:
@@ -26,7 +24,6 @@ class CollectPolicy(Policy):
 
     def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
         new_state = super().choose_play(game_state, reachable_states)
-        input_vec = GameUtils.extract_features(new_state)
-        input_tensor = np.reshape(input_vec, (1, -1))
-        self.replay_buffer.add(input_tensor, new_state.turn_color)
+        # stored compact, the features are expanded when the buffer is read
+        self.replay_buffer.add(Position.from_board(new_state.board), new_state.turn_color)
         return new_state
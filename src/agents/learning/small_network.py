@@ -0,0 +1,26 @@
+# model parameters
+import os
+
+from src.agents.learning.checkpointing import load_weights_file
+from src.agents.learning.q_network import QNetwork
+
+N_INPUTS = 198  # the size of the input vector (using Gerald Tesauro specification)
+N_NEURONS = 256
+
+# a shallow and wide student of medium_network, trained by distillation.py
+HIDDEN_LAYERS_SHAPE = [N_NEURONS]
+STUDENT_WEIGHTS_FILE = 'src/agents/learning/checkpoints/student.npz'
+
+
+def create_student() -> QNetwork:
+    return QNetwork(N_INPUTS, HIDDEN_LAYERS_SHAPE, 1)
+
+
+def load_student(path=STUDENT_WEIGHTS_FILE) -> QNetwork:
+    """ A student network with the distilled weights of [path] (untrained if there are none)."""
+    student = create_student()
+    if os.path.exists(path):
+        student.model.set_weights(load_weights_file(path))
+    else:
+        print(f"No student weights at {path}, the student is untrained")
+    return student
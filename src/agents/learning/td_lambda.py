@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable, Set
+
+import numpy as np
+import tensorflow as tf
+
+from src.agents.agent import Agent
+from src.agents.learning.checkpointing import AsyncCheckpointer
+from src.agents.learning.game_manager import GameManager
+from src.agents.learning.policy import Policy
+from src.agents.learning.q_network import QNetwork
+from src.game.core.game_state import GameState
+from src.game.core.utils import GameUtils
+
+
+class TDLambdaLearner:
+    """
+    Online TD(lambda) with eligibility traces, updating the network after every play instead of replaying the game.
+
+    After every play, with V the network's score of the position reached:
+        delta = V(s_t) - V(s_t-1)                 (at the end of the game: reward - V(s_T))
+        weights += learning_rate * delta * traces
+        traces = lambda * traces + grad V(s_t)
+    The traces are variables shaped like the trainable variables, and every update is a single compiled call.
+    """
+
+    def __init__(self, q_network: QNetwork, learning_rate=0.01, trace_decay=0.7):
+        """
+        :param trace_decay: the lambda of TD(lambda).
+        """
+        self.q_network = q_network
+        self.learning_rate = learning_rate
+        self.trace_decay = trace_decay
+        self.__variables = q_network.model.trainable_variables
+        self.__traces = [tf.Variable(tf.zeros_like(variable), trainable=False) for variable in self.__variables]
+        self.__previous_value = tf.Variable(0.0, trainable=False)
+        self.updates = 0
+
+    def start_game(self) -> None:
+        for trace in self.__traces:
+            trace.assign(tf.zeros_like(trace))
+        self.__previous_value.assign(0.0)
+
+    def observe(self, state: GameState) -> float:
+        """ Learn from the position reached by a play, returns its score."""
+        features = np.reshape(GameUtils.extract_features(state), (1, -1)).astype(np.float32)
+        self.updates += 1
+        return float(self._step(tf.convert_to_tensor(features)))
+
+    def end_game(self, reward: float) -> None:
+        """ The last update, towards the game result (from black's point of view)."""
+        self._final_step(tf.constant(reward, dtype=tf.float32))
+        self.updates += 1
+
+    @tf.function(input_signature=[tf.TensorSpec([1, 198], tf.float32)])
+    def _step(self, features):
+        with tf.GradientTape() as tape:
+            value = self.q_network.model(features)[0, 0]
+        gradients = tape.gradient(value, self.__variables)
+        # the traces are zero at the start of a game, so the first play only fills them
+        delta = value - self.__previous_value
+        for variable, trace, gradient in zip(self.__variables, self.__traces, gradients):
+            variable.assign_add(self.learning_rate * delta * trace)
+            trace.assign(self.trace_decay * trace + gradient)
+        self.__previous_value.assign(value)
+        return value
+
+    @tf.function(input_signature=[tf.TensorSpec([], tf.float32)])
+    def _final_step(self, reward):
+        delta = reward - self.__previous_value
+        for variable, trace in zip(self.__variables, self.__traces):
+            variable.assign_add(self.learning_rate * delta * trace)
+
+
+class TDLambdaPolicy(Policy):
+    """ A policy that feeds the position after every play it chooses to a TDLambdaLearner."""
+
+    def __init__(self, choose_action: Callable, agent_nickname: str, learner: TDLambdaLearner) -> None:
+        super().__init__(choose_action, agent_nickname)
+        self.learner = learner
+
+    def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        new_state = super().choose_play(game_state, reachable_states)
+        self.learner.observe(new_state)
+        return new_state
+
+
+def train(q_network: QNetwork, black_agent: Agent, white_agent: Agent, n_episodes: int,
+          learning_rate=0.01, trace_decay=0.7, save_every=10) -> None:
+    """ Self-play training with online TD(lambda), the weights are saved every [save_every] episodes."""
+    learner = TDLambdaLearner(q_network, learning_rate, trace_decay)
+    checkpointer = AsyncCheckpointer(every_steps=save_every)
+    first_episode = checkpointer.restore(q_network) or 0
+    env = GameManager(TDLambdaPolicy(white_agent.choose_play, white_agent.nickname(), learner),
+                      TDLambdaPolicy(black_agent.choose_play, black_agent.nickname(), learner))
+    for episode in range(first_episode, first_episode + n_episodes):
+        start_time = time.time()
+        learner.start_game()
+        n_of_plays = env.play_episode()
+        _, reward = env.get_reward()
+        learner.end_game(float(reward))
+        print(f"Episode {episode}: {n_of_plays} plays, reward {float(reward)}, "
+              f"it took {time.time() - start_time:.1f} seconds")
+        checkpointer.maybe_save(q_network, episode + 1)
+    checkpointer.close()
+
+
+if __name__ == '__main__':
+    from src.agents.learning.medium_network import q_network
+    from src.agents.td_agent import TDAgent
+    from src.game.core.colors import PlayerColor
+
+    parser = argparse.ArgumentParser(description="Self-play training with online TD(lambda).")
+    parser.add_argument('--n_episodes', help='The number of games to train on.', default=500, type=int)
+    parser.add_argument('--learning_rate', help='The TD learning rate (alpha).', default=0.01, type=float)
+    parser.add_argument('--trace_decay', help='The eligibility trace decay (lambda).', default=0.7, type=float)
+    args = parser.parse_args()
+    train(q_network, TDAgent(PlayerColor.BLACK), TDAgent(PlayerColor.WHITE), args.n_episodes,
+          args.learning_rate, args.trace_decay)
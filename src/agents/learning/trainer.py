@@ -1,9 +1,12 @@
 import time
+from typing import Union
 
 import numpy as np
 import os
 
 from src.agents.agent import Agent
+from src.agents.learning.checkpointing import AsyncCheckpointer
+from src.agents.learning.evaluation import BackgroundEvaluator
 from src.agents.learning.game_manager import GameManager
 from src.agents.learning.replay_buffer import ReplayBuffer
 from src.game.backgammon_cli import NoDisplay, CliDisplay
@@ -14,11 +17,32 @@ WEIGHTS_CHECKPOINT_FILE = 'src/agents/learning/checkpoints/weights_v2'
 
 
 class Trainer:
-    def __init__(self, model, black_agent: Agent, white_agent: Agent):
+    def __init__(self, model, black_agent: Agent, white_agent: Agent, vectorized_training=False,
+                 checkpointer: AsyncCheckpointer = None, evaluate_every: Union[int, None] = 5,
+                 evaluator: BackgroundEvaluator = None):
+        """
+        :param vectorized_training: train on every game with QNetwork.train_vectorized (the same update in one
+                                    compiled call) instead of QNetwork.train (a Python loop over the states).
+        :param checkpointer: saves the weights in the background, by default after every episode.
+        :param evaluate_every: run evaluate_model every this number of episodes, None to never run it.
+        :param evaluator: if given, evaluates the checkpoints in another process (instead of evaluate_model), and its
+                          scores pick the best checkpoint. One checkpoint at a time is kept for it until it is scored.
+        """
 
         self.model = model
-        # Restore the weights
-        if os.path.exists(WEIGHTS_CHECKPOINT_FILE + ".index"):
+        self.vectorized_training = vectorized_training
+        self.checkpointer = checkpointer if checkpointer is not None else AsyncCheckpointer()
+        self.step = 0
+        self.evaluate_every = evaluate_every if evaluator is None else None
+        self.evaluator = evaluator
+        if evaluator is not None:
+            evaluator.awaiting_only = True  # the checkpoints it scores are kept until their score is reported
+        # Restore the weights, from the latest snapshot or else from the TensorFlow checkpoint
+        restored_step = self.checkpointer.restore(self.model)
+        if restored_step is not None:
+            self.step = restored_step
+            print(f"Weights restored from step {restored_step}")
+        elif os.path.exists(WEIGHTS_CHECKPOINT_FILE + ".index"):
             self.model.load_weights(WEIGHTS_CHECKPOINT_FILE)
             print("Weights restored")
         else:
@@ -123,22 +147,46 @@ class Trainer:
         play_time = time.time() - start_time
         print(f"Finished playing episode {episode}, it took {play_time / 60} minutes")
         # train the model
-        self.model.train(self.replay_buffer, tensor_reward, winner)  # train model on replay buffer
-        # Save the weights
-        self.model.save_weights(WEIGHTS_CHECKPOINT_FILE)
+        if self.vectorized_training:
+            self.model.train_vectorized(self.replay_buffer, tensor_reward, winner)
+        else:
+            self.model.train(self.replay_buffer, tensor_reward, winner)  # train model on replay buffer
+        # Save the weights (in the background)
+        self.step += 1
+        # a new checkpoint awaits the evaluator when it is done with the previous one
+        await_score = self.evaluator is not None and not self.checkpointer.awaiting_score
+        self.checkpointer.maybe_save(self.model, self.step, await_score=await_score)
         # reset game and replay buffer
         self.reset()
 
     def run(self, n_episodes: int):
         """Run the training process"""
+        if self.evaluator is not None:
+            self.evaluator.start()
         for episode in range(n_episodes):
-            if episode % 5 == 0:
+            if self.evaluate_every and episode % self.evaluate_every == 0:
                 # evaluate model
                 self.evaluate_model()
                 # to normalize and smooth the function approximation
                 # self.train_on_initial()
             print("\nstarting episode", episode)
             self.train_an_episode(episode)
+            self.report_evaluations()
+        self.checkpointer.save(self.model, self.step, block=True)
+        self.report_evaluations()
+        self.checkpointer.flush()
+        if self.evaluator is not None:
+            self.evaluator.stop(timeout=0)
+            if self.checkpointer.best_step() is None:
+                print("Warning: the evaluator scored no checkpoint, no best checkpoint was saved")
+
+    def report_evaluations(self):
+        """Forward the background evaluator's new results to the checkpointer"""
+        if self.evaluator is None:
+            return
+        for metrics in self.evaluator.new_results():
+            print(f"Evaluation of step {metrics['step']}: score {metrics['score']:.3f}")
+            self.checkpointer.report_score(metrics["step"], metrics["score"])
             
 
 
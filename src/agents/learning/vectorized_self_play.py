@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from src.agents.heuristics.phases import PhaseEvaluator
+from src.agents.learning.q_network import QNetwork
+from src.agents.rollouts.light_policy import LightBoard
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+from src.game.core.utils import GameUtils
+
+# (the compact positions after every play, the player to move in each of them, the result from black's point of view)
+GameEndCallback = Callable[[np.ndarray, np.ndarray, int], None]
+
+
+class VectorizedSelfPlay:
+    """
+    Plays N games of a network against itself in lockstep.
+
+    Every step rolls the dice of all the active games, lists the candidate plays of every game on LightBoards, encodes
+    all of them in one feature batch and scores them with a single forward pass. Black plays the highest score and
+    white the lowest, like TDAgent. A finished game is reported and replaced by a new one on the spot.
+    """
+
+    def __init__(self, network: QNetwork,
+                 n_games=256,
+                 exploration=0.0,
+                 on_game_end: GameEndCallback = None,
+                 seed=None,
+                 evaluator: PhaseEvaluator = None,
+                 ):
+        """
+        :param network: scores positions from black's point of view.
+        :param exploration: the probability of playing a random candidate instead of the best one.
+        :param on_game_end: called with the trajectory of every finished game.
+        :param evaluator: if given, scores the candidates instead of the network (e.g. a PhaseEvaluator).
+        """
+        self.network = network
+        self.n_games = n_games
+        self.exploration = exploration
+        self.on_game_end = on_game_end
+        self.evaluator = evaluator
+        self.__rng = np.random.default_rng(seed)
+        self.__initial_position = Position.from_board(GameState(PlayerColor.WHITE).board)
+        self.__boards: List[LightBoard] = [self._new_game() for _ in range(n_games)]
+        self.__trajectories: List[List[np.ndarray]] = [[] for _ in range(n_games)]
+        self.__turns: List[List[int]] = [[] for _ in range(n_games)]
+        self.completed_games = 0
+        self.plies = 0
+        self.positions_evaluated = 0
+        self.wins = {color: 0 for color in PlayerColor}
+
+    def run(self, n_steps: int) -> None:
+        for _ in range(n_steps):
+            self.step()
+
+    def step(self) -> None:
+        """ Play one ply in every game."""
+        rolls = self.__rng.integers(1, 7, size=(self.n_games, 2)).tolist()
+        candidates = [board.plays(roll) for board, roll in zip(self.__boards, rolls)]
+        counts = [len(plays) for plays in candidates]
+        movers = np.repeat([board.color.value for board in self.__boards], counts)
+        positions = LightBoard.to_positions(np.array([play for plays in candidates for play in plays]), movers)
+        # after a play the opponent is to move
+        if self.evaluator is not None:
+            scores = self.evaluator.evaluate_positions(positions, -movers)
+        else:
+            scores = self.network.model(GameUtils.extract_features_batch(positions, -movers)).numpy().reshape(-1)
+        self.positions_evaluated += len(scores)
+
+        first = 0
+        for game, board in enumerate(self.__boards):
+            game_scores = scores[first:first + counts[game]] * board.color.value
+            if self.exploration and self.__rng.random() < self.exploration:
+                choice = int(self.__rng.integers(counts[game]))
+            else:
+                choice = int(np.argmax(game_scores))
+            board.points = list(candidates[game][choice])
+            self.__trajectories[game].append(positions[first + choice])
+            self.__turns[game].append(-board.color.value)
+            first += counts[game]
+            if board.is_game_ended():
+                self._finish_game(game)
+            else:
+                board.switch_turns()
+        self.plies += self.n_games
+
+    def _finish_game(self, game: int) -> None:
+        board = self.__boards[game]
+        result = board.get_winner_score()
+        self.completed_games += 1
+        self.wins[PlayerColor(int(np.sign(result)))] += 1
+        if self.on_game_end is not None:
+            self.on_game_end(np.stack(self.__trajectories[game]), np.array(self.__turns[game], dtype=np.int8), result)
+        self.__boards[game] = self._new_game()
+        self.__trajectories[game], self.__turns[game] = [], []
+
+    def _new_game(self) -> LightBoard:
+        starting_color = PlayerColor.WHITE if self.__rng.random() < 0.5 else PlayerColor.BLACK
+        return LightBoard.from_position(self.__initial_position, starting_color)
+
+
+def single_game_positions_per_second(network: QNetwork, n_plies: int) -> float:
+    """ The throughput of the current loop: one game, get_possible_plays and a forward pass per play."""
+    state, positions = GameState(PlayerColor.WHITE), 0
+    start_time = time.perf_counter()
+    for _ in range(n_plies):
+        if state.is_game_ended():
+            state = GameState(PlayerColor.WHITE)
+        state.dice.roll()
+        if not state.possible_moves:
+            state.switch_turns()
+            continue
+        states = list(state.reachable_states)
+        scores = network.get_scores(states) * state.turn_color.win_factor()
+        positions += len(states)
+        state.apply_play(states[int(np.argmax(scores))])
+    return positions / (time.perf_counter() - start_time)
+
+
+def vectorized_positions_per_second(network: QNetwork, n_games: int, n_steps: int) -> float:
+    self_play = VectorizedSelfPlay(network, n_games, seed=0)
+    self_play.step()  # warm up
+    positions = self_play.positions_evaluated
+    start_time = time.perf_counter()
+    self_play.run(n_steps)
+    return (self_play.positions_evaluated - positions) / (time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    from src.agents.learning.medium_network import q_network
+
+    parser = argparse.ArgumentParser(description="Self-play throughput of the vectorized and the single game loop.")
+    parser.add_argument('--n_games', help='The number of games played in lockstep.', default=256, type=int)
+    parser.add_argument('--n_steps', help='The number of vectorized steps to time.', default=10, type=int)
+    parser.add_argument('--single_plies', help='The number of single game plies to time.', default=20, type=int)
+    args = parser.parse_args()
+    single = single_game_positions_per_second(q_network, args.single_plies)
+    vectorized = vectorized_positions_per_second(q_network, args.n_games, args.n_steps)
+    print(f"single game loop:         {single:10.0f} positions/s")
+    print(f"vectorized ({args.n_games:4} games): {vectorized:10.0f} positions/s")
+    print(f"speedup:                  {vectorized / single:10.1f}x")
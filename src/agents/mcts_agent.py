@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import math
+import time
+from copy import copy
+from typing import Set, Callable, List, Sequence, Union, Dict
+
+import numpy as np
+
+from src.agents.agent import Agent
+from src.agents.heuristics.heuristic import HeuristicEvaluator
+from src.agents.rollouts.rollout_engine import RolloutEngine
+from src.game.core.colors import PlayerColor
+from src.game.core.dice import Dice
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+
+def heuristic_leaf_evaluator() -> tuple[Callable[[GameState], float], Callable[[List[GameState]], Sequence[float]]]:
+    """
+    A black-positive leaf evaluation: black's heuristic score minus white's (scalar and batch versions), squashed by
+    tanh into (-1, 1) so that no heuristic leaf outranks a finished game (worth 1 or 2) in the backups.
+    """
+    black, white = HeuristicEvaluator(PlayerColor.BLACK), HeuristicEvaluator(PlayerColor.WHITE)
+
+    def evaluate(state: GameState) -> float:
+        return math.tanh(black.evaluate(state.board) - white.evaluate(state.board))
+
+    def evaluate_batch(states: List[GameState]) -> Sequence[float]:
+        boards = [state.board for state in states]
+        return np.tanh(np.asarray(black.evaluate_batch(boards)) - np.asarray(white.evaluate_batch(boards)))
+    return evaluate, evaluate_batch
+
+
+def rollout_leaf_evaluator(rollout_engine: RolloutEngine, n_trials: int = None) -> Callable[[GameState], float]:
+    """ A black-positive leaf evaluation by (usually short or truncated) rollouts."""
+    def evaluate(state: GameState) -> float:
+        mover = state.turn_color.opposite()
+        return mover.win_factor() * rollout_engine.rollout(state, n_trials).mean
+    return evaluate
+
+
+class _ChanceNode:
+    """ A position after a play, before the next player rolls. Its children are the decision nodes of the rolls."""
+    __slots__ = ['state', 'visits', 'value_sum', 'children']
+
+    def __init__(self, state: GameState, prior_value: float) -> None:
+        self.state = state
+        self.visits = 1
+        self.value_sum = prior_value  # black-positive
+        self.children: Dict[int, _DecisionNode] = {}
+
+    @property
+    def mean(self) -> float:
+        return self.value_sum / self.visits
+
+
+class _DecisionNode:
+    """ A position with the dice rolled. Its children are the reachable positions, widened progressively."""
+    __slots__ = ['state', 'color', 'visits', 'candidates', 'priors', 'children']
+
+    def __init__(self, state: GameState) -> None:
+        self.state = state
+        self.color = state.turn_color  # listing the plays of a blocked position switches its turn
+        self.visits = 0
+        self.candidates: Union[List[GameState], None] = None  # expanded lazily, ordered by the prior
+        self.priors: Union[List[float], None] = None
+        self.children: List[_ChanceNode] = []
+
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search with explicit chance nodes for the 21 rolls.
+
+    * Decision nodes widen progressively: with n visits, only the ceil(widening_constant * n^widening_exponent) best
+      reachable states by the leaf evaluator are searched.
+    * Leaves are evaluated by a pluggable black-positive evaluator: the heuristic (the default), a network (e.g.
+      QNetwork.get_score and get_scores) or short rollouts (rollout_leaf_evaluator).
+    * The subtree under the chosen play is kept for the next move of the same game.
+    * The tree is limited to max_nodes nodes (give or take the nodes of one playout), when it is full the subtrees of
+      the least visited root candidates are recycled between playouts.
+    """
+    ROLLS = Dice.get_possible_rolls_with_probabilities()
+
+    def __init__(self, color: PlayerColor,
+                 leaf_evaluator: Callable[[GameState], float] = None,
+                 batch_leaf_evaluator: Callable[[List[GameState]], Sequence[float]] = None,
+                 n_playouts=200,
+                 time_limit: float = None,
+                 exploration_constant=1.0,
+                 widening_constant=1.0,
+                 widening_exponent=0.5,
+                 max_nodes=50000,
+                 seed=None,
+                 ):
+        """
+        :param leaf_evaluator: the equity of a position from black's point of view, defaults to the heuristic.
+        :param batch_leaf_evaluator: optionally, evaluates several positions at once (used to order candidates).
+        :param n_playouts: the number of playouts of a decision, ignored if time_limit is given.
+        :param time_limit: if given, search every decision for this many seconds.
+        """
+        super().__init__(color)
+        if leaf_evaluator is None:
+            leaf_evaluator, batch_leaf_evaluator = heuristic_leaf_evaluator()
+        self.leaf_evaluator = leaf_evaluator
+        self.batch_leaf_evaluator = batch_leaf_evaluator
+        self.n_playouts = n_playouts
+        self.time_limit = time_limit
+        self.exploration_constant = exploration_constant
+        self.widening_constant = widening_constant
+        self.widening_exponent = widening_exponent
+        self.max_nodes = max_nodes
+        self.n_nodes = 0
+        self.last_playouts = 0
+        self.__rng = np.random.default_rng(seed)
+        self.__roll_probabilities = [probability for _, probability in self.ROLLS]
+        self.__last_choice: Union[_ChanceNode, None] = None
+
+    def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        states = list(reachable_states)
+        if len(states) == 1:
+            self.__last_choice = None
+            return states[0]
+
+        root = self._reuse_tree(game_state) or self._new_node(_DecisionNode(copy(game_state)))
+        start_time, playouts = time.time(), 0
+        while (time.time() - start_time < self.time_limit) if self.time_limit is not None \
+                else playouts < self.n_playouts:
+            if self.n_nodes >= self.max_nodes:
+                self._recycle(root)
+            self._visit_decision(root)
+            playouts += 1
+        self.last_playouts = playouts
+
+        best_child = max(root.children, key=lambda child: child.visits)
+        self.__last_choice = best_child
+        best_key = self._key(best_child.state)
+        return next((state for state in states if self._key(state) == best_key), states[0])
+
+    def evaluation_function(self, state: GameState) -> float:
+        value = self._leaf_value(state)
+        return value if self.color == PlayerColor.BLACK else -value
+
+    def batch_evaluation_function(self, states: List[GameState]) -> Sequence[float]:
+        values = self._leaf_values(states)
+        return values if self.color == PlayerColor.BLACK else [-value for value in values]
+
+    def nickname(self) -> str:
+        return "MCTSAgent"
+
+    def _visit_decision(self, node: _DecisionNode) -> float:
+        """ One playout through a decision node, returns its black-positive value."""
+        if node.state.is_game_ended():
+            node.visits += 1
+            return float(node.state.get_winner_score())
+        if node.candidates is None:
+            self._expand(node)
+
+        allowed = min(len(node.candidates),
+                      math.ceil(self.widening_constant * (node.visits + 1) ** self.widening_exponent))
+        if len(node.children) < allowed:
+            # widen: the new child's first visit is its prior evaluation
+            index = len(node.children)
+            node.children.append(self._new_node(_ChanceNode(node.candidates[index], node.priors[index])))
+            node.visits += 1
+            return node.priors[index]
+
+        sign = node.color.win_factor()
+        log_visits = math.log(node.visits + 1)
+        child = max(node.children, key=lambda c: sign * c.mean +
+                    self.exploration_constant * math.sqrt(log_visits / c.visits))
+        value = self._visit_chance(child)
+        node.visits += 1
+        return value
+
+    def _visit_chance(self, node: _ChanceNode) -> float:
+        if node.state.is_game_ended():
+            value = float(node.state.get_winner_score())
+        else:
+            roll_index = int(self.__rng.choice(len(self.ROLLS), p=self.__roll_probabilities))
+            child = node.children.get(roll_index)
+            if child is None:
+                child_state = copy(node.state)
+                child_state.dice.roll(self.ROLLS[roll_index][0])
+                child = node.children[roll_index] = self._new_node(_DecisionNode(child_state))
+            value = self._visit_decision(child)
+        node.visits += 1
+        node.value_sum += value
+        return value
+
+    def _expand(self, node: _DecisionNode) -> None:
+        """ List the distinct reachable states of a decision node, best first for the player to move."""
+        candidates = list({self._key(state): state for state in node.state.reachable_states}.values())
+        priors = [float(value) for value in self._leaf_values(candidates)]
+        sign = node.color.win_factor()
+        order = sorted(range(len(candidates)), key=lambda i: sign * priors[i], reverse=True)
+        node.candidates = [candidates[i] for i in order]
+        node.priors = [priors[i] for i in order]
+
+    def _leaf_value(self, state: GameState) -> float:
+        if state.is_game_ended():
+            return float(state.get_winner_score())
+        return float(self.leaf_evaluator(state))
+
+    def _leaf_values(self, states: List[GameState]) -> Sequence[float]:
+        if self.batch_leaf_evaluator is None or any(state.is_game_ended() for state in states):
+            return [self._leaf_value(state) for state in states]
+        return self.batch_leaf_evaluator(states)
+
+    def _new_node(self, node):
+        self.n_nodes += 1
+        return node
+
+    def _recycle(self, root: _DecisionNode) -> None:
+        """
+        Free the subtrees of the least visited root candidates (keeping their statistics) until half the budget is
+        free. It runs between playouts, so no node on a playout's path is freed. The freed nodes are grown again if
+        the search returns to them.
+        """
+        for child in sorted(root.children, key=lambda c: c.visits):
+            if self.n_nodes < self.max_nodes // 2:
+                break
+            for grandchild in child.children.values():
+                self.n_nodes -= self._count_nodes(grandchild)
+            child.children = {}
+
+    def _reuse_tree(self, game_state: GameState) -> Union[_DecisionNode, None]:
+        """ Find the current position (after the opponent's reply) below the play chosen in the previous move."""
+        previous, self.__last_choice = self.__last_choice, None
+        if previous is None:
+            return None
+        key = self._key(game_state)
+        for opponent_node in previous.children.values():
+            for reply in opponent_node.children:
+                if self._key(reply.state) != key:
+                    continue
+                roll = sorted(game_state.dice.value)
+                roll_index = next(i for i, (rolled, _) in enumerate(self.ROLLS) if rolled == roll)
+                root = reply.children.get(roll_index)
+                if root is not None:
+                    self.n_nodes = self._count_nodes(root)
+                    return root
+        self.n_nodes = 0
+        return None
+
+    def _count_nodes(self, node) -> int:
+        children = node.children.values() if isinstance(node, _ChanceNode) else node.children
+        return 1 + sum(self._count_nodes(child) for child in children)
+
+    @staticmethod
+    def _key(state: GameState) -> int:
+        return Position.key(Position.from_board(state.board), state.turn_color)
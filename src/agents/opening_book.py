@@ -0,0 +1,177 @@
+"""
+An opening book: the best plays of the opening rolls and of the replies to them, searched offline.
+
+The book is keyed by the canonical position ID (see Position.canonical_key, so both colors share the entries) and the
+roll, and stores the compact position the play leads to in the canonical view. The builder searches every decision with
+a deep expectimax or with rollouts, spread over processes, and writes the book to a compact .npz file. OpeningBookAgent
+answers the book positions with a dictionary lookup and leaves the other positions to the agent it wraps.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from copy import copy
+from typing import Dict, List, Set, Tuple, Union
+
+import numpy as np
+
+from src.agents.agent import Agent
+from src.game.core.colors import PlayerColor
+from src.game.core.dice import Dice
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+OPENING_BOOK_FILE = 'src/agents/opening_book.npz'
+
+# (the position before the play, the PlayerColor value of the mover, the roll)
+Decision = Tuple[np.ndarray, int, Tuple[int, int]]
+
+
+def _roll_key(dice: List[int]) -> Tuple[int, int]:
+    return max(dice), min(dice)
+
+
+class OpeningBook:
+    """ The book's plays by (position ID, roll)."""
+
+    def __init__(self, keys: np.ndarray, rolls: np.ndarray, plays: np.ndarray, equities: np.ndarray) -> None:
+        """
+        :param keys: (N,) uint64 canonical position IDs.
+        :param rolls: (N, 2) the rolls, the larger die first.
+        :param plays: (N, 28) the compact positions the plays lead to, in the canonical view.
+        :param equities: (N,) the equity of every play for the mover (nan if the search does not estimate it).
+        """
+        self.keys, self.rolls, self.plays, self.equities = keys, rolls, plays, equities
+        self.__index: Dict[Tuple[int, int, int], int] = {
+            (int(key), int(roll[0]), int(roll[1])): i for i, (key, roll) in enumerate(zip(keys, rolls))}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, position: np.ndarray, turn_color: PlayerColor, dice: List[int]) -> Union[np.ndarray, None]:
+        """ The compact position the book's play leads to, or None if the position and roll are not in the book."""
+        index = self.__index.get((Position.canonical_key(position, turn_color), *_roll_key(dice)))
+        if index is None:
+            return None
+        play = self.plays[index]
+        return Position.mirror(play) if turn_color == PlayerColor.WHITE else play
+
+    def save(self, path=OPENING_BOOK_FILE) -> None:
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez_compressed(file, keys=self.keys, rolls=self.rolls, plays=self.plays, equities=self.equities)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path=OPENING_BOOK_FILE) -> OpeningBook:
+        with np.load(path) as data:
+            return OpeningBook(data["keys"], data["rolls"], data["plays"], data["equities"])
+
+
+class OpeningBookAgent(Agent):
+    """ Plays the book's plays, and asks the wrapped agent out of the book."""
+
+    def __init__(self, agent: Agent, book: OpeningBook) -> None:
+        super().__init__(agent.color)
+        self.agent = agent
+        self.book = book
+        self.hits = 0
+        self.misses = 0
+
+    def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        play = self.book.lookup(Position.from_board(game_state.board), game_state.turn_color, game_state.dice.value)
+        if play is not None:
+            for state in reachable_states:
+                if np.array_equal(Position.from_board(state.board), play):
+                    self.hits += 1
+                    return state
+        self.misses += 1
+        return self.agent.choose_play(game_state, reachable_states)
+
+    def evaluation_function(self, state: GameState):
+        return self.agent.evaluation_function(state)
+
+    def nickname(self) -> str:
+        return self.agent.nickname()
+
+
+def _search_agent(color: PlayerColor, method: str, depth: int, n_trials: int) -> Agent:
+    if method == 'rollout':
+        from src.agents.rollout_agent import RolloutAgent
+        from src.agents.rollouts.rollout_engine import RolloutEngine
+        return RolloutAgent(color, RolloutEngine(None, n_trials=n_trials))
+    from src.agents.expectimax_agent import ExpectimaxAgent
+    from src.agents.heuristics.heuristic import HeuristicEvaluator
+    heuristic = HeuristicEvaluator(color)
+    return ExpectimaxAgent(color, heuristic_function=heuristic.evaluate, max_depth=depth,
+                           batch_heuristic_function=heuristic.evaluate_batch)
+
+
+def _solve(decision: Decision, method: str, depth: int, n_trials: int) -> Tuple[np.ndarray, float]:
+    """ Search one decision, returns the position the best play leads to and its equity for the mover."""
+    position, turn, dice = decision
+    color = PlayerColor(turn)
+    state = GameState(color, Position.to_layout(position))
+    state.dice.roll(list(dice))
+    agent = _search_agent(color, method, depth, n_trials)
+    chosen = agent.choose_play(copy(state), set(state.reachable_states))
+    results = getattr(agent, 'last_results', None)
+    equity = max(result.mean for result in results) if results else np.nan
+    return Position.from_board(chosen.board), float(equity)
+
+
+def _solve_all(decisions: List[Decision], method: str, depth: int, n_processes: int, n_trials: int) \
+        -> List[Tuple[np.ndarray, float]]:
+    arguments = [(decision, method, depth, n_trials) for decision in decisions]
+    if n_processes == 1:
+        return [_solve(*argument) for argument in arguments]
+    # TensorFlow (imported by the agents) is not fork safe, so the workers are spawned
+    with mp.get_context('spawn').Pool(n_processes) as pool:
+        return pool.starmap(_solve, arguments, chunksize=1)
+
+
+def build(method='expectimax', depth=2, replies=True, n_processes=os.cpu_count(), n_trials=216) -> OpeningBook:
+    """
+    Search the 21 opening rolls and, if [replies], the 21 replies to every opening play of the book.
+    :param method: 'expectimax' (the heuristic searched [depth] plies deep) or 'rollout' ([n_trials] light rollouts).
+    """
+    rolls = [_roll_key(roll) for roll, _ in Dice.get_possible_rolls_with_probabilities()]
+    # the starting position is its own mirror, so one color covers both
+    start = Position.from_board(GameState(PlayerColor.BLACK).board)
+    entries: List[Tuple[int, Tuple[int, int], np.ndarray, float]] = []
+    openings = [(start, PlayerColor.BLACK.value, roll) for roll in rolls]
+    layers = [openings]
+    for layer_index in range(2 if replies else 1):
+        decisions = layers[layer_index]
+        start_time = time.time()
+        solutions = _solve_all(decisions, method, depth, n_processes or 1, n_trials)
+        print(f"searched {len(decisions)} decisions in {time.time() - start_time:.0f} seconds")
+        next_layer = []
+        for (position, turn, roll), (play, equity) in zip(decisions, solutions):
+            canonical_play = Position.mirror(play) if turn == PlayerColor.WHITE.value else play
+            entries.append((Position.canonical_key(position, PlayerColor(turn)), roll, canonical_play, equity))
+            next_layer += [(play, -turn, reply) for reply in rolls]
+        layers.append(next_layer)
+
+    # a reply position reached by two openings is kept once
+    unique = {(key, roll): (play, equity) for key, roll, play, equity in entries}
+    return OpeningBook(np.array([key for key, _ in unique], dtype=np.uint64),
+                       np.array([roll for _, roll in unique], dtype=np.uint8),
+                       np.stack([play for play, _ in unique.values()]).astype(np.int8),
+                       np.array([equity for _, equity in unique.values()], dtype=np.float32))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the opening book.")
+    parser.add_argument('--method', choices=['expectimax', 'rollout'], default='expectimax', type=str)
+    parser.add_argument('--depth', help='The expectimax search depth.', default=2, type=int)
+    parser.add_argument('--n_trials', help='The rollout trials per candidate play.', default=216, type=int)
+    parser.add_argument('--no_replies', help='Only search the opening rolls.', action='store_true')
+    parser.add_argument('--n_processes', default=os.cpu_count(), type=int)
+    parser.add_argument('--output', default=OPENING_BOOK_FILE, type=str)
+    args = parser.parse_args()
+    opening_book = build(args.method, args.depth, not args.no_replies, args.n_processes, args.n_trials)
+    opening_book.save(args.output)
+    print(f"{len(opening_book)} book entries saved to {args.output} ({os.path.getsize(args.output)} bytes)")
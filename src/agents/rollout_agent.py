@@ -0,0 +1,42 @@
+from typing import Set, List, Union
+
+from src.agents.agent import Agent
+from src.agents.rollouts.bandit import SuccessiveHalving, AllocationReport
+from src.agents.rollouts.rollout_engine import RolloutEngine, RolloutResult
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+
+
+class RolloutAgent(Agent):
+    """ Chooses the play with the best rollout equity, every candidate is rolled out with the same dice."""
+
+    def __init__(self, color: PlayerColor, rollout_engine: RolloutEngine, budget: int = None):
+        """
+        :param budget: if given, the total number of trials of a decision, allocated between the candidates by
+                       successive halving. Otherwise every candidate gets the engine's number of trials.
+        """
+        super().__init__(color)
+        self.rollout_engine = rollout_engine
+        self.allocator = None if budget is None else SuccessiveHalving(
+            rollout_engine.sample, budget,
+            confidence=rollout_engine.confidence,
+            granularity=2 if rollout_engine.antithetic else 1,
+        )
+        self.last_results: List[RolloutResult] = []
+        self.last_allocation: Union[AllocationReport, None] = None
+
+    def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        states = list(reachable_states)
+        if len(states) == 1:
+            return states[0]
+        if self.allocator is not None:
+            self.last_allocation = self.allocator.select(states)
+            return self.last_allocation.best
+        self.last_results = self.rollout_engine.evaluate_plays(states)
+        return states[max(range(len(states)), key=lambda i: self.last_results[i].mean)]
+
+    def evaluation_function(self, state: GameState) -> float:
+        return self.rollout_engine.rollout(state).mean
+
+    def nickname(self) -> str:
+        return "RolloutAgent"
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import math
+from statistics import NormalDist
+from typing import Callable, List, Dict
+
+import numpy as np
+
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+# (candidate, index of the first simulation, number of simulations) -> the samples of those simulations
+SampleFunction = Callable[[GameState, int, int], np.ndarray]
+
+
+def evaluation_sampler(evaluation_function: Callable[[GameState], float]) -> SampleFunction:
+    """
+    Adapt a deterministic scoring function (e.g. Agent.evaluation_function) to a sample function. Every "simulation"
+    repeats the same score, so its confidence interval is a point and the candidates separate after one round.
+    The scores are cached by position ID (states are freed after every decision and their ids reused).
+    """
+    scores: Dict[int, float] = {}
+
+    def sample(state: GameState, first_simulation: int, n_simulations: int) -> np.ndarray:
+        key = Position.key(Position.from_board(state.board), state.turn_color)
+        if key not in scores:
+            scores[key] = float(evaluation_function(state))
+        return np.full(n_simulations, scores[key])
+    return sample
+
+
+class AllocationReport:
+    def __init__(self, best: GameState, means: Dict[GameState, float], simulations: Dict[GameState, int],
+                 rounds: int) -> None:
+        self.best = best
+        self.means = means
+        self.simulations = simulations
+        self.rounds = rounds
+        self.simulations_used = sum(simulations.values())
+        # uniform allocation would have given every candidate as many simulations as the winner got
+        self.uniform_simulations = len(simulations) * simulations[best]
+        self.simulations_saved = self.uniform_simulations - self.simulations_used
+
+    def __repr__(self) -> str:
+        return f"{len(self.simulations)} candidates, {self.rounds} rounds, {self.simulations_used} simulations " \
+               f"({self.simulations_saved} saved against {self.uniform_simulations} uniformly allocated)"
+
+
+class SuccessiveHalving:
+    """
+    Splits a simulation budget between candidate plays, spending most of it on the promising ones.
+
+    Every round gives each surviving candidate as many new simulations as it already has (the first round splits the
+    budget as if the candidates were halved every round), then drops every candidate whose confidence interval's upper
+    bound falls below the leader's lower bound. The search stops once the leader's interval is separated from all the
+    others. Only when the remaining budget cannot double every survivor's simulations, the worse half is dropped.
+    At least one round is always played, even over a budget smaller than one simulation per candidate.
+    """
+
+    def __init__(self, sample_function: SampleFunction,
+                 budget: int,
+                 confidence=0.95,
+                 granularity=1,
+                 ):
+        """
+        :param sample_function: runs simulations of a candidate, e.g. RolloutEngine.sample. Higher is better.
+        :param budget: the total number of simulations.
+        :param granularity: simulations are requested in multiples of it (2 for antithetic rollouts).
+        """
+        self.sample_function = sample_function
+        self.budget = budget
+        self.granularity = granularity
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    def select(self, candidates: List[GameState]) -> AllocationReport:
+        samples: Dict[GameState, List[float]] = {candidate: [] for candidate in candidates}
+        simulations = {candidate: 0 for candidate in candidates}
+        means: Dict[GameState, float] = {}
+        alive = list(candidates)
+        n_rounds = max(1, math.ceil(math.log2(len(candidates))))
+        share = self.budget // (len(candidates) * n_rounds)
+        share = max(self.granularity, share - share % self.granularity)
+        rounds = 0
+
+        while len(alive) > 1:
+            if rounds:
+                share = simulations[alive[0]]
+                if len(alive) * share > self.budget - sum(simulations.values()):
+                    # the budget cannot double every survivor, keep the better half
+                    alive = sorted(alive, key=lambda candidate: means[candidate], reverse=True)[:len(alive) // 2]
+                    continue
+            rounds += 1
+            for candidate in alive:
+                samples[candidate].extend(self.sample_function(candidate, simulations[candidate], share))
+                simulations[candidate] += share
+
+            means = {candidate: float(np.mean(samples[candidate])) for candidate in alive}
+            half_widths = {candidate: self._half_width(samples[candidate]) for candidate in alive}
+            leader = max(alive, key=lambda candidate: means[candidate])
+            leader_lower_bound = means[leader] - half_widths[leader]
+            alive = [candidate for candidate in alive
+                     if candidate is leader or means[candidate] + half_widths[candidate] >= leader_lower_bound]
+
+        means = {candidate: float(np.mean(values)) if values else -math.inf for candidate, values in samples.items()}
+        best = max(alive, key=lambda candidate: means[candidate])
+        return AllocationReport(best, means, simulations, rounds)
+
+    def _half_width(self, values: List[float]) -> float:
+        if len(values) < 2:
+            return math.inf
+        return self.z * float(np.std(values, ddof=1)) / math.sqrt(len(values))
@@ -0,0 +1,55 @@
+import argparse
+import time
+from copy import copy
+
+from src.agents.random_agent import RandomAgent
+from src.agents.rollouts.light_policy import LightBoard, LightRandomPolicy, VectorizedRandomPolicy
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+
+
+def light_games_per_second(n_games: int) -> float:
+    policy = LightRandomPolicy(seed=0)
+    start = LightBoard.from_state(GameState(PlayerColor.WHITE))
+    start_time = time.perf_counter()
+    for _ in range(n_games):
+        policy.play_game(LightBoard(list(start.points), start.color))
+    return n_games / (time.perf_counter() - start_time)
+
+
+def vectorized_games_per_second(n_games: int, n_boards: int) -> float:
+    policy = VectorizedRandomPolicy(seed=0)
+    start_time = time.perf_counter()
+    policy.play_games(n_games, n_boards)
+    return n_games / (time.perf_counter() - start_time)
+
+
+def random_agent_games_per_second(n_games: int) -> float:
+    agents = {color: RandomAgent(color) for color in PlayerColor}
+    start_time = time.perf_counter()
+    for _ in range(n_games):
+        state = GameState(PlayerColor.WHITE)
+        while not state.is_game_ended():
+            state.dice.roll()
+            if state.possible_moves:
+                state.apply_play(agents[state.turn_color].choose_play(copy(state), set(state.reachable_states)))
+            else:
+                state.switch_turns()
+    return n_games / (time.perf_counter() - start_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Random games per second of the light policies and of RandomAgent.")
+    parser.add_argument('--light_games', help='The number of light policy games.', default=2000, type=int)
+    parser.add_argument('--vectorized_games', help='The number of vectorized policy games.', default=50000, type=int)
+    parser.add_argument('--boards', help='The number of games the vectorized policy plays at once.', default=8192,
+                        type=int)
+    parser.add_argument('--agent_games', help='The number of RandomAgent games.', default=5, type=int)
+    args = parser.parse_args()
+    light = light_games_per_second(args.light_games)
+    vectorized = vectorized_games_per_second(args.vectorized_games, args.boards)
+    agent = random_agent_games_per_second(args.agent_games)
+    print(f"LightRandomPolicy:      {light:9.1f} games/s")
+    print(f"VectorizedRandomPolicy: {vectorized:9.1f} games/s")
+    print(f"RandomAgent:            {agent:9.1f} games/s")
+    print(f"speedup:                {light / agent:9.1f}x (light), {vectorized / agent:9.1f}x (vectorized)")
@@ -0,0 +1,436 @@
+from __future__ import annotations
+
+import random
+from typing import List, Tuple, Iterator
+
+import numpy as np
+
+from src.game.core.board import Board
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+Step = Tuple[int, int]  # (source, destination) in the mover's numbering
+
+
+class LightBoard:
+    """
+    A mutable board for fast playouts, always numbered from the point of view of the player to move.
+
+    Layout (a list of 28 ints):
+    * [0] - the mover's borne off checkers.
+    * [1..24] - the points, counted from the mover's home (the mover moves down), positive for the mover's checkers
+                and negative for the opponent's.
+    * [25] - the mover's checkers on the bar.
+    * [26] - the opponent's checkers on the bar.
+    * [27] - the opponent's borne off checkers.
+
+    Moves are applied and undone in place, switch_turns mirrors the list for the other player.
+    """
+    __slots__ = ['points', 'color']
+
+    def __init__(self, points: List[int], color: PlayerColor) -> None:
+        self.points = points
+        self.color = color
+
+    @staticmethod
+    def from_position(position: np.ndarray, color: PlayerColor) -> LightBoard:
+        """ The board of a compact Position, with [color] to move."""
+        sign, opponent = color.value, color.opposite()
+        indices = LightBoard._board_indices(color)
+        bars = {PlayerColor.WHITE: int(position[Position.WHITE_BAR_INDEX]),
+                PlayerColor.BLACK: int(position[Position.BLACK_BAR_INDEX])}
+        points = [int(position[Board.goal_point_idx(color)]) * sign]
+        points += [int(position[index]) * sign for index in indices[1:25]]
+        points += [bars[color], bars[opponent], int(position[Board.goal_point_idx(opponent)]) * opponent.value]
+        return LightBoard(points, color)
+
+    @staticmethod
+    def from_state(state: GameState) -> LightBoard:
+        return LightBoard.from_position(Position.from_board(state.board), state.turn_color)
+
+    def to_position(self) -> np.ndarray:
+        return LightBoard.to_positions(np.array([self.points]), np.array([self.color.value]))[0]
+
+    @staticmethod
+    def to_positions(points: np.ndarray, colors: np.ndarray) -> np.ndarray:
+        """
+        A vectorized to_position.
+        :param points: (N, 28) boards in the LightBoard layout.
+        :param colors: (N,) the PlayerColor value of every board's mover.
+        :return: (N, 28) compact Positions.
+        """
+        points = np.asarray(points)
+        positions = np.zeros((len(points), Position.SIZE), dtype=np.int8)
+        white, black = colors == PlayerColor.WHITE.value, colors == PlayerColor.BLACK.value
+        # white moves down the Board indices, so its numbering is the Board's
+        positions[white, :25] = -points[white, :25]
+        positions[white, 25] = points[white, 27]
+        positions[white, Position.WHITE_BAR_INDEX] = points[white, 25]
+        positions[white, Position.BLACK_BAR_INDEX] = points[white, 26]
+        positions[black, 1:25] = points[black, 24:0:-1]
+        positions[black, 25] = points[black, 0]
+        positions[black, 0] = -points[black, 27]
+        positions[black, Position.BLACK_BAR_INDEX] = points[black, 25]
+        positions[black, Position.WHITE_BAR_INDEX] = points[black, 26]
+        return positions
+
+    def to_state(self) -> GameState:
+        return GameState(self.color, Position.to_layout(self.to_position()))
+
+    def is_game_ended(self) -> bool:
+        return self.points[0] == 15 or self.points[27] == 15
+
+    def get_winner_score(self) -> int:
+        """ The result from black's point of view, like GameState.get_winner_score (a gammon counts double)."""
+        points = self.points
+        winner, loser_borne_off = (self.color, points[27]) if points[0] == 15 else (self.color.opposite(), points[0])
+        return winner.value * (2 if loser_borne_off == 0 else 1)
+
+    def switch_turns(self) -> None:
+        points = self.points
+        self.points = [points[27]] + [-count for count in points[24:0:-1]] + [points[26], points[25], points[0]]
+        self.color = self.color.opposite()
+
+    def legal_steps(self, die: int) -> List[Step]:
+        """ The legal single checker moves of a die."""
+        points = self.points
+        if points[25]:
+            destination = 25 - die
+            return [(25, destination)] if points[destination] >= -1 else []
+
+        furthest = 24
+        while furthest and points[furthest] <= 0:
+            furthest -= 1
+        can_bear_off = furthest <= 6
+        steps = []
+        for source in range(furthest, 0, -1):
+            if points[source] > 0:
+                destination = source - die
+                if destination >= 1:
+                    if points[destination] >= -1:
+                        steps.append((source, destination))
+                elif can_bear_off and (destination == 0 or source == furthest):
+                    steps.append((source, 0))
+        return steps
+
+    def apply(self, source: int, destination: int) -> bool:
+        """ Move a checker, returns whether it hit (needed to undo the move)."""
+        points = self.points
+        points[source] -= 1
+        hit = destination > 0 and points[destination] == -1
+        if hit:
+            points[destination] = 0
+            points[26] += 1
+        points[destination] += 1  # the mover's borne off checkers are counted in [0]
+        return hit
+
+    def undo(self, source: int, destination: int, hit: bool) -> None:
+        points = self.points
+        points[destination] -= 1
+        if hit:
+            points[destination] = -1
+            points[26] -= 1
+        points[source] += 1
+
+    def max_dice(self, dice: List[int]) -> int:
+        """ The largest number of the dice that can be played, searching no further once all of them can."""
+        if not dice:
+            return 0
+        best = 0
+        for die in set(dice):
+            rest = list(dice)
+            rest.remove(die)
+            for source, destination in self.legal_steps(die):
+                hit = self.apply(source, destination)
+                used = 1 + self.max_dice(rest)
+                self.undo(source, destination, hit)
+                if used == len(dice):
+                    return used
+                best = max(best, used)
+        return best
+
+    def plays(self, dice: List[int]) -> List[List[int]]:
+        """
+        The distinct boards (in the mover's numbering, before switching turns) of all the legal plays of a roll, using
+        as many dice as possible, and the larger die when only one die of a non-double can be played.
+        """
+        is_double = dice[0] == dice[1]
+        dice = [dice[0]] * 4 if is_double else list(dice)
+        plays = {}  # board -> (number of dice played, the first die played)
+
+        def search(remaining: List[int], used: int, first_die: int, lowest_source: int) -> None:
+            found_step = False
+            for die in set(remaining):
+                rest = list(remaining)
+                rest.remove(die)
+                for source, destination in self.legal_steps(die):
+                    # the moves of a double commute, so they are generated from the furthest checker down only
+                    if is_double and source > lowest_source:
+                        continue
+                    found_step = True
+                    hit = self.apply(source, destination)
+                    search(rest, used + 1, first_die or die, source)
+                    self.undo(source, destination, hit)
+            if not found_step:
+                plays.setdefault(tuple(self.points), (used, first_die))
+
+        search(dice, 0, 0, 25)
+        most_used = max(used for used, _ in plays.values())
+        if most_used == 1 and not is_double and any(die == max(dice) for _, die in plays.values()):
+            return [list(board) for board, (_, die) in plays.items() if die == max(dice)]
+        return [list(board) for board, (used, _) in plays.items() if used == most_used]
+
+    @staticmethod
+    def _board_indices(color: PlayerColor) -> List[int]:
+        """ The Board index of every point in the mover's numbering (0 is the mover's goal)."""
+        return list(range(26)) if color == PlayerColor.WHITE else list(range(25, -1, -1))
+
+
+class LightRandomPolicy:
+    """
+    Plays a uniformly random legal checker move at a time, without listing the full plays of the roll.
+
+    A move is kept only if the rest of the roll can still be played with it, so as many dice as possible are used, and
+    when only one die of a non-double can be played the larger one is played if it can be. This is stricter than
+    GameState.get_possible_plays, which also lists plays that give up dice.
+    """
+
+    def __init__(self, seed=None):
+        self.__random = random.Random(seed)
+
+    def play(self, board: LightBoard, dice: List[int]) -> List[Step]:
+        """ Play a roll on [board] in place, returns the played steps."""
+        dice = [dice[0]] * 4 if dice[0] == dice[1] else list(dice)
+        played, longest = [], []
+        if self._play_all(board, dice, played, longest):
+            return played
+
+        # not every die can be played: play the longest partial play found, with the larger die if only one is played
+        if len(longest) == 1 and len(dice) == 2:
+            steps = board.legal_steps(max(dice)) or board.legal_steps(min(dice))
+            longest = [steps[self.__random.randrange(len(steps))]]
+        for source, destination in longest:
+            board.apply(source, destination)
+        return list(longest)
+
+    def _play_all(self, board: LightBoard, dice: List[int], played: List[Step], longest: List[Step]) -> bool:
+        """
+        A depth first search over random single moves that stops at the first play using all the dice (left applied
+        on the board). If there is none, the board is restored and [longest] holds one of the longest plays.
+        """
+        options = [(die, step) for die in set(dice) for step in board.legal_steps(die)]
+        while options:
+            die, (source, destination) = options.pop(int(self.__random.random() * len(options)))
+            hit = board.apply(source, destination)
+            played.append((source, destination))
+            rest = list(dice)
+            rest.remove(die)
+            if not rest or self._play_all(board, rest, played, longest):
+                return True
+            if len(played) > len(longest):
+                longest[:] = played
+            board.undo(source, destination, hit)
+            played.pop()
+        return False
+
+    def play_game(self, board: LightBoard, dice_sequence: Iterator[List[int]] = None, max_plies: int = None) -> int:
+        """
+        Play [board] out in place.
+        :param dice_sequence: the rolls to play, random if not given.
+        :param max_plies: if given, stop after this number of plies.
+        :return: the number of plies played.
+        """
+        plies = 0
+        while not board.is_game_ended() and (max_plies is None or plies < max_plies):
+            roll = next(dice_sequence) if dice_sequence is not None else \
+                [int(self.__random.random() * 6) + 1, int(self.__random.random() * 6) + 1]
+            self.play(board, roll)
+            board.switch_turns()
+            plies += 1
+        return plies
+
+
+class VectorizedRandomPolicy:
+    """
+    Plays N random games in lockstep, one NumPy pass per step over all the boards.
+
+    The boards are (N, 28) int8 arrays in the LightBoard layout. During a turn, the points of every board that hold
+    the mover's checkers and the points where they can land are also kept as bit masks (bit p for the point p, 25 for
+    the bar), so that finding the checkers that can move by a die is a shift and an and per board, and a move updates
+    the masks of its board instead of rescanning the points. The rules are checked on all the boards at once, like
+    LightRandomPolicy checks them on one:
+    * The first step is kept only if the other die can still be played after it, otherwise another first step is
+      tried. When no first step lets both dice be played, one step of the larger die is played (or of the smaller one
+      if the larger cannot be played).
+    * The last two steps of a double are played one at a time while they can be: a player's checkers never block each
+      other and a move never takes a checker out of its home, so a step of the die never removes a legal step of
+      another checker, and every order of the steps plays as many of them.
+    """
+    BAR = 1 << 25
+    OUTSIDE_HOME = ((1 << 26) - 1) & ~0x7F  # the points 7..24 and the bar
+    # switching turns: the new board's index i holds the old board's MIRROR[i] times MIRROR_SIGNS[i]
+    MIRROR = np.array([27] + list(range(24, 0, -1)) + [26, 25, 0])
+    MIRROR_SIGNS = np.array([1] + [-1] * 24 + [1, 1, 1], dtype=np.int8)
+    # per byte: the index of its j-th set bit, of its highest one and the number of its set bits
+    SELECT = np.array([[bit for bit in range(8) if byte >> bit & 1] + [0] * (8 - bin(byte).count("1"))
+                       for byte in range(256)], dtype=np.int64)
+    HIGHEST = np.array([max(byte.bit_length() - 1, 0) for byte in range(256)], dtype=np.int64)
+    POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+    def __init__(self, seed=None):
+        self.__rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def masks(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param points: (N, 28) int8 boards.
+        :return: the bit masks of the points 1..25 that hold the mover's checkers, and of those a checker can land on.
+        """
+        flags = np.zeros((2, len(points), 32), dtype=bool)
+        np.greater(points[:, 1:26], 0, out=flags[0, :, 1:26])
+        np.greater_equal(points[:, 1:26], -1, out=flags[1, :, 1:26])
+        # the multiplication gathers the lowest bits of the 8 flags of a word in its top byte
+        as_bytes = flags.view(np.uint64) * np.uint64(0x0102040810204080) >> np.uint64(56)
+        masks = (as_bytes[..., 0] | as_bytes[..., 1] << np.uint64(8) | as_bytes[..., 2] << np.uint64(16)
+                 | as_bytes[..., 3] << np.uint64(24)).astype(np.int64)
+        return masks[0], masks[1]
+
+    @classmethod
+    def legal_sources(cls, occupied: np.ndarray, open_points: np.ndarray, dice: np.ndarray) -> np.ndarray:
+        """ :return: the bit masks of the points (25 for the bar) a checker can be moved from by [dice]."""
+        home = (occupied & cls.OUTSIDE_HOME) == 0
+        # a landing on 0 bears off, exactly from the home points
+        legal = ((open_points | home) << dice) & occupied
+        # or from the furthest checker with a larger die
+        furthest = cls.HIGHEST[occupied & 0x7F]
+        legal |= (home & (furthest < dice)).astype(np.int64) << furthest
+        # a checker on the bar must enter first
+        return np.where(occupied & cls.BAR, legal & cls.BAR, legal)
+
+    @staticmethod
+    def apply(points: np.ndarray, boards: np.ndarray, sources: np.ndarray, dice: np.ndarray) -> np.ndarray:
+        """
+        Move one checker of every given board (distinct rows) from [sources] by [dice], in place.
+        :param points: (N, 28) C-contiguous boards.
+        :return: the destinations, 0 when bearing off.
+        """
+        destinations = np.maximum(sources - dice, 0)
+        flat, rows = points.reshape(-1), boards * points.shape[1]
+        flat[rows + sources] -= 1
+        hit = (destinations > 0) & (flat[rows + destinations] == -1)
+        flat[rows[hit] + destinations[hit]] = 0
+        flat[rows[hit] + 26] += 1
+        flat[rows + destinations] += 1  # the mover's borne off checkers are counted in [0]
+        return destinations
+
+    @staticmethod
+    def moved(occupied: np.ndarray, open_points: np.ndarray, sources: np.ndarray, destinations: np.ndarray,
+              emptied: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ :return: the masks after moving a checker, [emptied] telling whether it was the last one on its point."""
+        landed = np.where(destinations > 0, np.left_shift(1, destinations), 0)
+        return (occupied & ~(emptied.astype(np.int64) << sources)) | landed, open_points | landed
+
+    def play(self, points: np.ndarray, rolls: np.ndarray) -> np.ndarray:
+        """
+        :param points: (N, 28) boards in the LightBoard layout.
+        :param rolls: (N, 2) dice.
+        :return: (N, 28) the boards after a random legal play of every roll.
+        """
+        points = np.array(points, dtype=np.int8)
+        self._play(points, np.asarray(rolls, dtype=np.int64))
+        return points
+
+    def play_games(self, n_games: int, n_boards=8192, initial: np.ndarray = None) -> np.ndarray:
+        """
+        Play [n_games] random games, [n_boards] at a time (a finished game is replaced by a new one on the spot).
+        :param initial: the LightBoard points every game starts from, the starting position if not given.
+        :return: (n_games,) the results from the point of view of the player who moved first (a gammon counts double).
+        """
+        if initial is None:
+            initial = LightBoard.from_state(GameState(PlayerColor.WHITE)).points
+        initial = np.asarray(initial, dtype=np.int8)
+        n_boards = min(n_boards, n_games)
+        points = np.repeat(initial[None], n_boards, axis=0)
+        first_to_move = np.ones(n_boards, dtype=np.int8)  # 1 while the first player is to move, -1 otherwise
+        results, started = [], n_boards
+        while len(results) < n_games:
+            self._play(points, self.__rng.integers(1, 7, size=(len(points), 2)))
+            ended = points[:, 0] == 15
+            results.extend((np.where(points[ended, 27] == 0, 2, 1) * first_to_move[ended]).tolist())
+            points, first_to_move = np.ascontiguousarray(points[:, self.MIRROR] * self.MIRROR_SIGNS), -first_to_move
+            if ended.any():
+                # the finished boards are restarted while there are games left to start, and dropped otherwise
+                restart = np.flatnonzero(ended)[:max(n_games - started, 0)]
+                started += len(restart)
+                points[restart], first_to_move[restart] = initial, 1
+                keep = ~ended
+                keep[restart] = True
+                points, first_to_move = points[keep], first_to_move[keep]
+        return np.array(results[:n_games])
+
+    def _random_bits(self, masks: np.ndarray) -> np.ndarray:
+        """ :return: the index of a random set bit of every (non-zero) mask."""
+        # the masks' bytes, one row per byte, and how many bits are set up to every byte
+        as_bytes = np.ascontiguousarray(np.ascontiguousarray(masks, dtype="<i8").view(np.uint8).reshape(-1, 8).T)
+        counts = self.POPCOUNT[as_bytes]
+        cumulative = counts.copy()
+        for byte in range(1, 8):
+            cumulative[byte] += cumulative[byte - 1]
+        chosen = (self.__rng.random(len(masks)) * cumulative[7]).astype(np.uint8)
+        byte = np.minimum((cumulative <= chosen).sum(axis=0, dtype=np.int64), 7)
+        columns = np.arange(len(masks))
+        return 8 * byte + self.SELECT[as_bytes[byte, columns],
+                                      chosen - cumulative[byte, columns] + counts[byte, columns]]
+
+    def _step(self, points, boards, sources, dice, occupied, open_points):
+        """ Apply a step of every given board and update their masks in place."""
+        emptied = points[boards, sources] == 1
+        destinations = self.apply(points, boards, sources, dice)
+        occupied[boards], open_points[boards] = self.moved(
+            occupied[boards], open_points[boards], sources, destinations, emptied)
+
+    def _play(self, points: np.ndarray, rolls: np.ndarray) -> None:
+        """ Play every board's roll in place. :param rolls: (N, 2) dice."""
+        high, low = rolls.max(axis=1), rolls.min(axis=1)
+        doubles = high == low
+        occupied, open_points = self.masks(points)
+        legal_high = self.legal_sources(occupied, open_points, high)
+        legal_low = np.where(doubles, 0, self.legal_sources(occupied, open_points, low))  # a double's dice are one
+
+        # the candidate first steps: the bits 1..25 with the high die, 33..57 with the low die
+        candidates = legal_high | legal_low << 32
+        boards = np.flatnonzero(candidates)
+        completed = np.zeros(len(points), dtype=bool)
+        while len(boards):
+            first = self._random_bits(candidates[boards])
+            sources, with_high = first & 31, first < 32
+            first_dice = np.where(with_high, high[boards], low[boards])
+            second_dice = np.where(with_high, low[boards], high[boards])
+            legal_second = self.legal_sources(*self.moved(
+                occupied[boards], open_points[boards], sources, np.maximum(sources - first_dice, 0),
+                points[boards, sources] == 1), second_dice)
+            playable = legal_second != 0
+            played = boards[playable]
+            self._step(points, played, sources[playable], first_dice[playable], occupied, open_points)
+            self._step(points, played, self._random_bits(legal_second[playable]), second_dice[playable],
+                       occupied, open_points)
+            completed[played] = True
+            failed = boards[~playable]
+            candidates[failed] &= ~np.left_shift(1, first[~playable])
+            boards = failed[candidates[failed] != 0]
+
+        # the boards where both dice cannot be played play one step, of the larger die if it can be played
+        single = np.flatnonzero(~completed & ((legal_high | legal_low) != 0))
+        if len(single):
+            use_high = legal_high[single] != 0
+            legal = np.where(use_high, legal_high[single], legal_low[single])
+            self.apply(points, single, self._random_bits(legal), np.where(use_high, high[single], low[single]))
+
+        boards = np.flatnonzero(doubles & completed)
+        for _ in range(2):
+            legal = self.legal_sources(occupied[boards], open_points[boards], high[boards])
+            boards, legal = boards[legal != 0], legal[legal != 0]
+            if not len(boards):
+                return
+            self._step(points, boards, self._random_bits(legal), high[boards], occupied, open_points)
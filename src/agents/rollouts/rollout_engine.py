@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import itertools
+import math
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from statistics import NormalDist
+from typing import Callable, Iterator, List, Union
+
+import numpy as np
+
+from src.agents.rollouts.light_policy import LightBoard, LightRandomPolicy
+from src.game.core.colors import PlayerColor
+from src.game.core.dice import Dice
+from src.game.core.game_state import GameState
+from src.game.core.player import Player
+
+
+class RolloutResult:
+    """ The equity estimate of a position, from the point of view of the player who just moved into it."""
+
+    def __init__(self, samples: np.ndarray, confidence: float) -> None:
+        """
+        :param samples: independent equity samples (with antithetic dice, the mean of every antithetic pair).
+        :param confidence: the confidence level of the interval, e.g. 0.95.
+        """
+        self.samples = samples
+        self.confidence = confidence
+        self.mean = float(np.mean(samples))
+        self.standard_error = float(np.std(samples, ddof=1) / math.sqrt(len(samples))) if len(samples) > 1 else math.inf
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.confidence_interval = (self.mean - z * self.standard_error, self.mean + z * self.standard_error)
+
+    def __repr__(self) -> str:
+        low, high = self.confidence_interval
+        return f"{self.mean:+.3f} ({self.confidence:.0%} CI [{low:+.3f}, {high:+.3f}], {len(self.samples)} samples)"
+
+
+class RolloutEngine:
+    """
+    Estimates the equity of positions by playing them out with a playing policy.
+
+    Variance reduction:
+    * Duplicate dice - trial i uses the same dice sequence for every position, so candidate plays are compared on the
+      same luck.
+    * Quasi-random first roll - the first roll of the trials rotates over all the 36 rolls instead of being random.
+    * Antithetic dice - every odd trial plays the mirror dice (7 - die) of the trial before it, and the pair is
+      averaged into one sample.
+    """
+    ALL_ROLLS = Dice.get_all_combinations()
+
+    def __init__(self, policy_factory: Union[Callable[[PlayerColor], Player], None],
+                 n_trials=36,
+                 truncate_after: int = None,
+                 truncation_evaluator: Callable[[GameState], float] = None,
+                 quasi_random_first_roll=True,
+                 antithetic=True,
+                 n_processes=1,
+                 confidence=0.95,
+                 seed=0,
+                 ):
+        """
+        :param policy_factory: creates the agent that plays a color during the rollouts, e.g. HitterAgent. If None,
+                               the trials are played by the LightRandomPolicy on a LightBoard (much faster).
+        :param n_trials: the default number of trials per position.
+        :param truncate_after: if given, stop every trial after this number of plies and evaluate the position.
+        :param truncation_evaluator: the equity of a position from black's point of view (like QNetwork.get_score),
+                                     used to evaluate truncated trials.
+        :param n_processes: the number of processes the trials are spread over. With more than one process, the
+                            policy factory and the truncation evaluator must be picklable.
+        """
+        assert truncate_after is None or truncation_evaluator is not None, "Truncated rollouts need an evaluator"
+        assert not antithetic or n_trials % 2 == 0, "Antithetic trials come in pairs"
+        self.policy_factory = policy_factory
+        self.n_trials = n_trials
+        self.truncate_after = truncate_after
+        self.truncation_evaluator = truncation_evaluator
+        self.quasi_random_first_roll = quasi_random_first_roll
+        self.antithetic = antithetic
+        self.n_processes = n_processes
+        self.confidence = confidence
+        self.seed = seed
+        self.__policies: Union[dict[PlayerColor, Player], None] = None
+        self.__executor: Union[ProcessPoolExecutor, None] = None
+        self.__light_policy = LightRandomPolicy(seed)
+
+    def __getstate__(self):
+        # the policies and the process pool are created again in every process
+        state = self.__dict__.copy()
+        state['_RolloutEngine__policies'] = None
+        state['_RolloutEngine__executor'] = None
+        return state
+
+    def rollout(self, state: GameState, n_trials: int = None) -> RolloutResult:
+        """ Estimate the equity of the player who just moved into [state]."""
+        return self.evaluate_plays([state], n_trials)[0]
+
+    def evaluate_plays(self, states: List[GameState], n_trials: int = None) -> List[RolloutResult]:
+        """ Estimate every candidate play with the same dice sequences."""
+        n_trials = n_trials or self.n_trials
+        return [RolloutResult(self.sample(state, 0, n_trials), self.confidence) for state in states]
+
+    def sample(self, state: GameState, first_trial: int, n_trials: int) -> np.ndarray:
+        """
+        Run the trials [first_trial, first_trial + n_trials) of a position.
+        :return: the equity samples of the player who just moved into [state], one per trial (one per antithetic pair).
+        """
+        trials = list(range(first_trial, first_trial + n_trials))
+        if self.n_processes > 1:
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(self.n_processes)
+            chunks = [trials[i::self.n_processes] for i in range(self.n_processes)]
+            results = dict(itertools.chain.from_iterable(
+                self.__executor.map(self._run_trials, [state] * len(chunks), chunks)))
+            equities = np.array([results[trial] for trial in trials])
+        else:
+            equities = np.array([equity for _, equity in self._run_trials(state, trials)])
+
+        if self.antithetic:
+            assert first_trial % 2 == 0 and n_trials % 2 == 0, "Antithetic trials come in pairs"
+            return equities.reshape(-1, 2).mean(axis=1)
+        return equities
+
+    def close(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    def _run_trials(self, state: GameState, trials: List[int]) -> List[tuple[int, float]]:
+        mover = state.turn_color.opposite()
+        return [(trial, mover.win_factor() * self._play_trial(state, self._dice_sequence(trial))) for trial in trials]
+
+    def _play_trial(self, state: GameState, dice_sequence: Iterator[List[int]]) -> float:
+        """ Play one trial, returns the result (or the truncated evaluation) from black's point of view."""
+        if self.policy_factory is None:
+            return self._play_light_trial(state, dice_sequence)
+        policies = self._get_policies()
+        state = copy(state)
+        plies = 0
+        while not state.is_game_ended():
+            if self.truncate_after is not None and plies >= self.truncate_after:
+                return float(self.truncation_evaluator(state))
+            state.dice.roll(next(dice_sequence))
+            if state.possible_moves:
+                player = policies[state.turn_color]
+                state.apply_play(player.choose_play(copy(state), set(state.reachable_states)))
+            else:
+                state.switch_turns()
+            plies += 1
+        return float(state.get_winner_score())
+
+    def _play_light_trial(self, state: GameState, dice_sequence: Iterator[List[int]]) -> float:
+        board = LightBoard.from_state(state)
+        self.__light_policy.play_game(board, dice_sequence, self.truncate_after)
+        if not board.is_game_ended():
+            return float(self.truncation_evaluator(board.to_state()))
+        return float(board.get_winner_score())
+
+    def _dice_sequence(self, trial: int) -> Iterator[List[int]]:
+        """ The dice of a trial, the same for every position (duplicate dice)."""
+        base_trial, is_mirrored = (trial // 2, trial % 2 == 1) if self.antithetic else (trial, False)
+        rng = np.random.default_rng([self.seed, base_trial])
+        first_roll = self.ALL_ROLLS[base_trial % len(self.ALL_ROLLS)] if self.quasi_random_first_roll else None
+        while True:
+            roll = first_roll or rng.integers(1, 7, size=2).tolist()
+            first_roll = None
+            yield [7 - die for die in roll] if is_mirrored else roll
+
+    def _get_policies(self) -> dict[PlayerColor, Player]:
+        if self.__policies is None:
+            self.__policies = {color: self.policy_factory(color) for color in PlayerColor}
+        return self.__policies
@@ -0,0 +1,53 @@
+import argparse
+
+from src.agents.heuristics.heuristic import HeuristicEvaluator
+from src.agents.search.lazy_smp import LazySMPExpectimaxAgent
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+
+# (turn color, layout, dice) of the fixed reference positions
+REFERENCE_POSITIONS = {
+    "opening": (PlayerColor.WHITE, None, [3, 1]),
+    "middle_game": (PlayerColor.WHITE, {1: 2, 4: -2, 5: -2, 6: -2, 8: -2, 11: -1, 12: 1, 13: -4, 17: 6, 16: 1, 19: 5,
+                                        24: -2}, [6, 4]),
+    "blitz": (PlayerColor.BLACK, {4: -2, 5: -1, 6: -3, 8: -3, 9: 2, 12: -1, 13: -3, 14: 2, 16: 3, 17: 3, 19: 5,
+                                  22: -1, 24: -1}, [5, 2]),
+}
+
+
+def create_reference_state(turn_color: PlayerColor, layout, dice) -> GameState:
+    state = GameState(turn_color, dict(layout) if layout else None)
+    state.dice.roll(dice)
+    return state
+
+
+def run_benchmark(workers_counts, max_depth: int) -> None:
+    """
+    The time to the decision and the nodes all the workers searched until then (so nodes/s spans the same time), with
+    the leaves evaluated in batches as the expectimax-agent player does.
+    """
+    print(f"{'position':<12} {'workers':>7} {'depth':>5} {'time [s]':>9} {'nodes':>9} {'nodes/s':>9}")
+    for name, (turn_color, layout, dice) in REFERENCE_POSITIONS.items():
+        for n_workers in workers_counts:
+            heuristic = HeuristicEvaluator(turn_color)
+            agent = LazySMPExpectimaxAgent(turn_color, heuristic.evaluate, max_depth=max_depth, n_workers=n_workers,
+                                           batch_heuristic_function=heuristic.evaluate_batch)
+            try:
+                children = list(create_reference_state(turn_color, layout, dice).reachable_states)
+                for depth in range(1, max_depth + 1):
+                    agent.transposition_table.clear()
+                    agent.search(children, depth)
+                    total_time = agent.last_search_time
+                    print(f"{name:<12} {n_workers:>7} {depth:>5} {total_time:>9.2f} {agent.nodes_searched:>9} "
+                          f"{agent.nodes_searched / total_time:>9.0f}")
+            finally:
+                agent.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Nodes per second and time to depth of the lazy SMP expectimax.")
+    parser.add_argument('--workers', help='The numbers of workers to compare.', nargs='+', type=int,
+                        default=[1, 4, 8, 16])
+    parser.add_argument('--max_depth', help='The deepest search to time.', default=2, type=int)
+    args = parser.parse_args()
+    run_benchmark(args.workers, args.max_depth)
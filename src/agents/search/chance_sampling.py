@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import math
+from typing import Callable, List
+
+import numpy as np
+
+from src.game.core.dice import Dice
+
+
+class StratifiedRollSampler:
+    """
+    Estimates the value of a chance node from a sample of the 21 distinct rolls instead of all of them.
+
+    The rolls are split into two strata, non-doubles (probability 30/36) and doubles (probability 6/36). Rolls are
+    drawn without replacement inside each stratum, so no roll is searched twice, and the stratified mean weights each
+    stratum by its probability. The estimate is exact once every roll was drawn.
+    """
+    STRATA = [
+        (Dice.get_possible_rolls_excluding_doubles(), 30 / Dice.TOTAL_COMBINATIONS),
+        (Dice.get_possible_doubles(), 6 / Dice.TOTAL_COMBINATIONS),
+    ]
+
+    def __init__(self, sample_size: int = 10, standard_error_threshold: float = None, seed=None) -> None:
+        """
+        :param sample_size: the number of rolls to draw before checking the standard error.
+        :param standard_error_threshold: if given, keep drawing rolls until the standard error of the estimate drops
+                                         below it (or every roll was drawn).
+        """
+        self.sample_size = sample_size
+        self.standard_error_threshold = standard_error_threshold
+        self.__rng = np.random.default_rng(seed)
+
+    def estimate(self, roll_value: Callable[[List[int]], float]) -> tuple[float, float, int]:
+        """
+        :param roll_value: returns the value of the chance node after the given roll.
+        :return: the estimated value, its standard error and the number of rolls that were searched.
+        """
+        orders = [self.__rng.permutation(len(rolls)) for rolls, _ in self.STRATA]
+        values: List[List[float]] = [[] for _ in self.STRATA]
+
+        def draw(stratum: int) -> None:
+            rolls = self.STRATA[stratum][0]
+            values[stratum].append(float(roll_value(rolls[orders[stratum][len(values[stratum])]])))
+
+        for stratum, allocation in enumerate(self._proportional_allocation()):
+            for _ in range(allocation):
+                draw(stratum)
+
+        standard_error = self._standard_error(values)
+        if self.standard_error_threshold is not None:
+            while standard_error > self.standard_error_threshold:
+                stratum = self._next_stratum(values)
+                if stratum is None:
+                    break
+                draw(stratum)
+                standard_error = self._standard_error(values)
+
+        mean = sum(weight * float(np.mean(stratum_values))
+                   for (_, weight), stratum_values in zip(self.STRATA, values))
+        return mean, standard_error, sum(len(stratum_values) for stratum_values in values)
+
+    def _proportional_allocation(self) -> List[int]:
+        """ Split the sample between the strata by their probability, at least one roll from each."""
+        n_non_doubles, n_doubles = (len(rolls) for rolls, _ in self.STRATA)
+        non_doubles = min(n_non_doubles, max(1, round(self.sample_size * self.STRATA[0][1])))
+        doubles = min(n_doubles, max(1, self.sample_size - non_doubles))
+        return [non_doubles, doubles]
+
+    def _standard_error(self, values: List[List[float]]) -> float:
+        variance = 0.0
+        for (rolls, weight), stratum_values in zip(self.STRATA, values):
+            n = len(stratum_values)
+            if n == len(rolls):
+                continue  # the whole stratum is known exactly
+            if n < 2:
+                return math.inf
+            finite_population_correction = 1 - n / len(rolls)
+            variance += weight ** 2 * finite_population_correction * float(np.var(stratum_values, ddof=1)) / n
+        return math.sqrt(variance)
+
+    def _next_stratum(self, values: List[List[float]]):
+        """ The stratum whose next roll reduces the variance the most (Neyman allocation), None if all were drawn."""
+        best_stratum, best_gain = None, -1.0
+        for stratum, ((rolls, weight), stratum_values) in enumerate(zip(self.STRATA, values)):
+            n = len(stratum_values)
+            if n == len(rolls):
+                continue
+            if n < 2:
+                return stratum
+            gain = weight ** 2 * float(np.var(stratum_values, ddof=1)) / (n * (n + 1))
+            if gain > best_gain:
+                best_stratum, best_gain = stratum, gain
+        return best_stratum
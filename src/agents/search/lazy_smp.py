@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import multiprocessing
+import time
+from typing import Set, Callable, List, Sequence, Union
+
+import numpy as np
+
+from src.agents.expectimax_agent import ExpectimaxAgent
+from src.agents.heuristics.phases import PhaseEvaluator
+from src.agents.search.transposition_table import SharedTranspositionTable
+from src.game.core.board import Board
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+
+
+class _SearchStopped(Exception):
+    pass
+
+
+class _LazySMPWorker(ExpectimaxAgent):
+    """
+    An ExpectimaxAgent that gives up its search as soon as another worker finished it: every node checks that the
+    search generation it was started for is still the current one, and publishes the worker's nodes count so far.
+    """
+    generation = 0
+    worker_index = 0
+
+    def _expectimax_value(self, state: GameState, player: PlayerColor, depth) -> float:
+        if _generation.value != self.generation:
+            raise _SearchStopped()
+        _nodes[self.worker_index] = self.nodes_searched
+        return super()._expectimax_value(state, player, depth)
+
+
+# worker process globals, set by the pool initializer
+_worker_agent: Union[_LazySMPWorker, None] = None
+_generation = None
+_nodes = None
+
+
+def _init_worker(agent: _LazySMPWorker, generation, nodes) -> None:
+    global _worker_agent, _generation, _nodes
+    _worker_agent, _generation, _nodes = agent, generation, nodes
+
+
+def _search_root(worker_index: int, generation: int, depth: int, children: List[GameState]):
+    """
+    Search all the root children. Every other worker searches one ply deeper and every worker but the first one
+    searches the children in a shuffled order, so the workers spread over the tree and fill the shared table for each
+    other: the deeper entries answer the shallower searches' probes.
+    :return: (values in the original children order or None if stopped, number of searched nodes, searched depth)
+    """
+    depth += worker_index % 2
+    _worker_agent.max_depth = depth
+    _worker_agent.nodes_searched = 0
+    _worker_agent.generation, _worker_agent.worker_index = generation, worker_index
+    values = [0.0] * len(children)
+    order = np.random.default_rng().permutation(len(children)) if worker_index else range(len(children))
+    try:
+        for i in order:
+            values[i] = _worker_agent._expectimax_value(children[i], _worker_agent.color, depth=1)
+    except _SearchStopped:
+        return None, _worker_agent.nodes_searched, depth
+    _nodes[worker_index] = _worker_agent.nodes_searched
+    return values, _worker_agent.nodes_searched, depth
+
+
+def _star_search_root(args):
+    return _search_root(*args)
+
+
+class LazySMPExpectimaxAgent(ExpectimaxAgent):
+    """
+    An ExpectimaxAgent that searches every decision with several processes sharing one transposition table.
+    All the workers search the whole root, half of them one ply deeper, and the first one to finish (at the requested
+    depth or deeper) gives the decision and stops the others: the search returns at once and the others give up at
+    their next node. nodes_searched counts the nodes of all the workers up to that moment.
+    """
+
+    def __init__(self, color: PlayerColor,
+                 heuristic_function: Callable[[Board], float],
+                 max_depth=1,
+                 dice_sample_size=36,
+                 n_workers=4,
+                 table_size=2 ** 20,
+                 sampling_depth=1,
+                 standard_error_threshold: float = None,
+                 seed=None,
+                 batch_heuristic_function: Callable[[List[Board]], Sequence[float]] = None,
+                 evaluator: PhaseEvaluator = None,
+                 ):
+        """ The search settings are those of ExpectimaxAgent, every worker searches with them."""
+        super().__init__(color, heuristic_function, max_depth, dice_sample_size,
+                         SharedTranspositionTable(table_size), sampling_depth, standard_error_threshold, seed,
+                         batch_heuristic_function, evaluator)
+        self.n_workers = n_workers
+        self.__seed = seed
+        self.last_search_time = 0.0
+        # the current search, a worker stops when it changes, and the nodes count of every worker in it
+        self.__generation = multiprocessing.RawValue('q', 0)
+        self.__nodes = multiprocessing.RawArray('q', n_workers)
+        self.__pool = None
+
+    def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        children = list(reachable_states)
+        values = self.search(children, self.max_depth)
+        return children[values.index(max(values))]
+
+    def search(self, children: List[GameState], depth: int) -> List[float]:
+        """ Search the root children to the given depth, return their values in the same order."""
+        if self.__pool is None:
+            worker_agent = _LazySMPWorker(self.color, self.heuristic_function, self.max_depth,
+                                          self.dice_sample_size, self.transposition_table, self.sampling_depth,
+                                          self.roll_sampler.standard_error_threshold, self.__seed,
+                                          self.batch_heuristic_function, self.evaluator)
+            self.__pool = multiprocessing.Pool(self.n_workers, initializer=_init_worker,
+                                               initargs=(worker_agent, self.__generation, self.__nodes))
+        start_time = time.time()
+        # a new generation also stops the stragglers of the previous search, if any are still running
+        self.__generation.value += 1
+        self.__nodes[:] = [0] * self.n_workers
+        tasks = [(i, self.__generation.value, depth, children) for i in range(self.n_workers)]
+        for values, _, _ in self.__pool.imap_unordered(_star_search_root, tasks):
+            if values is not None:
+                self.__generation.value += 1
+                self.last_search_time = time.time() - start_time
+                self.nodes_searched = sum(self.__nodes)
+                return values
+
+    def close(self) -> None:
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool = None
+        self.transposition_table.close()
+
+    def nickname(self) -> str:
+        return "LazySMPExpectimaxAgent"
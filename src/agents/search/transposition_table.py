@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import struct
+from multiprocessing import shared_memory
+from typing import Union
+
+import numpy as np
+
+
+class SharedTranspositionTable:
+    """
+    A fixed size hash table of search results that lives in shared memory, so several search processes can read
+    and write the same entries ("lazy SMP").
+
+    Every entry is two 64-bit words: the data word (float32 value, remaining depth, a sampled bit for the estimates of
+    sampled chance nodes, and an occupied bit so that an entry with a 0 value and depth is not mistaken for an empty
+    slot) and the position key xor-ed with the data word.
+    A torn entry (two processes writing the same slot at once) fails the xor check on probe and is treated as a miss,
+    so no locks are needed.
+    """
+    ENTRY_SIZE = 16
+    OCCUPIED = 1 << 63
+    SAMPLED = 1 << 62
+    DEPTH_MASK = (1 << 30) - 1
+
+    def __init__(self, n_entries: int = 2 ** 20, name: str = None) -> None:
+        """
+        :param n_entries: the number of entries, must be a power of two.
+        :param name: the name of an existing table to attach to, or None to create a new one.
+        """
+        assert n_entries > 0 and n_entries & (n_entries - 1) == 0, "The number of entries must be a power of two"
+        self.__n_entries = n_entries
+        self.__is_owner = name is None
+        if self.__is_owner:
+            self.__shm = shared_memory.SharedMemory(create=True, size=n_entries * self.ENTRY_SIZE)
+        else:
+            self.__shm = shared_memory.SharedMemory(name=name)
+        self.__table = np.ndarray((n_entries, 2), dtype=np.uint64, buffer=self.__shm.buf)
+        if self.__is_owner:
+            self.__table.fill(0)
+        self.probes = 0
+        self.hits = 0
+
+    def __reduce__(self):
+        # pickling (e.g. into a worker process) attaches to the same shared memory instead of copying it
+        return SharedTranspositionTable, (self.__n_entries, self.__shm.name)
+
+    def __len__(self) -> int:
+        return self.__n_entries
+
+    @property
+    def name(self) -> str:
+        return self.__shm.name
+
+    def probe(self, key: int, depth: int, exact=True) -> Union[float, None]:
+        """
+        Return the stored value of the position if it was searched at least [depth] plies deep, else None.
+        :param exact: only accept values searched over every roll, not the estimates of sampled chance nodes.
+        """
+        self.probes += 1
+        check, data = self.__table[key & (self.__n_entries - 1)]
+        check, data = int(check), int(data)
+        if check ^ data != key or not data & self.OCCUPIED or (exact and data & self.SAMPLED):
+            return None
+        value, stored_depth = self._unpack(data)
+        if stored_depth < depth:
+            return None
+        self.hits += 1
+        return value
+
+    def store(self, key: int, depth: int, value: float, exact=True) -> None:
+        """
+        Store a value, replacing the slot unless it holds the same position searched deeper (or as deep and exactly,
+        when the new value is an estimate).
+        :param exact: False for the estimates of sampled chance nodes.
+        """
+        slot = key & (self.__n_entries - 1)
+        check, data = self.__table[slot]
+        check, data = int(check), int(data)
+        if check ^ data == key and data & self.OCCUPIED:
+            stored_depth, stored_exact = self._unpack(data)[1], not data & self.SAMPLED
+            if stored_depth > depth or (stored_depth == depth and stored_exact and not exact):
+                return
+        new_data = int.from_bytes(struct.pack('<fI', value, depth & self.DEPTH_MASK), 'little') | self.OCCUPIED
+        if not exact:
+            new_data |= self.SAMPLED
+        self.__table[slot, 1] = new_data
+        self.__table[slot, 0] = key ^ new_data
+
+    def _unpack(self, data: int) -> tuple[float, int]:
+        value, depth = struct.unpack('<fI', data.to_bytes(8, 'little'))
+        return value, depth & self.DEPTH_MASK
+
+    def clear(self) -> None:
+        self.__table.fill(0)
+
+    def close(self) -> None:
+        """ Detach from the shared memory, the creating process also frees it."""
+        self.__table = None
+        self.__shm.close()
+        if self.__is_owner:
+            self.__shm.unlink()
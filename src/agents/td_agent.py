@@ -1,27 +1,45 @@
-from typing import Set
+from typing import Set, List, Sequence
 
 from src.agents.agent import Agent
 from src.agents.expectimax_agent import ExpectimaxAgent
+from src.agents.heuristics.phases import PhaseEvaluator
 from src.game.core.colors import PlayerColor
 
 from src.game.core.game_state import GameState
 from src.game.core.move import Move
 from src.agents.learning.medium_network import q_network
+from src.agents.learning.q_network import QNetwork
 
 
 class TDAgent(Agent):
-    def __init__(self, color: PlayerColor):
+    def __init__(self, color: PlayerColor, network: QNetwork = None, evaluator: PhaseEvaluator = None):
+        """
+        :param network: the network to play with, medium_network's by default (e.g. small_network.load_student()).
+        :param evaluator: if given, scores the states instead of the network (e.g. a PhaseEvaluator whose contact
+                          evaluator is the network).
+        """
         # super().__init__(color, q_network.get_score, max_depth)
         super().__init__(color)
+        self.network = network if network is not None else q_network
+        self.evaluator = evaluator
 
     def choose_play(self, game_state: GameState, reachable_states: Set[GameState]) -> GameState:
+        states = list(reachable_states)
+        scores = self.batch_evaluation_function(states)
         if self.color == PlayerColor.BLACK:
-            return max(reachable_states, key=lambda state: self.evaluation_function(state))
+            return states[max(range(len(states)), key=lambda i: scores[i])]
         else:
-            return min(reachable_states, key=lambda state: self.evaluation_function(state))
+            return states[min(range(len(states)), key=lambda i: scores[i])]
 
     def evaluation_function(self, state: GameState):
-        return q_network.get_score(state)
+        if self.evaluator is not None:
+            return self.evaluator.evaluate_state(state)
+        return self.network.get_score(state)
+
+    def batch_evaluation_function(self, states: List[GameState]) -> Sequence[float]:
+        if self.evaluator is not None:
+            return self.evaluator.evaluate_states(states)
+        return self.network.get_scores(states)
 
     def nickname(self) -> str:
         return "TempDiffAgent"
@@ -7,7 +7,7 @@ from src.game.core.colors import PlayerColor
 
 class Bar:
     def __init__(self, number_of_checkers: tuple[int, int] = None) -> None:
-        self.__counter: dict[PlayerColor, int] = defaultdict(lambda: 0)
+        self.__counter: dict[PlayerColor, int] = defaultdict(int)
         if number_of_checkers is not None:
             self.__counter[PlayerColor.BLACK] += number_of_checkers[0]
             self.__counter[PlayerColor.WHITE] += number_of_checkers[1]
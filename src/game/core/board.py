@@ -21,8 +21,8 @@ class Board:
             self.__bar: Bar = Bar()
         self.__points: List[Point] = self._init_points(initial_layout)
         self.__points_locations: dict[PlayerColor, SortedList] = {
-            PlayerColor.WHITE: self._init_white_points_locations(),
-            PlayerColor.BLACK: self.__init_black_points_locations()
+            PlayerColor.WHITE: self._init_white_points_locations(initial_layout),
+            PlayerColor.BLACK: self.__init_black_points_locations(initial_layout)
         }
 
     def __eq__(self, other: Board):
@@ -161,18 +161,18 @@ class Board:
         return points
 
     @staticmethod
-    def _init_white_points_locations() -> SortedList:
+    def _init_white_points_locations(initial_layout: dict[int, int]) -> SortedList:
         white_pts = SortedList()
-        for i, count in Board._initial_layout().items():
-            if count < 0:
+        for i, count in initial_layout.items():
+            if count < 0 and i != Board.goal_point_idx(PlayerColor.WHITE):
                 white_pts.add(i)
         return white_pts
 
     @staticmethod
-    def __init_black_points_locations() -> SortedList:
+    def __init_black_points_locations(initial_layout: dict[int, int]) -> SortedList:
         black_pts = SortedList()
-        for i, count in Board._initial_layout().items():
-            if count > 0:
+        for i, count in initial_layout.items():
+            if count > 0 and i != Board.goal_point_idx(PlayerColor.BLACK):
                 black_pts.add(i)
         return black_pts
 
@@ -10,10 +10,13 @@ import numpy
 class Dice:
     TOTAL_COMBINATIONS = 36
 
-    def __init__(self, value: List[int, int] = None) -> None:
+    def __init__(self, value: List[int, int] = None, seed=None) -> None:
+        """
+        :param seed: seeds the rolls, so a seeded Dice rolls the same sequence every time (copies roll unseeded).
+        """
         self.__value: List[int, int] = value or []
         self.__remaining_steps: list = []
-        self.__rng = numpy.random.default_rng()
+        self.__rng = numpy.random.default_rng(seed)
 
     def __copy__(self):
         copy_dice = Dice()
@@ -54,3 +57,10 @@ class Dice:
     @staticmethod
     def get_possible_doubles() -> List[List[int]]:
         return [[i, i] for i in range(1, 7)]
+
+    @staticmethod
+    def get_possible_rolls_with_probabilities() -> List[tuple[List[int], float]]:
+        """ The 21 distinct rolls, each with the probability of rolling it (non-doubles can be rolled in two ways)."""
+        non_doubles = [(roll, 2 / Dice.TOTAL_COMBINATIONS) for roll in Dice.get_possible_rolls_excluding_doubles()]
+        doubles = [(roll, 1 / Dice.TOTAL_COMBINATIONS) for roll in Dice.get_possible_doubles()]
+        return non_doubles + doubles
@@ -68,6 +68,10 @@ class GameState:
             self.__reachable_states = set(self.get_possible_plays().keys())
         return self.__reachable_states
 
+    def set_reachable_states(self, states: set[GameState]) -> None:
+        """ Use precomputed reachable states (e.g. from a PositionStore) instead of enumerating the plays."""
+        self.__reachable_states = states
+
     def is_game_ended(self) -> bool:
         return self.board.did_white_bear_off() or self.board.did_black_bear_off()
 
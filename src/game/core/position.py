@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import numpy as np
+
+from src.game.core.board import Board
+from src.game.core.colors import PlayerColor
+
+
+class Position:
+    """
+    A compact array representation of a board, used as a key for caches and transposition tables.
+
+    Layout (int8, length 28):
+    * [0..25] - signed checkers count of every point, positive for black and negative for white
+                (the same convention as Board._initial_layout()).
+    * [26] - white checkers on the bar.
+    * [27] - black checkers on the bar.
+    """
+    SIZE = 28
+    N_POINTS = 26
+    WHITE_BAR_INDEX = 26
+    BLACK_BAR_INDEX = 27
+
+    # Zobrist keys, seeded so every process computes the same key for the same position
+    _ZOBRIST_OFFSET = 15
+    _ZOBRIST = np.random.default_rng(20220829).integers(1, 2 ** 63, size=(SIZE, 31), dtype=np.uint64)
+    _ZOBRIST_ROWS = np.arange(SIZE)
+    _WHITE_TURN_KEY = 0x5bd1e9955bd1e995
+    _WHITE_PERSPECTIVE_KEY = 0x27d4eb2f165667c5
+
+    # the color mirror: point i becomes point 25 - i with the other color's sign, and the bars are swapped
+    _MIRROR_INDICES = np.array(list(range(N_POINTS - 1, -1, -1)) + [BLACK_BAR_INDEX, WHITE_BAR_INDEX])
+    _MIRROR_SIGNS = np.array([-1] * N_POINTS + [1, 1], dtype=np.int8)
+
+    @staticmethod
+    def from_board(board: Board) -> np.ndarray:
+        position = np.zeros(Position.SIZE, dtype=np.int8)
+        for point in board.points:
+            if point.count:
+                position[point.index] = point.count * point.player_color.value
+        position[Position.WHITE_BAR_INDEX] = board.bar.count(PlayerColor.WHITE)
+        position[Position.BLACK_BAR_INDEX] = board.bar.count(PlayerColor.BLACK)
+        return position
+
+    @staticmethod
+    def to_layout(position: np.ndarray) -> dict:
+        """ The initial layout (as accepted by Board and GameState) of a compact position."""
+        layout = {index: int(count) for index, count in enumerate(position[:Position.N_POINTS]) if count}
+        if position[Position.WHITE_BAR_INDEX] or position[Position.BLACK_BAR_INDEX]:
+            layout["bar"] = (int(position[Position.BLACK_BAR_INDEX]), int(position[Position.WHITE_BAR_INDEX]))
+        return layout
+
+    @staticmethod
+    def key(position: np.ndarray, turn_color: PlayerColor, perspective: PlayerColor = None) -> int:
+        """
+        A 64-bit Zobrist key of the position and the side to move.
+        :param perspective: optionally, the color the stored value is evaluated for (e.g. the searching agent),
+                            so the same position searched by agents of both colors gets different keys.
+        """
+        key = int(np.bitwise_xor.reduce(Position._ZOBRIST[Position._ZOBRIST_ROWS,
+                                                          position.astype(np.intp) + Position._ZOBRIST_OFFSET]))
+        if turn_color == PlayerColor.WHITE:
+            key ^= Position._WHITE_TURN_KEY
+        if perspective == PlayerColor.WHITE:
+            key ^= Position._WHITE_PERSPECTIVE_KEY
+        return key
+
+    @staticmethod
+    def mirror(positions: np.ndarray) -> np.ndarray:
+        """
+        The color-mirrored twin of a position (or of (N, 28) stacked positions): white and black swapped, the points
+        flipped 1 <-> 24 and the bar and borne-off counts swapped. The twin with the other side to move is the same
+        game seen from the other side, so its scores from black's point of view are negated.
+        """
+        return positions[..., Position._MIRROR_INDICES] * Position._MIRROR_SIGNS
+
+    @staticmethod
+    def canonical(position: np.ndarray, turn_color: PlayerColor) -> tuple[np.ndarray, int]:
+        """
+        The position seen with black to move, and the sign to apply to its black's point of view scores to get the
+        scores of the given position.
+        """
+        if turn_color == PlayerColor.WHITE:
+            return Position.mirror(position), -1
+        return position, 1
+
+    @staticmethod
+    def canonical_batch(positions: np.ndarray, turns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        A vectorized canonical.
+        :param turns: (N,) the PlayerColor value of the player to move in every position.
+        :return: the (N, 28) canonical positions (black to move) and the (N,) signs.
+        """
+        white_to_move = np.asarray(turns) == PlayerColor.WHITE.value
+        canonical = np.where(white_to_move[:, None], Position.mirror(positions), positions).astype(np.int8)
+        return canonical, np.where(white_to_move, -1, 1)
+
+    @staticmethod
+    def canonical_key(position: np.ndarray, turn_color: PlayerColor, perspective: PlayerColor = None) -> int:
+        """
+        A key shared by a position and its mirrored twin, whose values are the position's values for the other color.
+        * Without [perspective], a value shared by the twins must be stored from a fixed point of view of the canonical
+          position (e.g. black's, signed back with the sign of canonical), which needs values for the two colors that
+          are opposite.
+        * With [perspective], the perspective is mirrored with the position and the values are stored as they are, so
+          the twins only share an entry between perspectives: a search for one color never meets a position and its
+          twin under the same key.
+        """
+        canonical, sign = Position.canonical(position, turn_color)
+        if sign < 0 and perspective is not None:
+            perspective = perspective.opposite()
+        return Position.key(canonical, PlayerColor.BLACK, perspective)
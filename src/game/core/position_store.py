@@ -0,0 +1,211 @@
+"""
+A persistent cache of successor lists and evaluations, in a local sqlite file shared by processes and runs.
+
+Entries are keyed by the canonical position ID (see Position.canonical_key, a position and its mirrored twin share their
+entries) plus the roll for successor lists, or plus an evaluator version for scores, so the scores of different
+networks or weights never mix. The database runs in WAL mode: any number of processes read it while one writes. Every
+connection buffers its new entries and hit counts and writes them in one transaction every [flush_every] entries. When
+the store grows past [max_entries] per table, the least frequently hit entries are evicted, the least recently hit first
+among as many hits, and the hit counts of the table are halved so that old counts do not outweigh new entries forever.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+import numpy as np
+
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+POSITION_STORE_FILE = 'src/game/core/position_store.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS successors (key INTEGER, roll INTEGER, plays BLOB, hits INTEGER, last_hit REAL,
+                                       PRIMARY KEY (key, roll)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scores (key INTEGER, version TEXT, score REAL, hits INTEGER, last_hit REAL,
+                                   PRIMARY KEY (key, version)) WITHOUT ROWID;
+"""
+
+
+def _signed(key: int) -> int:
+    """ sqlite integers are signed 64-bit."""
+    return key - 2 ** 64 if key >= 2 ** 63 else key
+
+
+def _roll(dice: List[int]) -> int:
+    return 10 * max(dice) + min(dice)
+
+
+class PositionStore:
+    """ Successor lists by (position ID, roll) and scores by (position ID, evaluator version)."""
+
+    def __init__(self, path=POSITION_STORE_FILE, max_entries=1000000, flush_every=1000, readonly=False) -> None:
+        """
+        :param max_entries: the number of entries kept in every table, the least hit ones are evicted beyond it.
+        :param readonly: only read the store (nothing is buffered or written), a store that does not exist is empty.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.readonly = readonly
+        self.hits = 0
+        self.misses = 0
+        if readonly and os.path.exists(path):
+            self.__connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+        elif readonly:
+            self.__connection = sqlite3.connect(":memory:")
+            self.__connection.executescript(_SCHEMA)
+        else:
+            self.__connection = sqlite3.connect(path, timeout=30)
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute("PRAGMA synchronous=NORMAL")
+            self.__connection.executescript(_SCHEMA)
+        self.__new_successors: Dict[Tuple[int, int], bytes] = {}
+        self.__new_scores: Dict[Tuple[int, str], float] = {}
+        self.__successor_hits: Dict[Tuple[int, int], int] = {}
+        self.__score_hits: Dict[Tuple[int, str], int] = {}
+
+    def __reduce__(self):
+        # a connection cannot be pickled, every process opens its own
+        return PositionStore, (self.path, self.max_entries, self.flush_every, self.readonly)
+
+    def get_successors(self, position: np.ndarray, turn_color: PlayerColor, dice: List[int]) \
+            -> Union[np.ndarray, None]:
+        """ The (K, 28) compact positions the plays of [dice] lead to, or None if they are not stored."""
+        canonical, sign = Position.canonical(position, turn_color)
+        entry = (_signed(Position.key(canonical, PlayerColor.BLACK)), _roll(dice))
+        plays = self.__new_successors.get(entry)
+        if plays is None:
+            row = self.__connection.execute("SELECT plays FROM successors WHERE key = ? AND roll = ?", entry).fetchone()
+            plays = None if row is None else row[0]
+        if plays is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._count_hit(self.__successor_hits, entry)
+        successors = np.frombuffer(plays, dtype=np.int8).reshape(-1, Position.SIZE)
+        return Position.mirror(successors) if sign < 0 else successors.copy()
+
+    def put_successors(self, position: np.ndarray, turn_color: PlayerColor, dice: List[int],
+                       successors: np.ndarray) -> None:
+        if self.readonly:
+            return
+        canonical, sign = Position.canonical(position, turn_color)
+        successors = Position.mirror(successors) if sign < 0 else successors
+        entry = (_signed(Position.key(canonical, PlayerColor.BLACK)), _roll(dice))
+        self.__new_successors[entry] = np.ascontiguousarray(successors, dtype=np.int8).tobytes()
+        self._maybe_flush()
+
+    def reachable_states(self, state: GameState) -> set[GameState]:
+        """
+        The reachable states of a state with rolled dice, built from the stored successors when they are stored (and
+        stored otherwise). They are also set as the state's reachable states, so it does not enumerate its plays.
+        """
+        # (listing the plays of a blocked state switches its turn)
+        position, turn_color, dice = Position.from_board(state.board), state.turn_color, list(state.dice.value)
+        successors = self.get_successors(position, turn_color, dice)
+        if successors is None:
+            states = state.reachable_states
+            self.put_successors(position, turn_color, dice,
+                                np.stack([Position.from_board(reachable.board) for reachable in states]))
+            return states
+        states = {GameState(turn_color.opposite(), Position.to_layout(successor)) for successor in successors}
+        state.set_reachable_states(states)
+        return states
+
+    def get_scores(self, positions: np.ndarray, turns: np.ndarray, version: str) -> np.ndarray:
+        """
+        :param turns: (N,) the PlayerColor value of the player to move in every position.
+        :return: (N,) the stored scores from black's point of view, nan where there is none.
+        """
+        canonical, signs = Position.canonical_batch(positions, turns)
+        keys = [_signed(Position.key(position, PlayerColor.BLACK)) for position in canonical]
+        found = {key: self.__new_scores[(key, version)] for key in keys if (key, version) in self.__new_scores}
+        missing = list({key for key in keys if key not in found})
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            query = f"SELECT key, score FROM scores WHERE version = ? AND key IN ({','.join('?' * len(chunk))})"
+            found.update(self.__connection.execute(query, [version] + chunk).fetchall())
+        scores = np.array([found.get(key, np.nan) for key in keys], dtype=float) * signs
+        n_found = int(np.count_nonzero(~np.isnan(scores)))
+        self.hits += n_found
+        self.misses += len(keys) - n_found
+        for key in found:
+            self._count_hit(self.__score_hits, (key, version))
+        return scores
+
+    def put_scores(self, positions: np.ndarray, turns: np.ndarray, scores: np.ndarray, version: str) -> None:
+        if self.readonly:
+            return
+        canonical, signs = Position.canonical_batch(positions, turns)
+        for position, score in zip(canonical, np.asarray(scores) * signs):
+            self.__new_scores[(_signed(Position.key(position, PlayerColor.BLACK)), version)] = float(score)
+        self._maybe_flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered entries and hit counts, and evict the least hit (then least recently hit) entries beyond
+        max_entries.
+        """
+        if self.readonly:
+            return
+        now = time.time()
+        with self.__connection:
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO successors VALUES (?, ?, ?, COALESCE("
+                "(SELECT hits FROM successors WHERE key = ? AND roll = ?), 1), ?)",
+                [(key, roll, plays, key, roll, now) for (key, roll), plays in self.__new_successors.items()])
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, COALESCE("
+                "(SELECT hits FROM scores WHERE key = ? AND version = ?), 1), ?)",
+                [(key, version, score, key, version, now) for (key, version), score in self.__new_scores.items()])
+            self.__connection.executemany(
+                "UPDATE successors SET hits = hits + ?, last_hit = ? WHERE key = ? AND roll = ?",
+                [(hits, now, *entry) for entry, hits in self.__successor_hits.items()])
+            self.__connection.executemany(
+                "UPDATE scores SET hits = hits + ?, last_hit = ? WHERE key = ? AND version = ?",
+                [(hits, now, *entry) for entry, hits in self.__score_hits.items()])
+            for table, columns in (("successors", "key, roll"), ("scores", "key, version")):
+                excess = self.__connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self.__connection.execute(f"DELETE FROM {table} WHERE ({columns}) IN "
+                                              f"(SELECT {columns} FROM {table} ORDER BY hits, last_hit LIMIT ?)",
+                                              (excess,))
+                    # aging: the counts of the entries that are no longer hit fade
+                    self.__connection.execute(f"UPDATE {table} SET hits = (hits + 1) / 2")
+        self.__new_successors.clear()
+        self.__new_scores.clear()
+        self.__successor_hits.clear()
+        self.__score_hits.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.__connection.close()
+
+    def _count_hit(self, hits: dict, entry: tuple) -> None:
+        if not self.readonly:
+            hits[entry] = hits.get(entry, 0) + 1
+
+    def _maybe_flush(self) -> None:
+        if len(self.__new_successors) + len(self.__new_scores) >= self.flush_every:
+            self.flush()
+
+
+def cached_evaluator(store: PositionStore, evaluator: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                     version: str) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    """
+    Wraps an evaluator of (positions, turns) (e.g. phases.network_evaluator) with the store: only the positions
+    without a stored score of [version] are evaluated, and their scores are stored.
+    """
+    def evaluate(positions: np.ndarray, turns: np.ndarray) -> np.ndarray:
+        scores = store.get_scores(positions, turns, version)
+        missing = np.isnan(scores)
+        if missing.any():
+            scores[missing] = evaluator(positions[missing], turns[missing])
+            store.put_scores(positions[missing], turns[missing], scores[missing], version)
+        return scores
+    return evaluate
@@ -2,6 +2,7 @@ import numpy as np
 
 from src.game.core.colors import PlayerColor
 from src.game.core.game_state import GameState
+from src.game.core.position import Position
 
 
 class GameUtils:
@@ -39,3 +40,25 @@ class GameUtils:
         else:
             vec[197] = 1
         return vec
+
+    @staticmethod
+    def extract_features_batch(positions: np.ndarray, turn_colors: np.ndarray) -> np.ndarray:
+        """
+        A vectorized extract_features over compact Positions.
+        :param positions: (N, 28) compact Positions.
+        :param turn_colors: (N,) the PlayerColor value of the player to move in every position.
+        :return: (N, 198) float32 feature vectors.
+        """
+        positions = np.asarray(positions, dtype=np.float32)
+        vec = np.zeros((len(positions), 198), dtype=np.float32)
+        for offset, counts in ((0, np.maximum(-positions[:, 1:25], 0)), (98, np.maximum(positions[:, 1:25], 0))):
+            units = np.stack([counts > 0, counts > 1, counts > 2, np.maximum(counts - 3, 0) / 2.0], axis=2)
+            vec[:, offset:offset + 96] = units.reshape(len(positions), 96)
+
+        vec[:, 96] = positions[:, Position.WHITE_BAR_INDEX] / 2.0
+        vec[:, 97] = np.abs(positions[:, 0]) / 15.0
+        vec[:, 194] = positions[:, Position.BLACK_BAR_INDEX] / 2.0
+        vec[:, 195] = np.abs(positions[:, 25]) / 15.0
+        vec[:, 196] = turn_colors == PlayerColor.WHITE.value
+        vec[:, 197] = turn_colors == PlayerColor.BLACK.value
+        return vec
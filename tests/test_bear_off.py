@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from src.agents.heuristics.bear_off import BearOffTable
+from src.game.core.colors import PlayerColor
+from src.game.core.position import Position
+
+
+@pytest.fixture(scope="module")
+def table():
+    return BearOffTable.build(max_checkers=4)
+
+
+def test_distributions_are_probabilities(table):
+    assert len(table.keys) == 210  # the homes of up to 4 checkers on 6 points
+    np.testing.assert_allclose(table.distributions.sum(axis=1), 1, atol=1e-6)
+    assert table.distributions[0, 0] == 1  # every checker off
+
+
+def test_small_homes(table):
+    # one checker on the 6 point misses with 1-1, 1-2, 1-3, 1-4 and 2-3 only
+    np.testing.assert_allclose(table.distributions[table._indices(np.array([[0, 0, 0, 0, 0, 1]]))][0, 1], 27 / 36)
+    # two checkers on the 1 point always take one roll, four on it take one roll with a double and two otherwise
+    np.testing.assert_allclose(table.expected_rolls(np.array([[2, 0, 0, 0, 0, 0]])), 1)
+    np.testing.assert_allclose(table.expected_rolls(np.array([[4, 0, 0, 0, 0, 0]])), 1 + 30 / 36, rtol=1e-6)
+
+
+def test_win_probability(table):
+    one_roll, two_rolls = np.array([[1, 0, 0, 0, 0, 0]]), np.array([[4, 0, 0, 0, 0, 0]])
+    np.testing.assert_allclose(table.win_probability(one_roll, one_roll), 1)
+    # the opponent on roll bears off four checkers at once with a double only
+    np.testing.assert_allclose(table.win_probability(two_rolls, one_roll), 6 / 36, rtol=1e-6)
+
+
+def test_homes_of_positions():
+    position = np.zeros((1, Position.SIZE), dtype=np.int8)
+    position[0, [1, 3, 24, 20]] = [-2, -1, 3, 1]
+    np.testing.assert_array_equal(BearOffTable.homes(position, PlayerColor.WHITE), [[2, 0, 1, 0, 0, 0]])
+    np.testing.assert_array_equal(BearOffTable.homes(position, PlayerColor.BLACK), [[3, 0, 0, 0, 1, 0]])
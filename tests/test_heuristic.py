@@ -0,0 +1,40 @@
+import random
+
+import numpy as np
+import pytest
+
+from src.agents.heuristics.heuristic import HeuristicEvaluator
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+
+def random_boards(n: int, seed: int):
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < n:
+        state = GameState(PlayerColor.WHITE)
+        while not state.is_game_ended() and len(boards) < n:
+            state.dice.roll([rng.randint(1, 6), rng.randint(1, 6)])
+            state.apply_play(rng.choice(list(state.reachable_states)))
+            if not state.is_game_ended():
+                boards.append(state.board)
+    return boards
+
+
+@pytest.mark.parametrize("color", list(PlayerColor))
+def test_evaluate_arrays_matches_evaluate(color):
+    evaluator = HeuristicEvaluator(color)
+    boards = random_boards(80, seed=color.value)
+    positions = np.stack([Position.from_board(board) for board in boards])
+    expected = [evaluator.evaluate(board) for board in boards]
+    np.testing.assert_allclose(evaluator.evaluate_arrays(positions[:, :Position.N_POINTS],
+                                                         positions[:, Position.N_POINTS:]), expected)
+    np.testing.assert_allclose(evaluator.evaluate_batch(boards), expected)
+
+
+def test_terminal_boards_are_infinite():
+    evaluator = HeuristicEvaluator(PlayerColor.WHITE)
+    won, lost = GameState(PlayerColor.WHITE, {0: -15, 24: 2}), GameState(PlayerColor.WHITE, {25: 15, 1: -2})
+    assert evaluator.evaluate(won.board) == evaluator.evaluate_batch([won.board])[0] == np.inf
+    assert evaluator.evaluate(lost.board) == evaluator.evaluate_batch([lost.board])[0] == -np.inf
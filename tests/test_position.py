@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+
+from src.agents.expectimax_agent import ExpectimaxAgent
+from src.game.core.colors import PlayerColor
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+
+def random_positions(n: int, seed: int) -> np.ndarray:
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < n:
+        state = GameState(PlayerColor.WHITE)
+        while not state.is_game_ended() and len(positions) < n:
+            state.dice.roll([rng.randint(1, 6), rng.randint(1, 6)])
+            state.apply_play(rng.choice(list(state.reachable_states)))
+            positions.append(Position.from_board(state.board))
+    return np.stack(positions)
+
+
+def test_mirror_swaps_the_colors():
+    positions = random_positions(50, seed=0)
+    mirrored = Position.mirror(positions)
+    np.testing.assert_array_equal(Position.mirror(mirrored), positions)
+    np.testing.assert_array_equal(mirrored[:, 1:25], -positions[:, 24:0:-1])
+    np.testing.assert_array_equal(mirrored[:, [0, 25]], -positions[:, [25, 0]])
+    np.testing.assert_array_equal(mirrored[:, [Position.WHITE_BAR_INDEX, Position.BLACK_BAR_INDEX]],
+                                  positions[:, [Position.BLACK_BAR_INDEX, Position.WHITE_BAR_INDEX]])
+    initial = Position.from_board(GameState(PlayerColor.WHITE).board)
+    np.testing.assert_array_equal(Position.mirror(initial), initial)
+
+
+def test_canonical_key_is_shared_by_mirrored_twins():
+    for position in random_positions(50, seed=1):
+        twin = Position.mirror(position)
+        for turn in PlayerColor:
+            key = Position.canonical_key(position, turn)
+            assert Position.canonical_key(twin, turn.opposite()) == key
+            assert Position.canonical_key(position, turn.opposite()) != key
+            for perspective in PlayerColor:
+                perspective_key = Position.canonical_key(position, turn, perspective)
+                assert Position.canonical_key(twin, turn.opposite(), perspective.opposite()) == perspective_key
+                assert Position.canonical_key(twin, turn.opposite(), perspective) != perspective_key
+
+
+def test_canonical_batch_matches_canonical():
+    positions = random_positions(50, seed=2)
+    turns = np.random.default_rng(0).choice([color.value for color in PlayerColor], size=len(positions))
+    canonical, signs = Position.canonical_batch(positions, turns)
+    for position, turn, expected_position, expected_sign in zip(positions, turns, canonical, signs):
+        canonical_position, sign = Position.canonical(position, PlayerColor(turn))
+        np.testing.assert_array_equal(canonical_position, expected_position)
+        assert sign == expected_sign
+
+
+def test_table_key_signs_mirrored_twins_oppositely():
+    # with an evaluator, the table holds black's values of the canonical positions
+    agent = ExpectimaxAgent(PlayerColor.WHITE, heuristic_function=None, evaluator=object())
+    for position in random_positions(20, seed=3):
+        for turn in PlayerColor:
+            state = GameState(turn, Position.to_layout(position))
+            twin = GameState(turn.opposite(), Position.to_layout(Position.mirror(position)))
+            for player in PlayerColor:
+                key, sign = agent._table_key(state, player)
+                twin_key, twin_sign = agent._table_key(twin, player.opposite())
+                assert key == twin_key and sign == twin_sign
+                assert agent._table_key(twin, player)[1] == -sign
@@ -0,0 +1,73 @@
+import itertools
+import random
+from copy import copy
+
+import numpy as np
+import pytest
+
+from src.agents.heuristics.shots import SHOTS_BY_DISTANCE, shots_on, shots_on_arrays
+from src.game.core.colors import PlayerColor
+from src.game.core.dice import Dice
+from src.game.core.game_state import GameState
+from src.game.core.position import Position
+
+
+def brute_force_shots(state: GameState, color: PlayerColor) -> int:
+    """ The number of rolls after which one of the plays of the side to move puts a checker of the color on the bar."""
+    on_bar = state.board.bar.count(color)
+    shots = 0
+    for roll in itertools.product(range(1, 7), repeat=2):
+        rolled = copy(state)
+        rolled.dice = Dice()
+        rolled.dice.roll(list(roll))
+        shots += any(reached.board.bar.count(color) > on_bar for reached in rolled.reachable_states)
+    return shots
+
+
+def random_positions(n: int, seed: int):
+    """ Positions of random games, the side to move is the shooter."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < n:
+        state = GameState(PlayerColor.WHITE)
+        while not state.is_game_ended() and len(positions) < n:
+            state.dice.roll([rng.randint(1, 6), rng.randint(1, 6)])
+            state.apply_play(rng.choice(list(state.reachable_states)))
+            if not state.is_game_ended() and rng.random() < 0.3:
+                positions.append((Position.from_board(state.board), state.turn_color))
+    return positions
+
+
+def with_checkers_on_bar(position: np.ndarray, color: PlayerColor, count: int, rng: random.Random) -> np.ndarray:
+    position = position.copy()
+    bar_index = Position.WHITE_BAR_INDEX if color == PlayerColor.WHITE else Position.BLACK_BAR_INDEX
+    for _ in range(count):
+        occupied = [index for index in range(1, 25) if position[index] * color.value > 0]
+        if occupied:
+            position[rng.choice(occupied)] -= color.value
+            position[bar_index] += 1
+    return position
+
+
+def assert_matches_brute_force(position: np.ndarray, shooter: PlayerColor) -> None:
+    color = shooter.opposite()
+    state = GameState(shooter, Position.to_layout(position))
+    expected = brute_force_shots(state, color)
+    assert shots_on(state.board, color) == expected
+    assert shots_on_arrays(position[None, :Position.N_POINTS], position[None, Position.N_POINTS:], color)[0] == expected
+
+
+def test_unblocked_shots_by_distance():
+    assert SHOTS_BY_DISTANCE[1:13].tolist() == [11, 12, 14, 15, 15, 17, 6, 6, 5, 3, 2, 3]
+
+
+@pytest.mark.parametrize("position, shooter", random_positions(6, seed=1))
+def test_shots_match_brute_force(position, shooter):
+    assert_matches_brute_force(position, shooter)
+
+
+@pytest.mark.parametrize("on_bar", [1, 2, 3, 4])
+def test_shots_with_the_shooter_on_the_bar_match_brute_force(on_bar):
+    rng = random.Random(on_bar)
+    for position, shooter in random_positions(10, seed=on_bar):
+        assert_matches_brute_force(with_checkers_on_bar(position, shooter, on_bar, rng), shooter)
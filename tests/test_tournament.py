@@ -0,0 +1,26 @@
+from tournament import game_tasks, pairings
+
+
+def test_duplicate_deals_share_seed_and_starting_color():
+    matches = pairings(['a', 'b', 'c'], 'round-robin')
+    tasks = game_tasks(matches, 6, seed=1, duplicate=True)
+    deals = {}
+    for pairing, white, black, seed, starting_color, first_is_white, deal in tasks:
+        deals.setdefault((pairing, deal), []).append((white, black, seed, starting_color, first_is_white))
+    assert len(deals) == len(matches) * 3
+    for (pairing, _), (first_game, second_game) in deals.items():
+        assert first_game[2:4] == second_game[2:4]
+        assert first_game[:2] == matches[pairing] and second_game[:2] == matches[pairing][::-1]
+        assert first_game[4] and not second_game[4]
+
+
+def test_duplicate_deals_differ_between_pairings_and_deals():
+    tasks = game_tasks(pairings(['a', 'b', 'c'], 'round-robin'), 6, seed=1, duplicate=True)
+    assert len({(task[0], task[3]) for task in tasks}) == len(tasks) // 2
+    assert len({task[3] for task in tasks}) == len(tasks) // 2
+
+
+def test_independent_games_get_their_own_seeds():
+    tasks = game_tasks(pairings(['a', 'b', 'c'], 'gauntlet'), 5, seed=1)
+    assert len({task[3] for task in tasks}) == len(tasks)
+    assert all(task[6] is None for task in tasks)
@@ -0,0 +1,314 @@
+"""
+A tournament between the agents of backgammon.py, played silently across a process pool.
+
+Every pairing (round-robin: every two players, gauntlet: the first player against every other one) plays [n_games]
+games, alternating the colors. Every game gets its own seed, which seeds its dice and the agents' randomness (the
+agents still break ties by the order of the reachable states set, which varies between runs). The results are
+aggregated as the games finish: wins, gammons and points of every pairing, reported as the win rate, points per game
+and Elo difference with 95% confidence intervals, and the Elo ratings of the players fitted to all the results.
+
+In duplicate mode, every seed is played twice with the colors swapped: the player who started the first game (and got
+its odd rolls) answers in the second one and gets the other half of the same dice stream. The two results of every
+deal are paired, so most of the dice luck cancels out, and the report shows the variance reduction of the points per
+game (the factor of games saved for the same confidence).
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import math
+import multiprocessing as mp
+import os
+import random
+import time
+from copy import copy
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from backgammon import create_player, players as player_types
+from src.game.core.colors import PlayerColor
+from src.game.core.dice import Dice
+from src.game.core.game_state import GameState
+from src.game.core.player import Player
+
+Z_95 = 1.96
+modes = ['round-robin', 'gauntlet']
+
+# (pairing index, white player type, black player type, seed, starting PlayerColor value, is the first player white,
+#  the index of the duplicate deal the game belongs to or None)
+GameTask = Tuple[int, str, str, int, int, bool, Union[int, None]]
+
+# the players of a worker process, created once and reused by all its games (as BackgammonCLI.run does)
+_players: Dict[Tuple[str, PlayerColor], Player] = {}
+
+
+def _player(player_type: str, color: PlayerColor) -> Player:
+    if (player_type, color) not in _players:
+        _players[(player_type, color)] = create_player(player_type, color)
+    return _players[(player_type, color)]
+
+
+def play_game(white_type: str, black_type: str, seed: int, starting_color: PlayerColor) -> int:
+    """ Play one silent game with seeded dice, returns the winner score (positive when black wins)."""
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    game_players = {PlayerColor.WHITE: _player(white_type, PlayerColor.WHITE),
+                    PlayerColor.BLACK: _player(black_type, PlayerColor.BLACK)}
+    # the state takes the dice of the chosen play every turn, so the seeded stream is kept aside
+    dice = Dice(seed=seed)
+    state = GameState(starting_color)
+    while not state.is_game_ended():
+        dice.roll()
+        state.dice.roll(dice.value)
+        if state.possible_moves:
+            state.apply_play(game_players[state.turn_color].choose_play(copy(state), set(state.reachable_states)))
+        else:
+            state.switch_turns()
+    return int(state.get_winner_score())
+
+
+def _play_task(task: GameTask) -> Tuple[int, int, Union[int, None]]:
+    """ Returns the pairing index, the points of its first player and the duplicate deal."""
+    pairing, white_type, black_type, seed, starting_color, first_is_white, deal = task
+    score = play_game(white_type, black_type, seed, PlayerColor(starting_color))
+    return pairing, -score if first_is_white else score, deal
+
+
+class MatchStats:
+    """ The results of one pairing from its first player's point of view, updated one game at a time."""
+
+    def __init__(self, first: str, second: str) -> None:
+        self.first = first
+        self.second = second
+        self.games = 0
+        self.wins = 0
+        self.gammons_won = 0
+        self.gammons_lost = 0
+        self.points = 0
+        self.points_squared = 0
+        # the duplicate deals, by the sums of the first player's points and wins in both games
+        self.deals = 0
+        self.deal_points_squared = 0
+        self.deal_wins_squared = 0
+        self.__pending_deals: Dict[int, Tuple[int, int]] = {}
+
+    def add(self, points: int, deal: int = None) -> None:
+        """ :param deal: the duplicate deal of the game, it is paired with the deal's other game when both are in."""
+        if deal is not None:
+            if deal in self.__pending_deals:
+                other_points, other_win = self.__pending_deals.pop(deal)
+                self.deals += 1
+                self.deal_points_squared += (other_points + points) ** 2
+                self.deal_wins_squared += (other_win + int(points > 0)) ** 2
+            else:
+                self.__pending_deals[deal] = (points, int(points > 0))
+        self.games += 1
+        self.wins += int(points > 0)
+        self.gammons_won += int(points >= 2)
+        self.gammons_lost += int(points <= -2)
+        self.points += points
+        self.points_squared += points ** 2
+
+    @property
+    def ppg(self) -> float:
+        return self.points / max(self.games, 1)
+
+    @property
+    def points_variance(self) -> float:
+        """ The variance of the points of a single game."""
+        if self.games < 2:
+            return math.inf
+        return max((self.points_squared - self.games * self.ppg ** 2) / (self.games - 1), 0.0)
+
+    @property
+    def ppg_interval(self) -> float:
+        """ The half width of the 95% confidence interval of the points per game, ignoring the deals."""
+        return Z_95 * math.sqrt(self.points_variance / max(self.games, 1))
+
+    @property
+    def deal_variance(self) -> float:
+        """ The variance of the points per game of a duplicate deal (the mean of its two games)."""
+        return self._deal_variance(self.deal_points_squared, self.ppg)
+
+    @property
+    def deal_win_variance(self) -> float:
+        """ The variance of the win rate of a duplicate deal."""
+        return self._deal_variance(self.deal_wins_squared, self.win_rate)
+
+    @property
+    def duplicate_ppg_interval(self) -> float:
+        """ The half width of the 95% confidence interval of the points per game, by the paired deals."""
+        return Z_95 * math.sqrt(self.deal_variance / max(self.deals, 1))
+
+    @property
+    def variance_reduction(self) -> float:
+        """
+        The variance of the points per game of independent games over the one of duplicate games: the factor of games
+        the pairing saves for the same confidence interval.
+        """
+        if self.deal_variance == 0:
+            return math.inf
+        return self.points_variance / (2 * self.deal_variance)
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / max(self.games, 1)
+
+    @property
+    def win_rate_interval(self) -> float:
+        """ The half width of the 95% confidence interval of the win rate, ignoring the deals."""
+        return Z_95 * math.sqrt(self.win_rate * (1 - self.win_rate) / max(self.games, 1))
+
+    @property
+    def duplicate_win_rate_interval(self) -> float:
+        """ The half width of the 95% confidence interval of the win rate, by the paired deals."""
+        return Z_95 * math.sqrt(self.deal_win_variance / max(self.deals, 1))
+
+    @property
+    def elo(self) -> float:
+        return elo_difference(self.win_rate)
+
+    @property
+    def elo_range(self) -> Tuple[float, float]:
+        return (elo_difference(self.win_rate - self.win_rate_interval),
+                elo_difference(self.win_rate + self.win_rate_interval))
+
+    @property
+    def duplicate_elo_range(self) -> Tuple[float, float]:
+        return (elo_difference(self.win_rate - self.duplicate_win_rate_interval),
+                elo_difference(self.win_rate + self.duplicate_win_rate_interval))
+
+    def _deal_variance(self, deal_sums_squared: int, mean: float) -> float:
+        """ The variance of the mean of a deal's two games, from the sum of the squares of their sums."""
+        if self.deals < 2:
+            return math.inf
+        # (the game of a pending deal is left out of the squares, but not of the mean)
+        return max((deal_sums_squared / 4 - self.deals * mean ** 2) / (self.deals - 1), 0.0)
+
+
+def elo_difference(win_rate: float) -> float:
+    """ The Elo difference that predicts [win_rate] (clipped, so a clean sweep is finite)."""
+    win_rate = min(max(win_rate, 1e-3), 1 - 1e-3)
+    return 400 * math.log10(win_rate / (1 - win_rate))
+
+
+def elo_ratings(names: List[str], matches: List[MatchStats], iterations=200) -> Dict[str, float]:
+    """
+    The Bradley-Terry ratings of all the results on the Elo scale, centered on 0. Every pairing gets half a win and
+    half a loss of prior, so a player without wins still has a finite rating.
+    """
+    strengths = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        for name in names:
+            wins, weight = 0.0, 0.0
+            for match in matches:
+                if name not in (match.first, match.second):
+                    continue
+                opponent = match.second if name == match.first else match.first
+                wins += (match.wins if name == match.first else match.games - match.wins) + 0.5
+                weight += (match.games + 1) / (strengths[name] + strengths[opponent])
+            strengths[name] = wins / weight if weight else 1.0
+        mean_log = np.mean([math.log10(strength) for strength in strengths.values()])
+        strengths = {name: strength / 10 ** mean_log for name, strength in strengths.items()}
+    return {name: 400 * math.log10(strength) for name, strength in strengths.items()}
+
+
+def pairings(names: List[str], mode: str) -> List[Tuple[str, str]]:
+    if mode == 'gauntlet':
+        return [(names[0], opponent) for opponent in names[1:]]
+    return list(itertools.combinations(names, 2))
+
+
+def game_tasks(matches: List[Tuple[str, str]], n_games: int, seed=None, duplicate=False) -> List[GameTask]:
+    """
+    The games of every pairing, the first player is white in every other game. The pairings are interleaved.
+    :param duplicate: every two games of a pairing are one deal: the same seed and starting color with the colors
+                      swapped, so the starting role (and the dice of every turn) goes to the other player.
+    """
+    rng = np.random.default_rng(seed)
+    tasks = []
+    # the (seed, starting color) of the current deal of every pairing, kept for the second game of the deal
+    deals: Dict[int, Tuple[int, int]] = {}
+    for game in range(n_games):
+        for index, (first, second) in enumerate(matches):
+            first_is_white = game % 2 == 0
+            white, black = (first, second) if first_is_white else (second, first)
+            if not duplicate or game % 2 == 0:
+                starting_color = int(rng.choice([PlayerColor.WHITE.value, PlayerColor.BLACK.value]))
+                deals[index] = (int(rng.integers(2 ** 62)), starting_color)
+            game_seed, starting_color = deals[index]
+            deal = game // 2 if duplicate else None
+            tasks.append((index, white, black, game_seed, starting_color, first_is_white, deal))
+    return tasks
+
+
+def run(names: List[str], mode='round-robin', n_games=100, n_processes=os.cpu_count(), seed=None,
+        report_every=100, duplicate=False) -> Tuple[List[MatchStats], float]:
+    """ Play the tournament, returns the results of every pairing and the seconds it took."""
+    assert not duplicate or n_games % 2 == 0, "A duplicate deal is two games, the number of games must be even."
+    matches = pairings(names, mode)
+    stats = [MatchStats(first, second) for first, second in matches]
+    tasks = game_tasks(matches, n_games, seed, duplicate)
+    start_time = time.time()
+
+    def on_result(pairing: int, points: int, deal: Union[int, None], done: int) -> None:
+        stats[pairing].add(points, deal)
+        if done % report_every == 0 or done == len(tasks):
+            print(f"{done}/{len(tasks)} games, {done / (time.time() - start_time):.2f} games/sec", flush=True)
+
+    if n_processes == 1:
+        for done, task in enumerate(tasks, 1):
+            on_result(*_play_task(task), done)
+    else:
+        # TensorFlow (imported by the agents) is not fork safe, so the workers are spawned
+        with mp.get_context('spawn').Pool(n_processes) as pool:
+            for done, result in enumerate(pool.imap_unordered(_play_task, tasks, chunksize=1), 1):
+                on_result(*result, done)
+    return stats, time.time() - start_time
+
+
+def report(names: List[str], stats: List[MatchStats], seconds: float) -> None:
+    games = sum(match.games for match in stats)
+    print(f"\n{games} games in {seconds:.1f} seconds ({games / seconds:.2f} games/sec), 95% confidence intervals")
+    if any(match.deals for match in stats):
+        print("(unpaired: as if the games were independent, the duplicate lines pair the games of every deal)")
+    for match in stats:
+        low, high = match.elo_range
+        print(f"{match.first:>16} vs {match.second:<16} {match.games:6} games  "
+              f"win {100 * match.win_rate:5.1f}% ±{100 * match.win_rate_interval:4.1f}  "
+              f"ppg {match.ppg:+.3f} ±{match.ppg_interval:.3f}  gammons {match.gammons_won}-{match.gammons_lost}  "
+              f"elo {match.elo:+6.0f} [{low:+.0f}, {high:+.0f}]")
+        if match.deals:
+            low, high = match.duplicate_elo_range
+            print(f"{'duplicate':>37} {match.deals:6} deals  "
+                  f"win {100 * match.win_rate:5.1f}% ±{100 * match.duplicate_win_rate_interval:4.1f}  "
+                  f"ppg {match.ppg:+.3f} ±{match.duplicate_ppg_interval:.3f}  "
+                  f"elo {match.elo:+6.0f} [{low:+.0f}, {high:+.0f}]  "
+                  f"ppg variance {match.variance_reduction:.2f}x lower (as many times fewer games needed)")
+    print(f"\n{'player':>16} {'elo':>6} {'games':>6} {'ppg':>7}")
+    for name, rating in sorted(elo_ratings(names, stats).items(), key=lambda item: -item[1]):
+        player_games = sum(match.games for match in stats if name in (match.first, match.second))
+        player_points = sum(match.points if name == match.first else -match.points
+                            for match in stats if name in (match.first, match.second))
+        print(f"{name:>16} {rating:+6.0f} {player_games:6} {player_points / max(player_games, 1):+7.3f}")
+
+
+if __name__ == '__main__':
+    agents = [player_type for player_type in player_types if player_type != 'human']
+    parser = argparse.ArgumentParser(description="Play a tournament between agents across processes.")
+    parser.add_argument('players', help='The players, the first one is the gauntlet runner.', nargs='+',
+                        choices=agents, type=str)
+    parser.add_argument('--mode', choices=modes, default=modes[0], type=str)
+    parser.add_argument('--num_of_games', help='The number of games of every pairing.', default=100, type=int)
+    parser.add_argument('--n_processes', default=os.cpu_count(), type=int)
+    parser.add_argument('--seed', default=None, type=int)
+    parser.add_argument('--report_every', help='Print the progress every this number of games.', default=100,
+                        type=int)
+    parser.add_argument('--duplicate', help='Play every dice stream twice with the colors swapped.',
+                        action='store_true')
+    args = parser.parse_args()
+    assert len(set(args.players)) == len(args.players) >= 2, "A tournament needs two different players at least."
+    results, total_seconds = run(args.players, args.mode, args.num_of_games, args.n_processes, args.seed,
+                                 args.report_every, args.duplicate)
+    report(args.players, results, total_seconds)